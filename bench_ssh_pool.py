@@ -0,0 +1,66 @@
+import argparse
+import helpers
+from helpers import *
+from prettytable import PrettyTable
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("node", type=str, help="node to benchmark against (e.g. localhost with a local sshd, or user@host)")
+    parser.add_argument("--iters", "-i", type=int, default=50, help="number of round trips to time for each mode")
+    parser.add_argument("--cmd", type=str, default="true", help="command to run on the node for each round trip")
+    parser.add_argument("--ssh-opts", type=str, default=None, help="ssh options to use instead of the cloudlab key options")
+    parser.add_argument("--async-nodes", type=int, default=8, help="number of concurrent run_remote_async calls to time")
+    return parser.parse_args()
+
+def time_ssh(node, cmd, iters):
+    lats = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        run_ssh_cmd(node, cmd, stderr=False, check=True)
+        lats.append((time.perf_counter() - start) * 1000)
+    return lats
+
+def time_async(node, cmd, iters, n):
+    lats = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        outs = asyncio.run(run_remote_async([node] * n, cmd, print_stderr=False))
+        assert(all([o[2] == 0 for o in outs]))
+        lats.append((time.perf_counter() - start) * 1000)
+    return lats
+
+def bench(node, cmd, iters, n, pooled):
+    set_ssh_pool(pooled)
+    if pooled:
+        # the first call pays for the handshake - open it up front so only steady state is timed
+        assert(open_pool_conn(node))
+    lats = time_ssh(node, cmd, iters)
+    async_lats = time_async(node, cmd, max(iters // 5, 1), n)
+    if pooled:
+        close_pool([node])
+    return lats, async_lats
+
+def main():
+    args = parse_args()
+    if args.ssh_opts is not None:
+        helpers.NO_KEY = args.ssh_opts
+
+    print(f"timing {args.iters} round trips of '{args.cmd}' to {args.node}...", flush=True)
+    results = {}
+    for pooled in [False, True]:
+        mode = "pooled" if pooled else "unpooled"
+        print(f"running {mode}...", flush=True)
+        results[mode] = bench(args.node, args.cmd, args.iters, args.async_nodes, pooled)
+
+    x = PrettyTable()
+    x.field_names = ["Mode", "Call", "Mean (ms)", "p50 (ms)", "p99 (ms)", "Max (ms)"]
+    for mode, (lats, async_lats) in results.items():
+        for call, l in [("run_ssh_cmd", lats), (f"run_remote_async x{args.async_nodes}", async_lats)]:
+            l = np.array(l)
+            x.add_row([mode, call] + [round(v, 2) for v in [l.mean(), np.percentile(l, 50), np.percentile(l, 99), l.max()]])
+    print(x)
+    speedup = np.mean(results["unpooled"][0]) / np.mean(results["pooled"][0])
+    print(f"pooled speedup (run_ssh_cmd mean): {speedup:.1f}x", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,6 @@ from helpers import *
 import argparse
 from prettytable import PrettyTable
 import json
-from tqdm.contrib import tenumerate
 
 PS_FIELDS = ['ID', 'Names']
 SERVICE_PS_FIELDS = ['ID', 'Node', 'CurrentState']
@@ -22,24 +21,6 @@ def get_format(format):
     f = "".join(["{{."+p+"}}"+"," for p in format])
     return f[:-1]
 
-def get_service_ps(node, ids):
-    print("getting service ps information...", flush=True)
-    out = []
-    count = 0
-    format = get_format(SERVICE_PS_FIELDS)
-    # loop through all service IDs given
-    for i, id in tenumerate(ids):
-        # get the output of the ps command (get the service info)
-        ps_out = run_ssh_cmd(node, f"sudo docker service ps --format '{format}' --filter 'desired-state=Running' {id}", True)
-        
-        # loop through the tasks for this service
-        for p in ps_out.split("\n"):
-            p = p.strip()
-            if p:
-                out.append(f"{count},{p}")
-        count += 1
-    return out
-
 def get_ps(node):
     format = get_format(PS_FIELDS)
     ps_out = run_ssh_cmd(node, f"sudo docker ps --format '{format}'", stderr=True)
@@ -65,71 +46,101 @@ def get_node_ls(node):
     nls = f"sudo docker node ls --format '{format}'"
     return run_ssh_cmd(node, nls, False)
 
-def get_constraints(node, ids):
-    print("getting service constraints...", flush=True)
-    def convert_nano_cpus(nano_cpus):
-        if nano_cpus is None:
-            return None
-        return int(nano_cpus) / 1e9
-    
-    # (node label, CPU, memory)
-    outs = []
-    for i, id in tenumerate(ids):
-        inspect_out = run_ssh_cmd(node, f"sudo docker service inspect {id}", False)
-        inspect_out = json.loads(inspect_out)[0]
-        resources = finditem(inspect_out, "Resources")
-        cpu_lim, mem_lim, cpu_res, mem_res = None, None, None, None
-        if "Limits" in resources:
-            limits = resources["Limits"]
-            cpu_lim = convert_nano_cpus(finditem(limits, "NanoCPUs"))
-            mem_lim = finditem(limits, "MemoryBytes")
-        if "Reservations" in resources:
-            reservations = resources["Reservations"]
-            cpu_res = convert_nano_cpus(finditem(reservations, "NanoCPUs"))
-            mem_res = finditem(reservations, "MemoryBytes")
-        outs.append([finditem(inspect_out, "Constraints"), cpu_lim, mem_lim, cpu_res, mem_res])
-    return outs
+def convert_nano_cpus(nano_cpus):
+    if nano_cpus is None:
+        return None
+    return int(nano_cpus) / 1e9
+
+def get_inspect_constraints(inspect_out):
+    # [node label, CPU limit, memory limit, CPU reservation, memory reservation] of an inspected service
+    resources = finditem(inspect_out, "Resources")
+    cpu_lim, mem_lim, cpu_res, mem_res = None, None, None, None
+    if "Limits" in resources:
+        limits = resources["Limits"]
+        cpu_lim = convert_nano_cpus(finditem(limits, "NanoCPUs"))
+        mem_lim = finditem(limits, "MemoryBytes")
+    if "Reservations" in resources:
+        reservations = resources["Reservations"]
+        cpu_res = convert_nano_cpus(finditem(reservations, "NanoCPUs"))
+        mem_res = finditem(reservations, "MemoryBytes")
+    return [finditem(inspect_out, "Constraints"), cpu_lim, mem_lim, cpu_res, mem_res]
 
 def get_node_ids(node):
     nls_out = get_node_ls(node)
     return parse_out(nls_out, ind=0)
 
-def get_service_nodes(node):
-    dls_out = get_service_ls(node)
-    service_ids = parse_out(dls_out, ind=0)
-    service_names = parse_out(dls_out, ind=1)
-    ps_outs = get_service_ps(node, service_ids)
+def get_node_num(hostname):
+    # nodes are named node<i>.<experiment>... so take i from the hostname
+    return int(hostname.split(".")[0].strip("node"))
+
+def get_cluster_state(node):
+    # snapshot of all services, their running tasks and the swarm nodes, in one round trip (one multi-ID
+    # inspect and one multi-ID ps for every service)
+    print("getting cluster state...", flush=True)
+    cmds = ["sudo docker service ls -q | xargs -r sudo docker service inspect",
+            "sudo docker service ls -q | xargs -r sudo docker service ps --filter 'desired-state=Running' --format '{{json .}}'",
+            "sudo docker node ls --format '{{json .}}'"]
+    inspect_out, ps_out, node_out = [r.stdout for r in run_batched({node: cmds}, print_stderr=False)[node]]
+    
+    state = {"services": [], "by_name": {}, "by_id": {}, "nodes": []}
+    for inspect in json.loads(inspect_out) if inspect_out else []:
+        service = {"id": inspect["ID"][:12], 
+                   "name": inspect["Spec"]["Name"], 
+                   "constraints": get_inspect_constraints(inspect),
+                   "tasks": []}
+        state["services"].append(service)
+        state["by_name"][service["name"]] = service
+        state["by_id"][service["id"]] = service
+    
+    # tasks are named <service name>.<slot> - index them under their service
+    for line in ps_out.split("\n"):
+        if not line.strip():
+            continue
+        task = json.loads(line)
+        name, slot = task["Name"].rsplit(".", 1)
+        service = state["by_name"].get(name)
+        if service is None:
+            continue
+        service["tasks"].append({"id": task["ID"], "slot": slot, "node": task["Node"], "node_num": get_node_num(task["Node"]),
+                                 "state": task["CurrentState"]})
+    
+    for line in node_out.split("\n"):
+        if line.strip():
+            n = json.loads(line)
+            state["nodes"].append({"id": n["ID"], "hostname": n["Hostname"], "status": n["Status"]})
+    return state
+
+def get_service_nodes(node, state=None):
+    if state is None:
+        state = get_cluster_state(node)
     service_dict = {}
-    for i in range(len(ps_outs)):
-        row = ps_outs[i].split(",")
-        service_num = int(row[0])
-        # match the service name to the service number
-        service_dict[service_names[service_num]] = int(row[2].split(".")[0].strip("node"))
+    for service in state["services"]:
+        # match the service name to the node of its (last) task
+        for task in service["tasks"]:
+            service_dict[service["name"]] = task["node_num"]
     return service_dict
 
-def print_table(master_node):
-    dls_out = get_service_ls(master_node)
-    service_ids = parse_out(dls_out, ind=0)
-    constraints = get_constraints(master_node, service_ids)
-    service_names = parse_out(dls_out, ind=1)
-    ps_outs = get_service_ps(master_node, service_ids)
+def get_service_tasks(node, state=None):
+    # (slot, node number) of every running task (replica) of each service
+    if state is None:
+        state = get_cluster_state(node)
+    return {service["name"]: sorted([(task["slot"], task["node_num"]) for task in service["tasks"]]) 
+            for service in state["services"]}
+
+def print_table(master_node, state=None):
+    if state is None:
+        state = get_cluster_state(master_node)
     
     x = PrettyTable()
     x.field_names = ["Service #", "Service ID", "Service Name", "Task #"] + SERVICE_PS_FIELDS + ["Constraints", "CPULim", "MemLim", "CPURes", "MemRes"]
-    for i in range(len(ps_outs)):
-        # get the row information provided from ps
-        row = ps_outs[i].split(",")
-        
-        # service information
-        row[2] = row[2].split(".")[0].strip("node") # get the node ID from Node
-        service_num = int(row[0]) # service number
-        
-        # task information
-        row.insert(1, i) # task number
-        row.insert(1, service_names[service_num].replace(f"{get_current_service_name()}_", "")) # task's service name
-        row.insert(1, service_ids[service_num]) # task's service ID
-        row += constraints[service_num] # constraints
-        x.add_row(row)
+    task_num = 0
+    for service_num, service in enumerate(state["services"]):
+        for task in service["tasks"]:
+            row = [service_num, service["id"], service["name"].replace(f"{get_current_service_name()}_", ""), task_num,
+                   task["id"], task["node_num"], task["state"]]
+            row += service["constraints"]
+            x.add_row(row)
+            task_num += 1
         
     print(x)
     return x
@@ -1,5 +1,10 @@
 import subprocess
 import asyncio
+import os
+import signal
+import fcntl
+from collections import namedtuple
+from contextlib import contextmanager
 from os.path import exists
 from pathlib import Path
 import time
@@ -10,6 +15,76 @@ import numpy as np
 NO_KEY = "-i ~/.ssh/cloudlab -o \"StrictHostKeyChecking no\""
 CONFIG_JSON_PATH = "config.json"
 
+# ssh connection pool: every ssh/scp call to a node is multiplexed over one long-lived master
+# connection (OpenSSH ControlMaster), so only the first call pays for the TCP + key exchange
+SSH_POOL = True
+SSH_POOL_DIR = "~/.ssh/sockets"
+SSH_POOL_IDLE = 600     # seconds a master connection stays open with no sessions (idle eviction)
+SSH_CONN_ERROR = 255    # exit code ssh uses when the connection itself failed
+
+# limits for the remote executor (run_remote_async)
+MAX_CONCURRENCY = 16    # max remote commands in flight at once
+MAX_PER_NODE = 4        # max remote commands in flight to a single node
+TIMEOUT_RC = 124        # exit code given to a command that hit its deadline (same as coreutils timeout)
+
+# result of running a command on a node - the first 3 fields match the old (stdout, stderr, rc) tuples
+RemoteResult = namedtuple("RemoteResult", ["stdout", "stderr", "rc", "node", "cmd", "elapsed", "attempts", "timed_out"])
+
+def set_ssh_pool(enabled=True, idle=None):
+    global SSH_POOL, SSH_POOL_IDLE
+    SSH_POOL = enabled
+    if idle is not None:
+        SSH_POOL_IDLE = idle
+
+def get_pool_opts():
+    if not SSH_POOL:
+        return ""
+    # make sure the directory for the control sockets exists (%C is a hash of the connection)
+    Path(SSH_POOL_DIR).expanduser().mkdir(parents=True, exist_ok=True)
+    return f"-o ControlMaster=auto -o ControlPath={SSH_POOL_DIR}/%C -o ControlPersist={SSH_POOL_IDLE}"
+
+def get_ssh_opts():
+    pool_opts = get_pool_opts()
+    return f"{NO_KEY} {pool_opts}" if pool_opts else NO_KEY
+
+def get_pool_ctl_cmd(node, op):
+    # op is one of the ssh -O control commands: check, exit, stop
+    return f"ssh {get_ssh_opts()} -O {op} {node}"
+
+def check_pool_conn(node):
+    if not SSH_POOL:
+        return False
+    cp = subprocess.run(get_pool_ctl_cmd(node, "check"), shell=True, capture_output=True)
+    return cp.returncode == 0
+
+def open_pool_conn(node):
+    # start the master connection in the background if there isn't one already
+    if not SSH_POOL or check_pool_conn(node):
+        return True
+    cp = subprocess.run(f"ssh {get_ssh_opts()} -M -N -f {node}", shell=True, capture_output=True)
+    return cp.returncode == 0
+
+def reset_pool_conn(node):
+    # tear down a (possibly stale) master connection so the next call reconnects
+    if not SSH_POOL:
+        return
+    print(f"resetting ssh connection to {node}...", flush=True)
+    subprocess.run(get_pool_ctl_cmd(node, "exit"), shell=True, capture_output=True)
+
+async def reset_pool_conn_async(node):
+    # same as reset_pool_conn, without blocking the event loop (for use inside coroutines)
+    if not SSH_POOL:
+        return
+    print(f"resetting ssh connection to {node}...", flush=True)
+    proc = await asyncio.create_subprocess_shell(get_pool_ctl_cmd(node, "exit"), stdout=asyncio.subprocess.DEVNULL,
+                                                 stderr=asyncio.subprocess.DEVNULL)
+    await proc.wait()
+
+def close_pool(nodes):
+    for node in nodes:
+        if check_pool_conn(node):
+            subprocess.run(get_pool_ctl_cmd(node, "exit"), shell=True, capture_output=True)
+
 def get_datetime(compact=True):
     if not compact:
         return time.strftime("%d-%m-%Y_%H:%M:%S", time.localtime())
@@ -26,13 +101,19 @@ def finditem(obj, key):
 def get_ssh_cmd(node, cmd, background=False, cd="~"):
     if background:
         # run command in background with nohup and redirect stdout and stderr to /dev/null and return pid
-        return f"ssh {NO_KEY} {node} \"cd {cd}; sh -c 'nohup {cmd} > /dev/null 2>&1 &'\""
-    return f"ssh {NO_KEY} {node} \"cd {cd}; {cmd}\""
+        return f"ssh {get_ssh_opts()} {node} \"cd {cd}; sh -c 'nohup {cmd} > /dev/null 2>&1 &'\""
+    return f"ssh {get_ssh_opts()} {node} \"cd {cd}; {cmd}\""
+
+def run_pooled(cmd, node):
+    cp = subprocess.run(cmd, shell=True, capture_output=True)
+    # if the (pooled) connection failed, drop the master connection and reconnect once
+    if cp.returncode == SSH_CONN_ERROR and SSH_POOL:
+        reset_pool_conn(node)
+        cp = subprocess.run(cmd, shell=True, capture_output=True)
+    return cp
 
 def run_ssh_cmd(node, cmd, stderr=True, background=False, cd="~", check=False):
-    cp = subprocess.run(get_ssh_cmd(node, cmd, background=background, cd=cd), 
-                        shell=True, 
-                        capture_output=True)
+    cp = run_pooled(get_ssh_cmd(node, cmd, background=background, cd=cd), node)
     # only print if non-zero exit code or if stderr is True
     if stderr or cp.returncode != 0:
         stderr_out = cp.stderr.decode().strip().strip("\n")
@@ -45,16 +126,14 @@ def run_ssh_cmd(node, cmd, stderr=True, background=False, cd="~", check=False):
 def get_scp_cmd(node, to_cpy, path="~/", exec=False):
     to_cpy = find_file(to_cpy, script=True)
     assert(exists(to_cpy))
-    cmd = f"scp {NO_KEY} {to_cpy} {node}:{path}"
+    cmd = f"scp {get_ssh_opts()} {to_cpy} {node}:{path}"
     file_name = Path(to_cpy).name
     if exec:
         cmd += " && " + get_ssh_cmd(node, f"sudo chmod +x {path}{file_name}")
     return cmd
 
 def run_scp_cmd(node, to_cpy, path="~/", stderr=True, check=False, exec=False):
-    cp = subprocess.run(get_scp_cmd(node, to_cpy, path=path, exec=exec), 
-                        shell=True, 
-                        capture_output=True)
+    cp = run_pooled(get_scp_cmd(node, to_cpy, path=path, exec=exec), node)
     if stderr or check:
         stderr_out = cp.stderr.decode("utf-8").strip()
         if stderr_out and stderr_out != "\n":
@@ -63,31 +142,143 @@ def run_scp_cmd(node, to_cpy, path="~/", stderr=True, check=False, exec=False):
         cp.check_returncode()
     return cp.stdout.decode("utf-8").strip()
 
-async def run(cmd, print_stderr=True):
-    proc = await asyncio.create_subprocess_shell(
-        cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE)
+def kill_proc(proc):
+    # kill the whole process group (the shell and the ssh/scp it started)
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+async def run(cmd, print_stderr=True, node=None, timeout=None, retries=1, backoff=0.5, input=None):
+    start = time.perf_counter()
+    attempts = 0
+    while True:
+        attempts += 1
+        proc = await asyncio.create_subprocess_shell(
+            cmd,
+            stdin=asyncio.subprocess.PIPE if input is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True)
+
+        timed_out = False
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(input.encode() if input is not None else None), timeout)
+        except asyncio.TimeoutError:
+            # hung command/node - kill it so it doesn't stall everything else
+            timed_out = True
+            kill_proc(proc)
+            await proc.wait()
+            stdout, stderr = b"", f"timed out after {timeout} seconds".encode()
+        rc = TIMEOUT_RC if timed_out else proc.returncode
 
-    stdout, stderr = await proc.communicate()
+        # only retry transient (connection) errors, not failed or timed out commands
+        if rc != SSH_CONN_ERROR or attempts > retries:
+            break
+        # if the (pooled) connection failed, drop the master connection so the retry reconnects
+        if SSH_POOL and node is not None:
+            await reset_pool_conn_async(node)
+        delay = backoff * 2 ** (attempts - 1)
+        print(f"[{cmd!r} failed to connect, retrying in {delay} seconds]", flush=True)
+        await asyncio.sleep(delay)
     stdout = stdout.decode().strip()
     stderr = stderr.decode().strip()
+    elapsed = time.perf_counter() - start
 
-    print(f'[{cmd!r} exited with {proc.returncode}]', flush=True)
+    print(f'[{cmd!r} exited with {rc} in {elapsed:.2f}s]', flush=True)
     if stderr and print_stderr:
         print(f'[stderr]\n{stderr}', flush=True)
-    return stdout, stderr, proc.returncode
+    return RemoteResult(stdout, stderr, rc, node, cmd, elapsed, attempts, timed_out)
         
+async def run_stream(cmd, on_line, print_stderr=True, node=None, timeout=None, input=None):
+    # run a command, passing each line of stdout to on_line as soon as it arrives
+    start = time.perf_counter()
+    proc = await asyncio.create_subprocess_shell(
+        cmd,
+        stdin=asyncio.subprocess.PIPE if input is not None else None,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True)
+    if input is not None:
+        proc.stdin.write(input.encode())
+        proc.stdin.close()
+
+    lines = []
+    async def read_lines():
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                break
+            line = line.decode().rstrip("\n")
+            lines.append(line)
+            on_line(line)
+
+    stderr_task = asyncio.ensure_future(proc.stderr.read())
+    timed_out = False
+    try:
+        await asyncio.wait_for(read_lines(), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        kill_proc(proc)
+    stderr = (await stderr_task).decode().strip()
+    await proc.wait()
+    rc = TIMEOUT_RC if timed_out else proc.returncode
+    elapsed = time.perf_counter() - start
+
+    print(f'[{cmd!r} exited with {rc} in {elapsed:.2f}s]', flush=True)
+    if stderr and print_stderr:
+        print(f'[stderr]\n{stderr}', flush=True)
+    return RemoteResult("\n".join(lines).strip(), stderr, rc, node, cmd, elapsed, 1, timed_out)
+
 def get_scp_cmds(nodes, to_cpy, exec=False, path="~/"):
     print(f"copying '{to_cpy}' to node(s)...", flush=True)
     return [get_scp_cmd(node, to_cpy, path=path, exec=exec) for node in nodes]
 
+def get_scp_from_cmd(node, remote_path, local_path):
+    # copy a file from the node
+    return f"scp {get_ssh_opts()} {node}:{remote_path} {local_path}"
+
+async def fetch_remote_async(nodes, remote_path, local_paths, print_stderr=True, check=False, 
+                             max_concurrency=MAX_CONCURRENCY, timeout=None, retries=1):
+    # copy the same file from every node (each to its own local path) at the same time
+    assert(len(nodes) == len(local_paths))
+    print(f"copying '{remote_path}' from node(s)...", flush=True)
+    cmds = [get_scp_from_cmd(node, remote_path, path) for node, path in zip(nodes, local_paths)]
+    output = await run_bounded(nodes, cmds, print_stderr=print_stderr, max_concurrency=max_concurrency,
+                               timeout=timeout, retries=retries)
+    if check:
+        for o in failed_results(output):
+            print(f"Error copying from node {o.node}: {o.stderr}", flush=True)
+    return output
+
 def get_ssh_cmds(nodes, cmd, background=False, cd="~"):
     print(f"running '{cmd}' on node(s)...", flush=True)
     return [get_ssh_cmd(node, cmd, background=background, cd=cd) for node in nodes]
         
+async def run_bounded(nodes, cmds, print_stderr=True, max_concurrency=MAX_CONCURRENCY, 
+                      max_per_node=MAX_PER_NODE, timeout=None, retries=1, backoff=0.5, inputs=None):
+    # cap the number of commands in flight, both in total and for each node
+    global_sem = asyncio.Semaphore(max_concurrency)
+    node_sems = {node: asyncio.Semaphore(max_per_node) for node in set(nodes)}
+    if inputs is None:
+        inputs = [None] * len(cmds)
+    assert(len(inputs) == len(cmds))
+
+    async def run_one(node, cmd, input):
+        async with node_sems[node]:
+            async with global_sem:
+                return await run(cmd, print_stderr=print_stderr, node=node, timeout=timeout, 
+                                 retries=retries, backoff=backoff, input=input)
+
+    return await asyncio.gather(*[run_one(node, cmd, input) for node, cmd, input in zip(nodes, cmds, inputs)])
+
+def failed_results(output):
+    return [o for o in output if o.rc != 0]
+
 async def run_remote_async(nodes, cmd, scp=False, print_stderr=True, background=False, 
-                           cd="~", cmd_list=False, exec=False, path="~/", check=False):
+                           cd="~", cmd_list=False, exec=False, path="~/", check=False,
+                           max_concurrency=MAX_CONCURRENCY, max_per_node=MAX_PER_NODE, 
+                           timeout=None, retries=1, backoff=0.5):
     if cmd_list:
         assert(isinstance(cmd, list))
         assert(len(nodes) == len(cmd))
@@ -102,16 +293,83 @@ async def run_remote_async(nodes, cmd, scp=False, print_stderr=True, background=
         else:
             cmds = [get_ssh_cmd(node, cmd, background=background, cd=cd) for node, cmd in zip(nodes, cmd)]
     
-    output = await asyncio.gather(*[run(cmd, print_stderr=print_stderr) for cmd in cmds])
+    output = await run_bounded(nodes, cmds, print_stderr=print_stderr, max_concurrency=max_concurrency, 
+                               max_per_node=max_per_node, timeout=timeout, retries=retries, backoff=backoff)
 
     if check:
-        for o in output:
-            if o[2] != 0:
-                print(f"Error in node {nodes[output.index(o)]} with command {cmds[output.index(o)]}", flush=True)
-                print(f"Error: {o[1]}", flush=True)
+        failed = failed_results(output)
+        for o in failed:
+            print(f"Error in node {o.node} with command {o.cmd}", flush=True)
+            print(f"Error: {o.stderr}", flush=True)
+        if failed:
+            print(f"{len(failed)}/{len(output)} node(s) failed", flush=True)
     
     return output
         
+# marks the end of each command's output (and exit code) in a batch script
+BATCH_MARKER = "@@batch-end"
+
+def make_batch_script(cmds):
+    lines = []
+    for i, cmd in enumerate(cmds):
+        # run each command in a subshell (so an exit doesn't end the batch, and it can't read the rest of 
+        # the script from stdin), then mark the end of its stdout and stderr with its number and exit code
+        lines.append(f"( {cmd}\n) < /dev/null")
+        marker = f"printf '\\n{BATCH_MARKER} {i} %d\\n' $rc"
+        lines.append(f"rc=$?; {marker}; {marker} >&2")
+    return "\n".join(lines) + "\n"
+
+def split_batch_output(out, n):
+    # split the output of a batch script back into the output (and exit code) of each command
+    outs = [""] * n
+    rcs = [None] * n
+    curr = []
+    for line in out.split("\n"):
+        if line.startswith(f"{BATCH_MARKER} "):
+            _, i, rc = line.split()
+            outs[int(i)] = "\n".join(curr).strip()
+            rcs[int(i)] = int(rc)
+            curr = []
+        else:
+            curr.append(line)
+    return outs, rcs
+
+async def run_batched_async(node_cmds, print_stderr=True, cd="~", check=False, timeout=None, 
+                            max_concurrency=MAX_CONCURRENCY, retries=1, backoff=0.5):
+    # node_cmds is a dict of node -> list of commands; all the commands for a node are sent as one 
+    # script (one round trip per node) and all nodes are run in parallel
+    nodes = [node for node in node_cmds if node_cmds[node]]
+    print(f"running {sum([len(node_cmds[n]) for n in nodes])} batched command(s) on {len(nodes)} node(s)...", flush=True)
+    cmds = [get_ssh_cmd(node, "bash -s", cd=cd) for node in nodes]
+    scripts = [make_batch_script(node_cmds[node]) for node in nodes]
+    output = await run_bounded(nodes, cmds, print_stderr=False, max_concurrency=max_concurrency, timeout=timeout, 
+                               retries=retries, backoff=backoff, inputs=scripts)
+    
+    # demultiplex the output back into a result per command (in the same order as given)
+    results = {node: [] for node in node_cmds}
+    for node, o in zip(nodes, output):
+        n = len(node_cmds[node])
+        outs, rcs = split_batch_output(o.stdout, n)
+        errs, _ = split_batch_output(o.stderr, n)
+        for i in range(n):
+            # if the batch itself failed before getting to this command, use the batch's exit code
+            rc = rcs[i] if rcs[i] is not None else (o.rc if o.rc != 0 else -1)
+            err = errs[i] if rcs[i] is not None else o.stderr
+            results[node].append(RemoteResult(outs[i], err, rc, node, node_cmds[node][i], o.elapsed, o.attempts, o.timed_out))
+            if err and (print_stderr or rc != 0):
+                print(f'[stderr from {node_cmds[node][i]!r}]\n{err}', flush=True)
+    
+    if check:
+        failed = [r for node in nodes for r in failed_results(results[node])]
+        for r in failed:
+            print(f"Error in node {r.node} with command {r.cmd}", flush=True)
+        if failed:
+            print(f"{len(failed)}/{sum([len(results[n]) for n in nodes])} batched command(s) failed", flush=True)
+    return results
+
+def run_batched(node_cmds, print_stderr=True, cd="~", check=False, timeout=None):
+    return asyncio.run(run_batched_async(node_cmds, print_stderr=print_stderr, cd=cd, check=check, timeout=timeout))
+
 def parse_ssh_file(ssh_file):
     nodes = []
     ssh_commands = []
@@ -130,7 +388,9 @@ def file_exists(file):
     return exists(file)
 
 def get_core_counts(nodes):
-    return [int(run_ssh_cmd(node, "sudo nproc").strip()) for node in nodes]
+    # imported here since inventory imports everything from helpers
+    from inventory import get_inventory
+    return [entry["nproc"] for entry in get_inventory(nodes)]
 
 def open_path(path, file=False, make_new=False):
     p = Path(path)
@@ -234,6 +494,23 @@ def update_json(file, config):
     with open(file, "w") as f:
         json.dump(config, f, indent=4, separators=(", ", ": "))
 
+@contextmanager
+def file_lock(file):
+    # exclusive lock (on <file>.lock) for a read-modify-write of a file shared by processes running 
+    # at the same time, e.g. the run_setup.py of every partition started by scheduler.py
+    with open(f"{file}.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def replace_json(file, config):
+    # write to a temp file and rename, so readers never see a half written file
+    tmp = f"{file}.{os.getpid()}.tmp"
+    update_json(tmp, config)
+    os.replace(tmp, file)
+
 #return service config if service_name matches existing service names
 def find_service(service_name):
     config = load_json(CONFIG_JSON_PATH)
@@ -243,14 +520,19 @@ def find_service(service_name):
     return None
 
 def update_current_service(service_name):
-    config = load_json(CONFIG_JSON_PATH)
-    config["current_service"] = service_name
-    update_json(CONFIG_JSON_PATH, config)
+    with file_lock(CONFIG_JSON_PATH):
+        config = load_json(CONFIG_JSON_PATH)
+        config["current_service"] = service_name
+        replace_json(CONFIG_JSON_PATH, config)
 
 def get_current_service_name():
     config = load_json(CONFIG_JSON_PATH)
     return config["current_service"]
 
+def get_service_name(container_name):
+    # service of a swarm container, without the stack: socialNetwork_compose-post-service.1.xyz -> compose-post-service
+    return container_name.split(".")[0].split("_", 1)[-1]
+
 def get_current_service_workloads():
     return find_service(get_current_service_name())["service_workloads"]
 
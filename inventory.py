@@ -0,0 +1,208 @@
+from helpers import *
+import argparse
+import socket
+from prettytable import PrettyTable
+
+INVENTORY_FILE = "outputs/inventory.json"
+BOOT_ID_CMD = "cat /proc/sys/kernel/random/boot_id"
+# commands run on every node (all in one batch per node) to build its inventory entry
+PROBES = {
+    "hostname": "hostname",
+    "boot_id": BOOT_ID_CMD,
+    "likwid": "sudo likwid-topology -O",
+    "lscpu": "sudo lscpu",
+    "cpu_map": "lscpu -p=CPU,CORE,SOCKET,NODE",
+    "nproc": "sudo nproc",
+    "meminfo": "grep MemTotal /proc/meminfo",
+    "ips": "hostname -I",
+    "kernel": "uname -r",
+    "docker": "sudo docker version --format '{{.Server.Version}}'",
+}
+# nodes whose cached entry has already been checked against their boot id (or probed) by this process - 
+# it's only checked once per process (a node rebooting in the middle of a run breaks the run anyway)
+VALIDATED = set()
+# probes a node's entry can't be built without (the rest fall back to defaults)
+REQUIRED_PROBES = ["hostname", "boot_id", "likwid", "lscpu", "cpu_map"]
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("ssh_comms", metavar="ssh-comms", type=str, help="text file with ssh commands line by line")
+    parser.add_argument("--refresh", "-r", action="store_true", help="re-probe all nodes instead of using the cache")
+    return parser.parse_args()
+
+def parse_likwid_topology(out):
+    # parse the output of likwid-topology -O into the cpus on each socket and the hardware thread table
+    lines = out.split("\n")
+
+    table_start = False
+    header = False
+    headers = ""
+    table = []
+    for line in lines:
+        line = line.strip()
+
+        if table_start and line.startswith("STRUCT"):
+            break
+        if line.startswith("TABLE"):
+            table_start = True
+            header = True
+            continue
+        elif header:
+            headers = line.strip(",").split(",")
+            header = False
+        elif table_start:
+            data = line.strip(",").split(",")
+            table.append({headers[i]: data[i] for i in range(len(headers))})
+
+    socket_lines = [line.strip() for line in lines if line.startswith("Socket ")]
+    socket_cpus = [sl.split(":,")[1].strip().split(",") for sl in socket_lines]
+    return socket_cpus, table
+
+def parse_numa(lscpu_out):
+    # list of cpus (as given by lscpu, e.g. "0-15") for each NUMA node
+    lines = lscpu_out.split("\n")
+    lines = [line for line in lines if line.startswith("NUMA node") and "CPU(s)" in line]
+    return [line.strip().split()[3].split(",") for line in lines]
+
+def parse_cpu_list(cpu_list):
+    # expand a list of cpu ranges (e.g. ["0-3", "8"]) into a list of cpu numbers
+    cpus = []
+    for r in cpu_list:
+        if "-" in r:
+            start, stop = r.split("-")
+            cpus += list(range(int(start), int(stop) + 1))
+        elif r:
+            cpus.append(int(r))
+    return cpus
+
+def parse_cpu_map(out):
+    # one dict per hardware thread from lscpu -p=CPU,CORE,SOCKET,NODE
+    cpu_map = []
+    for line in out.split("\n"):
+        if not line.strip() or line.startswith("#"):
+            continue
+        cpu, core, sock, numa = (line.split(",") + [""] * 4)[:4]
+        cpu_map.append({"CPU": int(cpu), "Core": int(core), "Socket": int(sock),
+                        "NUMA": int(numa) if numa else int(sock)})
+    return cpu_map
+
+def get_smt_siblings(cpu_map):
+    # list of hardware threads on each physical core, keyed by "socket,core"
+    siblings = {}
+    for c in cpu_map:
+        siblings.setdefault(f"{c['Socket']},{c['Core']}", []).append(c["CPU"])
+    return siblings
+
+def parse_probes(node, outs):
+    # build an inventory entry from the (stdout) outputs of the probes
+    entry = {"node": node, "probed": get_datetime(compact=False)}
+    entry["hostname"] = outs["hostname"]
+    entry["boot_id"] = outs["boot_id"]
+    # keep the raw topology output too, so it can be re-parsed offline
+    entry["likwid"] = outs["likwid"]
+    entry["lscpu"] = outs["lscpu"]
+    entry["socket_cpus"], entry["topology"] = parse_likwid_topology(outs["likwid"])
+    entry["numa"] = parse_numa(outs["lscpu"])
+    entry["cpu_map"] = parse_cpu_map(outs["cpu_map"])
+    entry["smt_siblings"] = get_smt_siblings(entry["cpu_map"])
+    entry["nproc"] = int(outs["nproc"]) if outs["nproc"].isdigit() else len(entry["cpu_map"])
+    mem = outs["meminfo"].split()
+    entry["mem_bytes"] = int(mem[1]) * 1024 if len(mem) >= 2 else None
+    entry["ips"] = outs["ips"].split()
+    entry["kernel"] = outs["kernel"]
+    entry["docker"] = outs["docker"]
+    return entry
+
+def get_key(hostname, boot_id):
+    return f"{hostname}/{boot_id}"
+
+def load_inventory(file=INVENTORY_FILE):
+    if not file_exists(file):
+        return {"nodes": {}, "entries": {}}
+    return load_json(file)
+
+def save_inventory(entries, file=INVENTORY_FILE):
+    # merge the new entries (node -> entry) into the cache - under a lock and re-reading the cache first,
+    # so processes probing at the same time (e.g. one per partition) don't drop each other's entries
+    open_path(file, file=True)
+    with file_lock(file):
+        inventory = load_inventory(file)
+        for node, entry in entries.items():
+            key = get_key(entry["hostname"], entry["boot_id"])
+            inventory["entries"][key] = entry
+            inventory["nodes"][node] = key
+        # (temp file and rename, so a crash can't leave a half written cache)
+        replace_json(file, inventory)
+    return inventory
+
+def probe_nodes(nodes):
+    print(f"probing inventory of {len(nodes)} node(s)...", flush=True)
+    names = list(PROBES.keys())
+    results = run_batched({node: [PROBES[n] for n in names] for node in nodes}, print_stderr=False)
+    entries = {}
+    for node in nodes:
+        # don't build (and cache) an entry for a node that is unreachable or whose topology probes failed
+        failed = [n for n, r in zip(names, results[node]) if n in REQUIRED_PROBES and (r.rc != 0 or not r.stdout)]
+        if failed:
+            print(f"probing {node} failed ({', '.join(failed)}), not caching it", flush=True)
+            continue
+        outs = {n: r.stdout for n, r in zip(names, results[node])}
+        entries[node] = parse_probes(node, outs)
+    return entries
+
+def get_boot_ids(nodes):
+    # (hostname, boot id) of each node in one parallel round trip
+    outs = asyncio.run(run_remote_async(nodes, f"hostname; {BOOT_ID_CMD}", print_stderr=False))
+    # (None for a node that couldn't be reached, so it gets re-probed)
+    return {node: tuple(o.stdout.split()[:2]) if o.rc == 0 else None for node, o in zip(nodes, outs)}
+
+def get_inventory(nodes, refresh=False, file=INVENTORY_FILE):
+    # inventory entry for each node, from the cache (keyed by hostname and boot id) where possible
+    inventory = load_inventory(file)
+    keys = {node: inventory["nodes"].get(node) for node in nodes}
+    to_probe = [node for node in nodes if refresh or keys[node] not in inventory["entries"]]
+    # re-probe nodes that have rebooted (or are a different machine) since they were cached, 
+    # so a stale topology is never used for pinning (once per process, later reads skip the round trip)
+    cached = [node for node in nodes if node not in to_probe and node not in VALIDATED]
+    if cached:
+        boot_ids = get_boot_ids(cached)
+        stale = [node for node, b in boot_ids.items() if b is None or get_key(*b) != keys[node]]
+        to_probe += stale
+        VALIDATED.update([node for node in cached if node not in stale])
+
+    if to_probe:
+        entries = probe_nodes(to_probe)
+        if entries:
+            inventory = save_inventory(entries, file)
+            keys.update({node: inventory["nodes"][node] for node in entries})
+        failed = [node for node in to_probe if node not in entries]
+        VALIDATED.update(entries.keys())
+        if failed:
+            raise RuntimeError(f"couldn't probe the inventory of node(s): {failed}")
+    return [inventory["entries"][keys[node]] for node in nodes]
+
+def get_public_ip(node):
+    # resolve the node's hostname locally instead of asking an external echo service
+    host = node.split("@")[-1]
+    try:
+        return socket.gethostbyname(host)
+    except socket.gaierror:
+        return run_ssh_cmd(node, "sudo curl -s https://ipecho.net/plain").strip()
+
+def print_inventory(entries):
+    x = PrettyTable()
+    x.field_names = ["Node #", "Hostname", "Kernel", "Docker", "Sockets", "Cores", "Threads", "NUMA Nodes", "Memory (GB)", "IPs"]
+    for i, e in enumerate(entries):
+        mem = round(e["mem_bytes"] / 1024**3, 1) if e["mem_bytes"] else None
+        x.add_row([i, e["hostname"], e["kernel"], e["docker"], len(e["socket_cpus"]), len(e["smt_siblings"]),
+                   e["nproc"], len(e["numa"]), mem, " ".join(e["ips"])])
+    print(x)
+    return x
+
+def main():
+    args = parse_args()
+    nodes, _ = parse_ssh_file(args.ssh_comms)
+    print_inventory(get_inventory(nodes, refresh=args.refresh))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+from helpers import *
+import hashlib
+import os
+import sys
+
+# load points are journaled to outputs/<service>/journals/<name>.journal as they finish, so a crashed
+# sweep can be resumed. The journal is a stream of pickled records - a header with the fingerprint of
+# the configuration, then one record per finished load point.
+JOURNAL_DIR = "journals"
+
+def get_journal_path(name):
+    return f"outputs/{get_current_service_name()}/{JOURNAL_DIR}/{name}.journal"
+
+def get_fingerprint(config):
+    # short hash of the configuration (anything that changes the results of a load point)
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def get_config_diff(old, new):
+    # keys whose values differ between two configurations (compared the same way as the fingerprint)
+    def norm(v):
+        return json.dumps(v, sort_keys=True, default=str)
+    return sorted([k for k in set(old) | set(new) if k not in old or k not in new or norm(old[k]) != norm(new[k])])
+
+def get_file_hash(file):
+    # hash of a file's contents (e.g. a placement csv), so an edited file changes the fingerprint
+    if file is None or not file_exists(file):
+        return None
+    with open(file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+def read_journal(path):
+    # records in the journal, and the offset of the end of the last complete one
+    # (a crash in the middle of a write can leave a truncated record at the end)
+    records = []
+    end = 0
+    with open(path, "rb") as f:
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except EOFError:
+                break
+            except Exception as e:
+                print(f"journal {path} has a truncated/corrupt record at offset {end} ({e!r}), ignoring the rest", flush=True)
+                break
+            end = f.tell()
+    if end < os.path.getsize(path):
+        print(f"dropping {os.path.getsize(path) - end} byte(s) at the end of journal {path}", flush=True)
+    return records, end
+
+def append_record(journal, record):
+    # write the whole record at once and make sure it's on disk before moving on
+    journal.write(pickle.dumps(record))
+    journal.flush()
+    os.fsync(journal.fileno())
+
+def open_journal(name, config, resume=False):
+    # open the journal for appending - returns the open file and the load points already done
+    # (load -> (out, stats)) if resuming a journal with the same configuration fingerprint
+    path = get_journal_path(name)
+    fingerprint = get_fingerprint(config)
+    done = {}
+    if resume and file_exists(path):
+        records, end = read_journal(path)
+        if not records or records[0]["type"] != "header":
+            sys.exit(f"can't resume: journal {path} has no header")
+        if records[0]["fingerprint"] != fingerprint:
+            old = records[0]["config"]
+            diff = get_config_diff(old, config)
+            for k in diff:
+                print(f"  {k}: journal {old.get(k, '<missing>')!r}, now {config.get(k, '<missing>')!r}", flush=True)
+            sys.exit(f"can't resume: journal {path} is for a different configuration "
+                     f"({records[0]['fingerprint']} != {fingerprint}), differing in: {', '.join(diff)}")
+        for r in records[1:]:
+            if r["type"] == "point":
+                done[r["load"]] = (r["out"], r["stats"])
+        journal = open(path, "r+b")
+        journal.truncate(end)
+        journal.seek(end)
+        print(f"resuming journal {path}, {len(done)} load(s) already done: {sorted(done.keys())}", flush=True)
+        return journal, done
+
+    if file_exists(path):
+        # don't clobber a journal that wasn't resumed
+        old = f"{path}_{time.strftime('%Y%m%d-%H%M%S')}"
+        os.replace(path, old)
+        print(f"moved existing journal to {old}", flush=True)
+    open_path(path, file=True)
+    journal = open(path, "wb")
+    append_record(journal, {"type": "header", "fingerprint": fingerprint, "config": config,
+                            "started": get_datetime(compact=False)})
+    print(f"journaling load points to {path}", flush=True)
+    return journal, done
+
+def journal_point(journal, l, out, stats=None):
+    if journal is None:
+        return
+    append_record(journal, {"type": "point", "load": l, "out": out, "stats": stats})
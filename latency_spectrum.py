@@ -0,0 +1,153 @@
+import argparse
+import numpy as np
+
+# header of the full latency distribution printed by wrk2 with -L
+SPECTRUM_START = "Detailed Percentile spectrum"
+# compact, mergeable form of a spectrum - one row per latency value (in ms) with the number of requests
+# at that value (not the running total), and the percentile up to and including it
+SPECTRUM_DTYPE = np.dtype([("value", "f4"), ("percentile", "f4"), ("count", "u8")])
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pickle_files", metavar="pickle-files", type=str, nargs="+", help="load sweep pickle files (from run_workload.py)")
+    parser.add_argument("--percentiles", "-p", type=float, nargs="+", default=[50, 90, 99, 99.9], help="percentiles to print")
+    parser.add_argument("--diff", action="store_true", help="print the histogram difference of each file against the first (at matching loads)")
+    parser.add_argument("--bins", type=int, default=20, help="number of (log spaced) bins for --diff")
+    return parser.parse_args()
+
+def parse_spectrum(wrk_output):
+    # rows of (value in ms, percentile, total count) from the detailed percentile spectrum of wrk2
+    rows = []
+    started = False
+    for line in wrk_output.split("\n"):
+        line = line.strip()
+        if line.startswith(SPECTRUM_START):
+            started = True
+            continue
+        if not started:
+            continue
+        # end of the spectrum (summary lines start with #)
+        if line.startswith("#") or line.startswith("----"):
+            break
+        data = line.split()
+        # skip the column names and blank lines
+        if len(data) < 3 or not data[0][0].isdigit():
+            continue
+        rows.append((float(data[0]), float(data[1]), int(data[2])))
+    return np.array(rows, dtype=float).reshape(-1, 3)
+
+def spectrum_to_hist(spectrum):
+    # (values, counts) - the number of requests at each value of the spectrum
+    if len(spectrum) == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+    values = spectrum[:, 0]
+    counts = np.diff(spectrum[:, 2], prepend=0).astype(np.int64)
+    keep = counts > 0
+    return values[keep], counts[keep]
+
+def merge_hists(hists):
+    # add up the counts of histograms (e.g. from different clients) at each value
+    values = np.concatenate([h[0] for h in hists]) if hists else np.zeros(0)
+    counts = np.concatenate([h[1] for h in hists]) if hists else np.zeros(0, dtype=np.int64)
+    values, inverse = np.unique(values, return_inverse=True)
+    return values, np.bincount(inverse, weights=counts, minlength=len(values)).astype(np.int64)
+
+def hist_percentiles(values, counts, percentiles):
+    # value at each percentile - the lowest value with at least that fraction of requests at or below it
+    total = counts.sum()
+    if total == 0:
+        return [None for _ in percentiles]
+    cum = np.cumsum(counts)
+    idxs = [min(np.searchsorted(cum, np.ceil(p / 100 * total)), len(values) - 1) for p in percentiles]
+    return [float(values[i]) for i in idxs]
+
+def hist_stats(values, counts):
+    # [mean, stdev, max, % within one stdev] - same order as the wrk Latency line
+    total = counts.sum()
+    if total == 0:
+        return []
+    mean = float((values * counts).sum() / total)
+    std = float(np.sqrt((counts * (values - mean) ** 2).sum() / total))
+    within = counts[np.abs(values - mean) <= std].sum() / total * 100
+    return [mean, std, float(values.max()), float(within)]
+
+def make_spectrum(values, counts):
+    spectrum = np.zeros(len(values), dtype=SPECTRUM_DTYPE)
+    spectrum["value"] = values
+    spectrum["count"] = counts
+    total = counts.sum()
+    if total > 0:
+        spectrum["percentile"] = np.cumsum(counts) / total
+    return spectrum
+
+def get_hist(spectrum):
+    # wrk2 prints values to the microsecond, undo the float32 rounding
+    return np.round(spectrum["value"].astype(float), 3), spectrum["count"].astype(np.int64)
+
+def to_spectrum(wrk_output):
+    # compact spectrum of a wrk2 output (empty if it was run without -L)
+    return make_spectrum(*spectrum_to_hist(parse_spectrum(wrk_output)))
+
+def merge_spectra(spectra):
+    # spectrum of all the requests of several spectra (e.g. clients or repetitions)
+    return make_spectrum(*merge_hists([get_hist(s) for s in spectra]))
+
+def spectrum_percentiles(spectrum, percentiles):
+    return hist_percentiles(*get_hist(spectrum), percentiles)
+
+def spectrum_stats(spectrum):
+    return hist_stats(*get_hist(spectrum))
+
+def spectrum_cdf(spectrum, values=None):
+    # fraction of requests at or below each value (default: the values of the spectrum)
+    spec_values, counts = get_hist(spectrum)
+    total = counts.sum()
+    if values is None:
+        values = spec_values
+    if total == 0:
+        return values, np.zeros(len(values))
+    cum = np.concatenate([[0], np.cumsum(counts)])
+    return values, cum[np.searchsorted(spec_values, values, side="right")] / total
+
+def spectrum_diff(a, b, bins=20):
+    # difference (b - a) of the fraction of requests in each (log spaced) latency bin, over the range of both
+    va, ca = get_hist(a)
+    vb, cb = get_hist(b)
+    both = np.concatenate([va, vb])
+    both = both[both > 0]
+    if len(both) == 0:
+        return np.zeros(bins + 1), np.zeros(bins)
+    edges = np.geomspace(both.min(), both.max(), bins + 1)
+    edges[-1] = np.nextafter(edges[-1], np.inf)
+    # (values of 0 go in the first bin)
+    ha = np.histogram(np.maximum(va, edges[0]), bins=edges, weights=ca)[0] / max(ca.sum(), 1)
+    hb = np.histogram(np.maximum(vb, edges[0]), bins=edges, weights=cb)[0] / max(cb.sum(), 1)
+    return edges, hb - ha
+
+def get_load_spectra(data):
+    # load -> spectrum for the load points (from a load sweep pickle) that have one
+    return {d[0]: d[2]["spectrum"] for d in data if len(d) > 2 and "spectrum" in d[2] and len(d[2]["spectrum"])}
+
+def main():
+    # lazy import, plot.py pulls in matplotlib
+    from plot import extract_pickle_data
+    args = parse_args()
+    all_spectra = [get_load_spectra(d) for d in extract_pickle_data(args.pickle_files)]
+    for file, spectra in zip(args.pickle_files, all_spectra):
+        print(f"{file}:")
+        for load, spectrum in sorted(spectra.items()):
+            lats = spectrum_percentiles(spectrum, args.percentiles)
+            lats = ", ".join([f"p{p:g} = {l:.3f} ms" for p, l in zip(args.percentiles, lats)])
+            print(f"  load {load} ({spectrum['count'].sum()} requests): {lats}")
+
+    if args.diff:
+        for file, spectra in zip(args.pickle_files[1:], all_spectra[1:]):
+            print(f"{file} - {args.pickle_files[0]}:")
+            for load in sorted(set(spectra.keys()) & set(all_spectra[0].keys())):
+                edges, diff = spectrum_diff(all_spectra[0][load], spectra[load], bins=args.bins)
+                print(f"  load {load}:")
+                for lo, hi, d in zip(edges[:-1], edges[1:], diff):
+                    print(f"    {lo:10.3f} - {hi:10.3f} ms: {d*100:+.2f}%")
+
+if __name__ == "__main__":
+    main()
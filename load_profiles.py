@@ -0,0 +1,113 @@
+import argparse
+import math
+
+# time varying loads, run as back to back wrk2 windows of (rate, seconds):
+#   ramp R0 T1 R1 [T2 R2 ...]        - piecewise linear, from R0 to R1 over T1 seconds, then to R2 over T2, ...
+#                                      (a piece with the same rate at both ends holds it)
+#   burst BASE PEAK PERIOD ON SECS   - square wave, PEAK for the first ON seconds of every PERIOD, BASE otherwise
+#   trace FILE [SCALE]               - replay a trace file with a rate per second on each line (times SCALE)
+PROFILE_KINDS = ["ramp", "burst", "trace"]
+# the windows are not one continuous run - each is its own wrk2 run, so connections are reopened (with a short gap)
+# between them, and wrk2 spends about the first 10 seconds of every run calibrating (its latencies are only
+# recorded after that), so every window has to be well above that
+WRK2_CALIBRATION = 10
+MIN_WINDOW = 2 * WRK2_CALIBRATION
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("profile", type=str, nargs="+", help="load profile, e.g. ramp 500 60 4000 | burst 1000 4000 120 40 600 | trace rates.txt")
+    parser.add_argument("--window", type=int, default=30, help=f"max length of each window in seconds (at least {MIN_WINDOW})")
+    return parser.parse_args()
+
+def split_secs(secs, window):
+    # split secs into (almost) equal whole second pieces of at most window seconds
+    # (but no shorter than MIN_WINDOW, if secs is long enough for that)
+    n = max(1, min(math.ceil(secs / window), secs // MIN_WINDOW))
+    return [secs // n + (1 if i < secs % n else 0) for i in range(n)]
+
+def ramp_segments(points, window):
+    # points: [R0, T1, R1, T2, R2, ...]
+    assert(len(points) >= 3 and len(points) % 2 == 1)
+    segments = []
+    for i in range(0, len(points) - 2, 2):
+        r0, secs, r1 = points[i], int(points[i+1]), points[i+2]
+        assert(secs > 0)
+        t = 0
+        for s in split_secs(secs, window):
+            # rate at the middle of the piece
+            segments.append((r0 + (r1 - r0) * (t + s / 2) / secs, s))
+            t += s
+    return segments
+
+def burst_segments(base, peak, period, on, secs, window):
+    assert(0 < on < period and secs > 0)
+    segments = []
+    t = 0
+    while t < secs:
+        for rate, length in [(peak, on), (base, period - on)]:
+            length = min(length, secs - t)
+            if length <= 0:
+                break
+            segments += [(rate, s) for s in split_secs(length, window)]
+            t += length
+    return segments
+
+def read_trace(trace_file, scale=1.0):
+    # rate per second, one per line (ignoring blank lines and # comments)
+    rates = []
+    with open(trace_file, "r") as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if line:
+                rates.append(float(line) * scale)
+    assert(rates)
+    return rates
+
+def trace_segments(rates, window):
+    # mean rate over each window of the trace
+    segments = []
+    t = 0
+    for s in split_secs(len(rates), window):
+        segments.append((sum(rates[t:t+s]) / s, s))
+        t += s
+    return segments
+
+def get_segments(profile, window=30):
+    # (rate, seconds) windows of a profile given as a list of strings (kind and its parameters)
+    kind, params = profile[0], profile[1:]
+    assert(kind in PROFILE_KINDS and window >= MIN_WINDOW)
+    if kind == "ramp":
+        segments = ramp_segments([float(p) for p in params], window)
+    elif kind == "burst":
+        assert(len(params) == 5)
+        base, peak, period, on, secs = [float(p) for p in params]
+        segments = burst_segments(base, peak, int(period), int(on), int(secs), window)
+    else:
+        assert(1 <= len(params) <= 2)
+        scale = float(params[1]) if len(params) > 1 else 1.0
+        segments = trace_segments(read_trace(params[0], scale), window)
+    # a window too short to get past wrk2's calibration would measure (almost) nothing
+    short = [s for _, s in segments if s < MIN_WINDOW]
+    if short:
+        print(f"profile has window(s) of {sorted(set(short))} seconds, but wrk2 calibrates for the first "
+              f"{WRK2_CALIBRATION} seconds of each (windows need at least {MIN_WINDOW})", flush=True)
+        assert(False)
+    # wrk2 needs a whole, positive rate
+    return [(max(1, round(r)), s) for r, s in segments]
+
+def get_offered_rate(segments):
+    # mean offered rate over the whole profile
+    return sum([r * s for r, s in segments]) / sum([s for _, s in segments])
+
+def main():
+    args = parse_args()
+    segments = get_segments(args.profile, args.window)
+    t = 0
+    for rate, secs in segments:
+        print(f"{t:6d}s - {t+secs:6d}s: {rate} req/s")
+        t += secs
+    print(f"{len(segments)} window(s), {t} seconds, mean offered rate {get_offered_rate(segments):.0f} req/s")
+    print(f"(the latencies of each window only cover what is left of it after wrk2's {WRK2_CALIBRATION} second calibration)")
+
+if __name__ == "__main__":
+    main()
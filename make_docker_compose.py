@@ -25,26 +25,37 @@ def sort_csv_file(csv_file):
         writer.writerows(rows)
         
 
-def make_compose(csv_file, env_file, delimeter, nodes=[]):
+def get_compose_specs(csv_file, delimeter=",", nodes=[]):
+    # requested placement/cpus/memory for each service (by service name in the csv) 
     cores = []
     if nodes:
         cores = get_core_counts(nodes)
     print(f"reading from {csv_file}...", flush=True)
     csv_file = find_file(csv_file, env_csv=True)
     
-    with open(csv_file, 'r') as csv_file, open(env_file, 'w') as out_file:
+    specs = {}
+    with open(csv_file, 'r') as csv_file:
         csv_reader = csv.DictReader(csv_file, delimiter=delimeter)
         for row in csv_reader:
-            sn = row["ServiceName"].replace("-", "_")
             n = row["Node"]
             cpus = row["CPUs"]
-            mem = row["Memory"]
             if cores:
                 cpus = cores[int(n)]*float(cpus)
-            out_file.write(f"{sn}_placement=\"node.labels.node{n} == true\"\n")
-            out_file.write(f"{sn}_cpu=\"{cpus}\"\n")
-            out_file.write(f"{sn}_memory=\"{mem}\"\n")
+            specs[row["ServiceName"]] = {"placement": f"node.labels.node{n} == true", 
+                                         "cpu": cpus, 
+                                         "memory": row["Memory"]}
+    return specs
+
+def make_compose(csv_file, env_file, delimeter, nodes=[]):
+    specs = get_compose_specs(csv_file, delimeter, nodes=nodes)
+    with open(env_file, 'w') as out_file:
+        for service_name, spec in specs.items():
+            sn = service_name.replace("-", "_")
+            out_file.write(f"{sn}_placement=\"{spec['placement']}\"\n")
+            out_file.write(f"{sn}_cpu=\"{spec['cpu']}\"\n")
+            out_file.write(f"{sn}_memory=\"{spec['memory']}\"\n")
     print(f"env file written out to {env_file}...", flush=True)
+    return specs
 
 def main():
     args = parse_args()
@@ -0,0 +1,202 @@
+import argparse
+import csv
+import time
+from prettytable import PrettyTable
+from inventory import parse_likwid_topology, parse_numa, parse_cpu_list, load_inventory, INVENTORY_FILE
+
+# SMT policies for choosing the hardware threads of a service:
+#   pack   - take all hardware threads of a free physical core before moving to the next core
+#   avoid  - take one hardware thread per free physical core, only using SMT siblings once every core is taken
+#   spread - round robin over the socket's cpus in increasing order (the old --sorted behaviour)
+SMT_POLICIES = ["pack", "avoid", "spread"]
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("csv_file", metavar="csv-file", type=str, help="csv file with service assignments")
+    parser.add_argument("--likwid", type=str, nargs="+", default=None, help="recorded likwid-topology -O output, one file per node (or one for all nodes)")
+    parser.add_argument("--lscpu", type=str, nargs="+", default=None, help="recorded lscpu output, one file per node (or one for all nodes)")
+    parser.add_argument("--inventory", type=str, default=INVENTORY_FILE, help="cached inventory to take the topology from if no likwid files given")
+    parser.add_argument("--smt", type=str, default="pack", choices=SMT_POLICIES, help="SMT policy")
+    parser.add_argument("--prefix", type=str, default="", help="prefix of the service names (e.g. socialNetwork_)")
+    return parser.parse_args()
+
+def table_to_list(table):
+    socket_nums = [int(t["Socket"]) for t in table]
+    core_nums = [int(t["Core"]) for t in table]
+    num_socket = max(socket_nums) + 1   # number of sockets on this server
+    num_core = max(core_nums) + 1       # number of cores on this server
+
+    cpu_list = []   # HWThread num = [socket][core][thread]
+    next_cpu = []   # next cpu (logical core) to use on core = [socket][core]
+    for i in range(num_socket):
+        cpu_list.append([])
+        core_list = []
+        for _ in range(num_core):
+            cpu_list[i].append([])
+            core_list.append(0)
+        next_cpu.append(core_list)
+
+
+    for t in table:
+        cpu_list[int(t["Socket"])][int(t["Core"])].append(int(t["HWThread"]))
+
+    return cpu_list, next_cpu, num_core, num_socket
+
+def make_node_state(socket_cpus, table, numa=None):
+    # planning state for one node - which cores/threads have been handed out so far
+    cpu_list, next_cpus, num_cores, num_sockets = table_to_list(table)
+    # NUMA node of each cpu (if known) for picking --cpuset-mems
+    cpu_numa = {}
+    for i, n in enumerate(numa or []):
+        for c in parse_cpu_list(n):
+            cpu_numa[c] = i
+    return {"socket_cpus": [[int(c) for c in sc] for sc in socket_cpus],
+            "cpu_list": cpu_list,
+            # next logical core to use on each core = [socket][core]
+            "next_cpus": next_cpus,
+            # if a (physical) core already has a pinned logical core = [socket][core]
+            "core_assigned": [[False for _ in range(num_cores)] for _ in range(num_sockets)],
+            # next cpu to use for each socket - only used once all cores have been assigned
+            "next_cpu": [0 for _ in range(len(socket_cpus))],
+            "cpu_numa": cpu_numa}
+
+def take_round_robin(state, socket, cpus, cpin, sort=False):
+    cpus_to_pin = state["socket_cpus"][socket]
+    if sort:
+        cpus_to_pin = sorted(cpus_to_pin)
+    while len(cpin) < cpus:
+        cpin.append(cpus_to_pin[state["next_cpu"][socket]])
+        state["next_cpu"][socket] += 1
+        state["next_cpu"][socket] %= len(cpus_to_pin)
+    return cpin
+
+def take_cpus(state, socket, cpus, smt="pack"):
+    if smt == "spread":
+        return take_round_robin(state, socket, cpus, [], sort=True)
+
+    cpu_list = state["cpu_list"][socket]
+    next_cpus = state["next_cpus"][socket]
+    core_assigned = state["core_assigned"][socket]
+    # threads to take from each free core
+    per_core = None if smt == "pack" else 1
+
+    cpin = []
+    # take (hardware threads on) cores that no other service is pinned to yet
+    for i in range(len(core_assigned)):
+        if core_assigned[i] or not cpu_list[i]:
+            continue
+        for c in cpu_list[i][:per_core]:
+            cpin.append(c)
+            next_cpus[i] += 1
+            if len(cpin) == cpus:
+                break
+        core_assigned[i] = True
+        if len(cpin) == cpus:
+            return cpin
+
+    # if still not enough cpus, then start colocating on other cores, on empty logical cores first
+    for i in range(len(next_cpus)):
+        if next_cpus[i] >= len(cpu_list[i]):
+            continue
+        cpin.append(cpu_list[i][next_cpus[i]])
+        next_cpus[i] += 1
+        if len(cpin) == cpus:
+            return cpin
+
+    # at this point every logical core on this socket has been pinned, so just start filling from low to high
+    return take_round_robin(state, socket, cpus, cpin)
+
+def get_mems(state, cpus, socket):
+    # NUMA node(s) of the pinned cpus, so memory is allocated next to them (fall back to the socket)
+    if not state["cpu_numa"]:
+        return [socket]
+    return sorted(set([state["cpu_numa"][c] for c in cpus if c in state["cpu_numa"]]))
+
+def get_replicas(service_nodes, service):
+    # list of (slot, node number) - a single node number is one replica with no slot
+    replicas = service_nodes[service]
+    if isinstance(replicas, int):
+        return [(None, replicas)]
+    return replicas
+
+def plan_pins(rows, service_nodes, socket_nums, node_tables, numa_nums=None, smt="pack", prefix=""):
+    # rows: csv rows (dicts), service_nodes: service name (with prefix) -> node number, or list of
+    # (slot, node number) with one entry per replica, socket_nums/node_tables/numa_nums: per node topology (see inventory.py)
+    # every replica gets its own cpus, so replicas on the same node don't share cores
+    # returns the list of pins: {service, replica, node, socket, cpus, mems}
+    assert(smt in SMT_POLICIES)
+    if numa_nums is None:
+        numa_nums = [None] * len(socket_nums)
+    states = [make_node_state(s, t, n) for s, t, n in zip(socket_nums, node_tables, numa_nums)]
+
+    plan = []
+    for row in rows:
+        service_name = row["ServiceName"]
+        socket = int(row["Socket"])
+        if socket == -1: # no socket pin for this service
+            continue
+        for slot, node_num in get_replicas(service_nodes, f"{prefix}{service_name}"):
+            state = states[node_num]
+            if socket >= len(state["socket_cpus"]):
+                print(f"socket {socket} not available on node {node_num}")
+                assert(False)
+
+            # only pick a number of cpus if the user has specified one, otherwise use the whole socket
+            cpus = int(row["NCPUs"]) if "NCPUs" in row and row["NCPUs"] else 0
+            if cpus != 0:
+                cpin = take_cpus(state, socket, cpus, smt=smt)
+            else:
+                cpin = list(state["socket_cpus"][socket])
+            plan.append({"service": service_name, "replica": slot, "node": node_num, "socket": socket,
+                         "cpus": cpin, "mems": get_mems(state, cpin, socket)})
+    return plan
+
+def read_rows(csv_file):
+    with open(csv_file, 'r') as f:
+        return list(csv.DictReader(f, delimiter=','))
+
+def print_plan(plan):
+    x = PrettyTable()
+    x.field_names = ["Service", "Replica", "Node", "Socket", "# CPUs", "CPUs", "Mems"]
+    for p in plan:
+        x.add_row([p["service"], p["replica"], p["node"], p["socket"], len(p["cpus"]), ",".join([str(c) for c in p["cpus"]]),
+                   ",".join([str(m) for m in p["mems"]])])
+    print(x)
+    return x
+
+def read_files(files, num_nodes):
+    outs = []
+    for f in files:
+        with open(f, "r") as fp:
+            outs.append(fp.read())
+    # a single file is used for every node
+    if len(outs) == 1:
+        outs = outs * num_nodes
+    assert(len(outs) == num_nodes)
+    return outs
+
+def main():
+    args = parse_args()
+    rows = read_rows(args.csv_file)
+    # plan offline against the requested placement in the csv
+    service_nodes = {f"{args.prefix}{r['ServiceName']}": int(r["Node"]) for r in rows}
+    num_nodes = max(service_nodes.values()) + 1
+
+    if args.likwid is not None:
+        topologies = [parse_likwid_topology(out) for out in read_files(args.likwid, num_nodes)]
+        numa_nums = [parse_numa(out) for out in read_files(args.lscpu, num_nodes)] if args.lscpu else None
+    else:
+        # use the topology of the cached nodes (in order)
+        entries = list(load_inventory(args.inventory)["entries"].values())[:num_nodes]
+        topologies = [(e["socket_cpus"], e["topology"]) for e in entries]
+        numa_nums = [e["numa"] for e in entries]
+
+    start = time.perf_counter()
+    plan = plan_pins(rows, service_nodes, [t[0] for t in topologies], [t[1] for t in topologies],
+                     numa_nums, smt=args.smt, prefix=args.prefix)
+    elapsed = time.perf_counter() - start
+    print_plan(plan)
+    print(f"planned {len(plan)} replica(s) in {elapsed*1000:.3f} ms ({elapsed*1e6/max(len(plan), 1):.1f} us per replica)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import csv
+import json
+import math
+import os
+import pickle
+import random
+from helpers import find_file, open_path, get_service_name
+
+# words that mark a service as a storage backend (no spans of its own in Jaeger)
+STORAGE_WORDS = ["mongodb", "memcached", "redis", "cassandra"]
+CSV_FIELDS = ["ServiceName", "Node", "CPUs", "Memory", "Socket"]
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("template", type=str, help="csv file with the services to place (and their Memory/CPUs columns)")
+    parser.add_argument("--jaeger-dirs", type=str, nargs="+", default=[], help="directories with Jaeger trace json files (from parse_jaeger.py)")
+    parser.add_argument("--stats", type=str, default=None, help="stats pickle file (from run_workload.py --stats) for per-service cpu demand")
+    parser.add_argument("--load", type=int, default=None, help="load in the stats file to take the cpu demand from (default: highest)")
+    parser.add_argument("--default-demand", type=float, default=1.0, help="cpu demand assumed for services with no stats")
+    parser.add_argument("--nodes", "-n", type=int, required=True, help="number of nodes to place services on")
+    parser.add_argument("--sockets", "-s", type=int, default=2, help="number of sockets per node")
+    parser.add_argument("--cpus", "-c", type=float, required=True, help="number of cpus per node")
+    parser.add_argument("--socket-penalty", type=float, default=0.3, help="cost of a cross-socket call relative to a cross-node call")
+    parser.add_argument("--overcommit-weight", type=float, default=2.0, help="weight of cpu overcommit relative to cross-node calls")
+    parser.add_argument("--iters", type=int, default=20000, help="simulated annealing iterations (0 = greedy only)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--ncpus", action="store_true", help="also write an NCPUs column (cpu demand rounded up) for pinning")
+    parser.add_argument("--out", "-o", type=str, default=None, help="csv file to write (default: env_csvs/env_opt_<nodes>node.csv)")
+    return parser.parse_args()
+
+def read_template(csv_file):
+    csv_file = find_file(csv_file, env_csv=True)
+    with open(csv_file, "r") as f:
+        return list(csv.DictReader(f, delimiter=","))
+
+def get_trace_edges(jaeger_dirs):
+    # number of calls between each pair of services (parent span service -> child span service),
+    # and the number of spans of each service
+    edges = {}
+    span_counts = {}
+    for d in jaeger_dirs:
+        files = [f for f in os.listdir(d) if f.endswith(".json")]
+        for file in files:
+            with open(os.path.join(d, file), "r") as f:
+                try:
+                    trace = json.load(f)["data"][0]
+                except (ValueError, KeyError, IndexError):
+                    print(f"error loading {file}")
+                    continue
+            processes = trace["processes"]
+            span_service = {s["spanID"]: processes[s["processID"]]["serviceName"] for s in trace["spans"]}
+            for span in trace["spans"]:
+                service = span_service[span["spanID"]]
+                span_counts[service] = span_counts.get(service, 0) + 1
+                for ref in span.get("references", []):
+                    parent = span_service.get(ref["spanID"])
+                    if ref.get("refType") != "CHILD_OF" or parent is None or parent == service:
+                        continue
+                    key = tuple(sorted([parent, service]))
+                    edges[key] = edges.get(key, 0) + 1
+    return edges, span_counts
+
+def get_storage_key(name):
+    # e.g. user-mongodb -> user, mongodb-geo -> geo, user-service -> user
+    words = [w for w in name.split("-") if w not in STORAGE_WORDS + ["service"]]
+    return "-".join(words)
+
+def add_storage_edges(edges, span_counts, services):
+    # storage backends don't show up in the traces, so tie each one to the service that owns it
+    # (with one call per span of that service)
+    storage = [s for s in services if any([w in s for w in STORAGE_WORDS])]
+    owners = [s for s in services if s not in storage]
+    for s in storage:
+        key = get_storage_key(s)
+        if not key:
+            continue
+        for o in owners:
+            okey = get_storage_key(o)
+            if okey == key or okey.startswith(key) or key.startswith(okey):
+                if span_counts.get(o, 0) > 0:
+                    pair = tuple(sorted([s, o]))
+                    edges[pair] = edges.get(pair, 0) + span_counts[o]
+                break
+    return edges
+
+def get_cpu_demand(stats_file, load=None):
+    # mean cpu use (in cpus) of each service over the measurements at the given load
+    with open(stats_file, "rb") as f:
+        data = pickle.load(f)
+    loads = [d[0] for d in data]
+    if load is None:
+        load = max(loads)
+    node_stats = data[loads.index(load)][1][0]
+    samples = {}
+    for stats_node in node_stats:
+        if stats_node is None:
+            continue
+        if isinstance(stats_node, dict):
+            # packed stats (numeric columns, CPUPerc already in cpus)
+            cols = stats_node["columns"]
+            for c, cpu in zip(cols["container"], cols["CPUPerc"]):
+                if cpu == cpu:
+                    samples.setdefault(get_service_name(stats_node["names"][int(c)]), []).append(float(cpu))
+            continue
+        for m in stats_node:
+            if not m or "Name" not in m or "CPUPerc" not in m:
+                continue
+            cpu = float(m["CPUPerc"].rstrip("%")) / 100.0
+            samples.setdefault(get_service_name(m["Name"]), []).append(cpu)
+    return {s: sum(v) / len(v) for s, v in samples.items()}
+
+def get_cost(assign, edges, demand, num_nodes, num_sockets, cpus, socket_penalty, overcommit_weight):
+    # fraction of (weighted) calls that cross nodes/sockets + weighted relative cpu overcommit
+    total = sum(edges.values()) or 1
+    comm = 0
+    for (a, b), w in edges.items():
+        if assign[a][0] != assign[b][0]:
+            comm += w
+        elif assign[a][1] != assign[b][1]:
+            comm += w * socket_penalty
+
+    node_load = [0.0] * num_nodes
+    socket_load = [[0.0] * num_sockets for _ in range(num_nodes)]
+    for s, (n, k) in assign.items():
+        node_load[n] += demand.get(s, 0)
+        socket_load[n][k] += demand.get(s, 0)
+    over = sum([max(0, l - cpus) for l in node_load]) / cpus
+    socket_cpus = cpus / num_sockets
+    over += sum([max(0, l - socket_cpus) for sl in socket_load for l in sl]) / socket_cpus
+    return comm / total + overcommit_weight * over
+
+def greedy_place(services, edges, demand, num_nodes, num_sockets, cpus, socket_penalty, overcommit_weight):
+    # place the busiest/most connected services first, each where it adds the least cost so far
+    weight = {s: demand.get(s, 0) for s in services}
+    for (a, b), w in edges.items():
+        weight[a] = weight.get(a, 0) + w / (sum(edges.values()) or 1)
+        weight[b] = weight.get(b, 0) + w / (sum(edges.values()) or 1)
+    order = sorted(services, key=lambda s: -weight.get(s, 0))
+
+    assign = {}
+    for s in order:
+        placed = set(assign.keys()) | {s}
+        sub_edges = {e: w for e, w in edges.items() if e[0] in placed and e[1] in placed}
+        best, best_cost = None, None
+        for n in range(num_nodes):
+            for k in range(num_sockets):
+                assign[s] = (n, k)
+                cost = get_cost(assign, sub_edges, demand, num_nodes, num_sockets, cpus, socket_penalty, overcommit_weight)
+                # break ties by the least loaded node, so unconnected services get spread out
+                load = sum([demand.get(o, 0) for o, (on, _) in assign.items() if on == n and o != s])
+                if best is None or (cost, load) < best_cost:
+                    best, best_cost = (n, k), (cost, load)
+        assign[s] = best
+    return assign
+
+def anneal(assign, edges, demand, num_nodes, num_sockets, cpus, socket_penalty, overcommit_weight,
+           iters=20000, seed=0, t_start=0.1, t_end=1e-4):
+    rng = random.Random(seed)
+    services = list(assign.keys())
+    args = (edges, demand, num_nodes, num_sockets, cpus, socket_penalty, overcommit_weight)
+    curr = dict(assign)
+    curr_cost = get_cost(curr, *args)
+    best, best_cost = dict(curr), curr_cost
+    for i in range(iters):
+        t = t_start * (t_end / t_start) ** (i / max(iters - 1, 1))
+        new = dict(curr)
+        if rng.random() < 0.5 or len(services) < 2:
+            # move one service to another node/socket
+            s = rng.choice(services)
+            new[s] = (rng.randrange(num_nodes), rng.randrange(num_sockets))
+        else:
+            # swap the placement of two services
+            a, b = rng.sample(services, 2)
+            new[a], new[b] = curr[b], curr[a]
+        new_cost = get_cost(new, *args)
+        if new_cost <= curr_cost or rng.random() < math.exp((curr_cost - new_cost) / t):
+            curr, curr_cost = new, new_cost
+            if curr_cost < best_cost:
+                best, best_cost = dict(curr), curr_cost
+    return best, best_cost
+
+def write_csv(out_file, rows, assign, demand, ncpus=False):
+    fields = CSV_FIELDS + (["NCPUs"] if ncpus else [])
+    open_path(out_file, file=True)
+    with open(out_file, "w") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            s = row["ServiceName"]
+            out = {"ServiceName": s, "Node": assign[s][0], "Socket": assign[s][1],
+                   "CPUs": row.get("CPUs", "0"), "Memory": row.get("Memory", "0")}
+            if ncpus:
+                out["NCPUs"] = max(1, math.ceil(demand.get(s, 0)))
+            writer.writerow(out)
+    print(f"placement written out to {out_file}...", flush=True)
+
+def main():
+    args = parse_args()
+    rows = read_template(args.template)
+    services = [r["ServiceName"] for r in rows]
+
+    edges, span_counts = get_trace_edges(args.jaeger_dirs)
+    edges = add_storage_edges(edges, span_counts, services)
+    # only keep calls between services that are being placed
+    edges = {e: w for e, w in edges.items() if e[0] in services and e[1] in services}
+    demand = get_cpu_demand(args.stats, args.load) if args.stats is not None else {}
+    print(f"{len(edges)} service call edge(s), cpu demand for {len(demand)} service(s)", flush=True)
+    demand = {s: demand.get(s, args.default_demand) for s in services}
+
+    params = (edges, demand, args.nodes, args.sockets, args.cpus, args.socket_penalty, args.overcommit_weight)
+    assign = greedy_place(services, *params)
+    cost = get_cost(assign, *params)
+    print(f"greedy placement cost: {cost:.4f}", flush=True)
+    if args.iters > 0:
+        assign, cost = anneal(assign, *params, iters=args.iters, seed=args.seed)
+        print(f"annealed placement cost: {cost:.4f}", flush=True)
+
+    out_file = args.out if args.out is not None else f"env_csvs/env_opt_{args.nodes}node.csv"
+    write_csv(out_file, rows, assign, demand, ncpus=args.ncpus)
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,7 @@ def parse_args():
     parser.add_argument("--label-lines", action="store_true", help="label lines instead of markers in legend")
     parser.add_argument("--markeredgewidth", type=float, default=0.7, help="marker edge width")
     parser.add_argument("--markeredgecolor", type=str, default='k', help="marker edge color")
+    parser.add_argument("--error-bars", action="store_true", help="plot the confidence intervals of repeated loads (run_workload.py --reps-metric) as error bars")
     return parser.parse_args()
 
 def plot_single(xs, ys, color='b', ylabel='Avg. Latency (ms)', marker='o', line='-', data_labels=False, 
@@ -68,7 +69,7 @@ def plot_single(xs, ys, color='b', ylabel='Avg. Latency (ms)', marker='o', line=
                  linewidth=linewidth, zorder=zorder)
     if stdevs is not None:
         # plot with error bars
-        plt.errorbar(xs, ys, yerr=stdevs, color=color)
+        plt.errorbar(xs, ys, yerr=stdevs, color=color, fmt='none', capsize=2, zorder=zorder)
     plt.xlabel('Input Rate (QPS)')
     plt.ylabel(ylabel)
     
@@ -88,7 +89,7 @@ def plot_single(xs, ys, color='b', ylabel='Avg. Latency (ms)', marker='o', line=
 def plot(data, files, mode='normal', labels=None, rate_ranges=None, label_columns=3, 
          rotate_markers=False, colors=None, markers=None, lines=None, log=(False, True),
          interpolate=False, hline=None, vline=None, linewidth=0.75, label_lines=False,
-         markersize=6, markeredgewidth=0.7, markeredgecolor='k'):
+         markersize=6, markeredgewidth=0.7, markeredgecolor='k', error_bars=False):
     # colors = ['b', 'g', 'r', 'c', 'm', 'y', 'k', 'tab:orange', 'tab:purple', 'tab:brown', 'tab:pink', 'tab:gray', 'tab:olive', 'tab:cyan']
     # list matploblib markers: https://matplotlib.org/3.1.1/api/markers_api.html
     r_markers = ['o', '*', 'x', '^', 's', 'P', '1', '+']
@@ -118,6 +119,7 @@ def plot(data, files, mode='normal', labels=None, rate_ranges=None, label_column
         c = next(color)
         label = labels[i]
         rates, avgs, p50s, p99s, stdevs = extract_data(d)
+        lowers, uppers = extract_cis(d, mode)
         # set zorder so that the first plot is on top
         zorder = len(data) - i
         if rate_ranges is not None:
@@ -128,8 +130,10 @@ def plot(data, files, mode='normal', labels=None, rate_ranges=None, label_column
             else: # otherwise, use the rate range for the corresponding data
                 assert(len(rate_ranges) == len(data))
                 rate_range = rate_ranges[i]
-            rates, [avgs, p50s, p99s, stdevs] = set_range(rate_range, rates, [avgs, p50s, p99s, stdevs])
+            rates, [avgs, p50s, p99s, stdevs, lowers, uppers] = set_range(rate_range, rates, [avgs, p50s, p99s, stdevs, lowers, uppers])
         stdevs = None
+        if error_bars:
+            stdevs = np.array([lowers, uppers])
             
         marker = 'o'
         if rotate_markers:
@@ -182,7 +186,8 @@ def extract_data(data):
     rates, avgs, p50s, p99s, stdevs = [], [], [], [], []
     for d in data:
         # NOTE: d (for each load) is in the form:
-        # (rate, (latency:[avg, stdev, p99, +- stdev], throughput:[avg, stdev, p99, +- stdev], tail-latency:[p50, p75, p90, p99, p99.9, p99.99, p99.999, p100]))
+        # (rate, (latency:[avg, stdev, p99, +- stdev], throughput:[avg, stdev, p99, +- stdev], tail-latency:[p50, p75, p90, p99, p99.9, p99.99, p99.999, p100]), info)
+        # where info is a dict of extra information about the run (only in newer pickles)
         
         # skip data that was not collected/empty
         if not d[1][0]:
@@ -194,6 +199,23 @@ def extract_data(data):
         stdevs.append(d[1][0][1])
     return rates, avgs, p50s, p99s, stdevs
 
+def extract_cis(data, mode):
+    # distance from each load's value down/up to its confidence interval (0 for loads that weren't repeated)
+    lowers, uppers = [], []
+    for d in data:
+        # skip data that was not collected/empty (same as extract_data)
+        if not d[1][0]:
+            continue
+        ci = d[2].get("ci", {}).get(mode) if len(d) > 2 else None
+        if ci is None or ci[1] is None:
+            lowers.append(0)
+            uppers.append(0)
+        else:
+            mean, low, high = ci
+            lowers.append(mean - low)
+            uppers.append(high - mean)
+    return lowers, uppers
+
 def extract_pickle_data(files):
     data = []
     for p in files:
@@ -260,7 +282,8 @@ def main():
          markers=markers, log=log, lines=lines, interpolate=args.interpolate,
          hline=args.hline, vline=args.vline, linewidth=args.linewidth,
          label_lines=args.label_lines, markersize=args.markersize,
-         markeredgewidth=args.markeredgewidth, markeredgecolor=args.markeredgecolor)
+         markeredgewidth=args.markeredgewidth, markeredgecolor=args.markeredgecolor,
+         error_bars=args.error_bars)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,6 +2,7 @@ from helpers import convert_range
 import pickle
 import matplotlib.pyplot as plt
 import argparse
+import numpy as np
 import pandas as pd
 
 def parse_args():
@@ -17,8 +18,10 @@ def unpack_stats(file):
         # data is in the form:
         # data = [stats_dict, stats_dict, ...] - one per load
         # stats_dict = (load, ([node0:stats,...,nodeN:stats]), [node0:rapl,...,nodeN:rapl])
-        # stats is a list of dicts, one per measurement
+        # stats is a list of dicts, one per measurement (or with --pack-stats, a dict of numeric columns)
         # rapl is a list of dicts, one dict per package per measurement
+        # cpufreq is a dict of the per-core MHz of each measurement ("freqs") and the wall/mono time it was taken at
+        # (or in older files, just the list of per-core MHz of each measurement)
         data = pickle.load(f)
         loads = [d[0] for d in data]
         stats_data = [d[1][0] for d in data]
@@ -44,6 +47,8 @@ def unpack_stats(file):
     
     # add node number and load to each stats dict
     stats_dicts, rapl_dicts, cpufreq_dicts = [], [], []
+    # packed stats are kept as data frames (already numeric)
+    stats_frames = []
     if not no_stats_data:
         # loop through each load
         for i, stats_load in enumerate(stats_data):
@@ -51,6 +56,9 @@ def unpack_stats(file):
             for j, stats_node in enumerate(stats_load):
                 if stats_node is None:
                     continue
+                if isinstance(stats_node, dict):
+                    stats_frames.append(packed_stats_to_df(stats_node, j, loads[i]))
+                    continue
                 # loop through each measurement
                 for k, stats_measurement in enumerate(stats_node):
                     if not stats_measurement or stats_measurement is None:
@@ -76,6 +84,10 @@ def unpack_stats(file):
             for j, cpufreq_node in enumerate(cpufreq_load):
                 if cpufreq_node is None:
                     continue
+                walls = None
+                if isinstance(cpufreq_node, dict):
+                    walls = cpufreq_node.get("wall")
+                    cpufreq_node = cpufreq_node["freqs"]
                 for k, cpufreq_measurement in enumerate(cpufreq_node):
                     cpufreq_dict = {}
                     # cpufreq_node is a list of lists
@@ -83,14 +95,35 @@ def unpack_stats(file):
                     cpufreq_dict['Node'] = j
                     cpufreq_dict['Load'] = loads[i]
                     cpufreq_dict['Second'] = k
+                    if walls is not None:
+                        cpufreq_dict['Wall'] = walls[k]
                     for l, core in enumerate(cpufreq_measurement):
                         cpufreq_dict[f'core{l}'] = core
                     cpufreq_dicts.append(cpufreq_dict)
         
-    return loads, stats_dicts, rapl_dicts, cpufreq_dicts
+    return loads, stats_dicts, rapl_dicts, cpufreq_dicts, stats_frames
+
+def packed_stats_to_df(stats_node, node, load):
+    # data frame of the columns of one node's packed stats (in the same form as the converted docker stats)
+    cols = stats_node["columns"]
+    df = pd.DataFrame({c: v for c, v in cols.items() if c not in ["container", "sample"]})
+    df.insert(0, "Name", np.array(stats_node["names"], dtype=object)[cols["container"].astype(int)] if len(df) else [])
+    df["Node"] = node
+    df["Load"] = float(load)
+    df["Measurement"] = cols["sample"]
+    return df
+
+def add_times(df):
+    # seconds from the first sample of each load (over every node), from the wall clock times of the samples -
+    # rows without one keep their index (Measurement/Second) only
+    if df is None or 'Wall' not in df.columns:
+        return df
+    df['Wall'] = df['Wall'].astype(float)
+    df['Time'] = df['Wall'] - df.groupby('Load')['Wall'].transform('min')
+    return df
 
 def stats_to_dfs(file):
-    loads, stats_dicts, rapl_dicts, cpufreq_dicts = unpack_stats(file)
+    loads, stats_dicts, rapl_dicts, cpufreq_dicts, stats_frames = unpack_stats(file)
     rapl_df = pd.DataFrame.from_dict(rapl_dicts) if rapl_dicts else None
     stats_df = pd.DataFrame.from_dict(stats_dicts) if stats_dicts else None
     cpufreq_df = pd.DataFrame.from_dict(cpufreq_dicts) if cpufreq_dicts else None
@@ -131,6 +164,13 @@ def stats_to_dfs(file):
         stats_df[split_stats] = stats_df[split_stats].astype(float)
         # remove the NetIO and BlockIO columns
         stats_df = stats_df.drop(columns=['NetIO', 'BlockIO', 'MemUsage'])
+        if 'Mono' in stats_df.columns:
+            stats_df['Mono'] = stats_df['Mono'].astype(float)
+
+    if stats_frames:
+        # (the packed stats are already in this form)
+        stats_df = pd.concat(([stats_df] if stats_df is not None else []) + stats_frames, ignore_index=True)
+    stats_df = add_times(stats_df)
 
     if cpufreq_df is not None:
         # convert load to int
@@ -147,6 +187,7 @@ def stats_to_dfs(file):
         cpufreq_df['Min'] = cpufreq_df[core_cols].min(axis=1)
         # compute the max of each core
         cpufreq_df['Max'] = cpufreq_df[core_cols].max(axis=1)
+        cpufreq_df = add_times(cpufreq_df)
     
     return loads, rapl_df, stats_df, cpufreq_df
 
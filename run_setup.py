@@ -1,13 +1,12 @@
 from helpers import *
 from docker_services import get_node_ids
-from update_swarm import cleanup, deploy_stack
+from update_swarm import cleanup, deploy_stack, wait_for_stack, print_ready_times
+from inventory import get_inventory, get_public_ip, print_inventory
 import argparse
 import asyncio
-import time
 import os
 import webbrowser
 
-GET_IPADDR = "hostname -I"
 DSB_PATH = "~/DeathStarBench/{}/"
 RUN_CONTAINER = f"cd {DSB_PATH} && sudo docker-compose up -d"
 NGROK_SETUP = "sudo ngrok config add-authtoken 2GEGFS3Ug2CSJJXyS4Aml3LqeNe_5Jx6cTUZvetvWF21V5Hxj && \
@@ -18,7 +17,7 @@ def parse_args():
     parser.add_argument("ssh_comms", metavar="ssh-comms", type=str, help="text file with ssh commands line by line")
     parser.add_argument("service_name", type=str, default="socialNetwork", help="name of the service to run workloads on")
     parser.add_argument("--no-setup", action="store_true", help="don't scp or run setup script")
-    parser.add_argument("--no-sleep", action="store_true", help="don't sleep after running script")
+    parser.add_argument("--no-sleep", action="store_true", help="don't wait for the stack to be ready after deploying it")
     parser.add_argument("--no-jaeger", action="store_true", help="don't automatically open jaeger page")
     parser.add_argument("--skip-swarm", action="store_true", help="don't setup swarm (don't init or join)")
     parser.add_argument("--compose", type=str, default=None, help="name of compose file to copy and use")
@@ -45,15 +44,15 @@ def init_swarm(node, master_ip):
     return f"sudo {swarm_out}"
 
 def get_ip_address(node):
-    # get the private IP that starts with 10.
-    ip_list = run_ssh_cmd(node, GET_IPADDR, check=True).split()
+    # get the private IP that starts with 10. (from the cached inventory)
+    ip_list = get_inventory([node])[0]["ips"]
     private_ip = ""
     for ip in ip_list:
         if ip.startswith("10."):
             private_ip = ip
             break
     
-    public_ip = run_ssh_cmd(node, "sudo curl -s https://ipecho.net/plain").strip()
+    public_ip = get_public_ip(node)
     
     return private_ip, public_ip, ip_list
 
@@ -114,6 +113,9 @@ def main():
         print("done setup", flush=True)
     else:
         print("skipping setup", flush=True)
+    
+    # gather (or refresh, after a setup) the inventory of every node in one parallel pass
+    print_inventory(get_inventory(nodes, refresh=not args.no_setup))
         
     if args.compose is not None:
         print("copying custom compose file...")
@@ -179,8 +181,8 @@ def main():
     print("done deploying stack", flush=True)
         
     if not args.no_sleep:
-        # need to sleep due to some weird asyncio behavior
-        time.sleep(60)
+        # wait until every service is running (instead of a fixed sleep)
+        print_ready_times(wait_for_stack(nodes[0]))
     
     # open the jaeger browser UI
     if not args.no_jaeger:
@@ -1,11 +1,61 @@
 import argparse
 from helpers import *
 import time
-from update_swarm import restart_stack, set_compose_env, check_no_containers, cleanup
+from update_swarm import restart_stack, set_compose_env, check_no_containers, cleanup, update_stack, pin_cpus, DEPLOY_TIMEOUT
+from make_docker_compose import get_compose_specs
+from journal import open_journal, journal_point, get_file_hash
+from load_profiles import get_segments, get_offered_rate, PROFILE_KINDS, WRK2_CALIBRATION, MIN_WINDOW
+from telemetry import read_cgroup_stats, to_docker_stats, get_overhead_summary, unpack_node_stats
+from telemetry import read_power_freq, power_freq_to_rapl, power_freq_to_cpufreq
+from timeline import measure_clock_offsets, get_offset
+from latency_spectrum import to_spectrum, merge_spectra, spectrum_percentiles, spectrum_stats
 import asyncio
+import base64
+import math
+from concurrent.futures import ThreadPoolExecutor
+from scipy.stats import t as t_dist
 
 DSB_PATH = f"~/DeathStarBench/{get_current_service_name()}/"
 CD_WRK = f"cd ~/DeathStarBench/{get_current_service_name()}/wrk2"
+# percentiles of the lat_dist from parse_output
+LAT_PERCENTILES = [50, 75, 90, 99, 99.9, 99.99, 99.999, 100]
+# min fraction of the offered rate that has to be achieved for a load to count as sustained
+MIN_RATE_RATIO = 0.95
+# what to do with the rest of a sweep once the system is saturated
+SATURATION_ACTIONS = ["none", "stop", "coarsen"]
+# p99 growth (vs the previous load) that counts as latency blowing up when the achieved rate has stopped growing
+SAT_LAT_GROWTH = 2.0
+# seconds ahead of now that the wrk clients are told to start at (enough for every ssh command to be running)
+CLIENT_START_LEAD = 3
+# marks the start/end of each window (with the time on the master, and the wrk exit code at the end) 
+# in the output of a windowed run
+WINDOW_START_MARKER = "@@window-start"
+WINDOW_MARKER = "@@window-end"
+# if this file exists on the master, a windowed run stops before its next window
+# (~ rather than $HOME, which the local shell would expand inside the double quoted ssh command)
+WINDOW_STOP_FILE = "~/wrk_windows.stop"
+# (every window is its own wrk2 run, at least MIN_WINDOW seconds so it gets past wrk2's calibration, see load_profiles.py)
+# container stats samplers - docker stats (~1 Hz text) or scripts/cgroup_stats.py (cgroup v2 counters, binary)
+STATS_SAMPLERS = ["docker", "cgroup"]
+STATS_SAMPLER = "docker"
+# seconds between samples of the cgroup sampler
+STATS_INTERVAL = 0.1
+# pack the samples on each node (scripts/pack_stats.py) and fetch them as one compressed columnar file
+PACK_STATS = False
+# how --power/--cpufreq are sampled (rapl.sh/cpufreq.sh, or power_freq.py reading sysfs) and how often (power_freq.py)
+POWER_SAMPLERS = ["rapl", "sysfs"]
+POWER_SAMPLER = "rapl"
+POWER_INTERVAL = 0.1
+# hardware/software events counted for each container's cgroup with perf stat (None if not counting)
+PERF_EVENTS = None
+DEFAULT_PERF_EVENTS = ["cycles", "instructions", "cache-references", "cache-misses", "branch-instructions", 
+                       "branch-misses", "context-switches"]
+# seconds to wait for perf to write its counts once it's been stopped
+PERF_STOP_TIMEOUT = 10
+# offsets of the nodes' clocks from ours (see timeline.py), measured at the start of the run
+CLOCK_OFFSETS = None
+# metrics that repeated load points can be repeated until their confidence interval is narrow enough
+REP_METRICS = ["avg", "p50", "p99", "rate"]
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -20,19 +70,169 @@ def parse_args():
     parser.add_argument("--cooldown", "-c", type=int, default=20, help="time to wait after running each load")
     parser.add_argument("--warmup", "-W", type=int, default=30, help="time to warmup before running workload")
     parser.add_argument("--stats", "-S", action="store_true", help="record stats while running workload")
+    parser.add_argument("--stats-sampler", type=str, default=STATS_SAMPLER, choices=STATS_SAMPLERS, help="how --stats samples the containers")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL, help="seconds between samples of the cgroup stats sampler")
+    parser.add_argument("--pack-stats", action="store_true", help="pack the stats into a compressed columnar file on each node before fetching them (numeric columns in the stats pickle)")
     parser.add_argument("--power", action="store_true", help="record power while running workload")
     parser.add_argument("--cpufreq", action="store_true", help="record cpufreq while running workload")
+    parser.add_argument("--perf", action="store_true", help="count hardware events of each service (perf stat on its cgroup) for each load")
+    parser.add_argument("--perf-events", type=str, nargs="+", default=DEFAULT_PERF_EVENTS, help="perf events to count with --perf")
+    parser.add_argument("--power-sampler", type=str, default=POWER_SAMPLER, choices=POWER_SAMPLERS, help="how --power/--cpufreq are sampled")
+    parser.add_argument("--power-interval", type=float, default=POWER_INTERVAL, help="seconds between samples of the sysfs power/cpufreq sampler")
     parser.add_argument("--restart", "-R", type=str, default=None, help="restart the swarm with the given csv file")
     parser.add_argument("--pin", "-P", action="store_true", help="pin the CPUs")
     parser.add_argument("--compose-file", type=str, default="docker-compose-swarm.yml", help="yaml file with service assignments")
+    parser.add_argument("--env-file", type=str, default=".env", help="local env file to write for --restart (use a different one for each swarm run at the same time)")
+    parser.add_argument("--deploy-timeout", type=int, default=DEPLOY_TIMEOUT, help="max seconds to wait for the stack to be ready after a restart (the run stops if it isn't)")
+    parser.add_argument("--incremental", "-i", action="store_true", help="with --restart, do not redeploy the stack before each load, only update the services whose placement/resources differ from the csv (the containers are not restarted between loads)")
+    parser.add_argument("--windowed", action="store_true", help="run wrk2 in short back to back windows, ending the warmup (at most --warmup seconds) once they converge")
+    parser.add_argument("--window", type=int, default=30, help=f"length of each window in seconds for --windowed (max length for --profile), at least {MIN_WINDOW} since wrk2 calibrates for the first {WRK2_CALIBRATION} seconds of each")
+    parser.add_argument("--converge-windows", type=int, default=3, help="number of windows in a row that have to agree to end the warmup")
+    parser.add_argument("--converge-tol", type=float, default=0.2, help="max relative difference of the p99 and achieved rate from their mean over those windows")
+    parser.add_argument("--reps-metric", type=str, default=None, choices=REP_METRICS, help="repeat each load until the confidence interval of this metric is narrow enough")
+    parser.add_argument("--ci-width", type=float, default=0.05, help="target half width of the confidence interval, relative to the mean")
+    parser.add_argument("--ci-level", type=float, default=0.95, help="confidence level of the interval")
+    parser.add_argument("--min-reps", type=int, default=3, help="min number of times to run each load with --reps-metric")
+    parser.add_argument("--max-reps", type=int, default=10, help="max number of times to run each load with --reps-metric")
+    parser.add_argument("--pipeline", action="store_true", help="collect each load's stats and prepare the next load (cleanup/redeploy) during the cooldown")
+    parser.add_argument("--resume", action="store_true", help="resume the journal of --pickle-file, skipping loads already done (with the same configuration)")
+    parser.add_argument("--clients", type=int, nargs="+", default=None, help="node numbers (in the ssh file) to run wrk2 on, splitting the load between them (default: just the master)")
+    parser.add_argument("--workloads", type=int, nargs="+", default=None, help="run several workloads (indices in config.json) at the same time instead of --workload, splitting each load between them")
+    parser.add_argument("--shares", type=float, nargs="+", default=None, help="share of the load of each of --workloads (default: equal)")
     
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--sweep", type=int, nargs=4, default=[500, 8000, 500, 0], help="[start, stop, step, 0=add | else=multiply], start/stop is inclusive")
     group.add_argument("--loads", type=str, default=None, help="file with loads to run separated by newlines")
+    group.add_argument("--search", type=int, nargs=2, default=None, metavar=("START", "STOP"), help="search for the max load in [start, stop] meeting --slo (instead of a sweep)")
+    group.add_argument("--profile", type=str, nargs="+", default=None, help=f"run one time varying load instead of a sweep ({'/'.join(PROFILE_KINDS)} and its parameters, see load_profiles.py), sampled every --window seconds")
+    parser.add_argument("--slo", type=float, default=None, help="latency slo in ms for --search")
+    parser.add_argument("--slo-percentile", type=float, default=99, choices=LAT_PERCENTILES, help="latency percentile the slo applies to")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="stop the search once the max load is known within this fraction")
+    parser.add_argument("--max-probes", type=int, default=12, help="max number of loads to run for --search")
+    parser.add_argument("--min-rate", type=float, default=MIN_RATE_RATIO, help="min fraction of the offered rate that has to be achieved for a load to be sustained")
+    parser.add_argument("--on-saturation", type=str, default="none", choices=SATURATION_ACTIONS, help="stop the sweep or skip every other remaining load once saturated")
+    parser.add_argument("--patience", type=int, default=2, help="number of saturated loads in a row before --on-saturation kicks in")
+    parser.add_argument("--lat-growth", type=float, default=SAT_LAT_GROWTH, help="p99 growth between loads that counts as saturated (when the achieved rate stops growing)")
     return parser.parse_args()
 
+def split_rate(rate, n):
+    # split a total rate between n clients (the first few get the remainder)
+    return [rate // n + (1 if i < rate % n else 0) for i in range(n)]
+
+def get_sync_cmd(start_ns, node=None):
+    # wait until the given time (ns since the epoch, on our clock), so all clients start together
+    # the time is moved onto the node's clock with its measured offset (see timeline.py), if known
+    start_ns += round(get_offset(CLOCK_OFFSETS, node) * 1e9)
+    # (escaped so the date is taken on the client, not expanded by the local shell)
+    return f"while [ \\$(date +%s%N) -lt {start_ns} ]; do sleep 0.005; done; "
+
+def get_mix(workloads, shares=None):
+    # (workload, fraction of the load) of each workload run at the same time
+    all_workloads = get_current_service_workloads()
+    assert(all([w >= 0 and w < len(all_workloads) for w in workloads]))
+    if shares is None:
+        shares = [1] * len(workloads)
+    assert(len(shares) == len(workloads) and all([s > 0 for s in shares]))
+    return [(w, s / sum(shares)) for w, s in zip(workloads, shares)]
+
+def split_mix(rate, mix):
+    # split a total rate between the workloads of a mix by their shares (largest remainders get the rest),
+    # every workload gets at least 1 req/s (wrk2 needs a positive rate)
+    exact = [rate * s for _, s in mix]
+    rates = [int(r) for r in exact]
+    for i in sorted(range(len(mix)), key=lambda i: rates[i] - exact[i])[:rate - sum(rates)]:
+        rates[i] += 1
+    return [max(1, r) for r in rates]
+
+def run_mix(node, mix, threads, secs, input_rate, sync=True):
+    # run every workload of the mix on the node at the same time, each with its share of the rate
+    workloads = get_current_service_workloads()
+    start_ns = time.time_ns() + CLIENT_START_LEAD * 10**9
+    cmds = []
+    for (w, _), r in zip(mix, split_mix(input_rate, mix)):
+        cmd = f"{CD_WRK} && sudo {workloads[w]['workload_cmd'].format(threads, secs, r)}"
+        cmds.append(get_sync_cmd(start_ns, node) + cmd if sync else cmd)
+    # (all to the same node, so let them all run at once)
+    outs = asyncio.run(run_remote_async([node] * len(cmds), cmds, cmd_list=True, check=True, retries=0, 
+                                        max_per_node=len(cmds)))
+    assert(all([o.rc == 0 for o in outs]))
+    return [o.stdout for o in outs]
+
+def setup_clients(clients):
+    # make sure wrk2 is built on every client node (setup only builds it on the master)
+    print(f"building wrk2 on {len(clients)} client(s) if needed...", flush=True)
+    asyncio.run(run_remote_async(clients, f"{CD_WRK} && (test -x wrk || make)", print_stderr=False, check=True))
+
+def run_clients(clients, wrk_script, threads, secs, input_rate, sync=True):
+    # run wrk2 on each client with its share of the rate, all starting at the same time
+    rates = split_rate(input_rate, len(clients))
+    start_ns = time.time_ns() + CLIENT_START_LEAD * 10**9
+    cmds = []
+    for client, r in zip(clients, rates):
+        cmd = f"{CD_WRK} && sudo {wrk_script.format(threads, secs, r)}"
+        cmds.append(get_sync_cmd(start_ns, client) + cmd if sync else cmd)
+    # don't retry - a late client would skew the results
+    outs = asyncio.run(run_remote_async(clients, cmds, cmd_list=True, check=True, retries=0))
+    assert(all([o.rc == 0 for o in outs]))
+    return [o.stdout for o in outs]
+
+def set_stats_sampler(sampler=STATS_SAMPLER, interval=STATS_INTERVAL, packed=PACK_STATS):
+    global STATS_SAMPLER, STATS_INTERVAL, PACK_STATS
+    assert(sampler in STATS_SAMPLERS and interval > 0)
+    STATS_SAMPLER = sampler
+    STATS_INTERVAL = interval
+    PACK_STATS = packed
+
+def set_power_sampler(sampler=POWER_SAMPLER, interval=POWER_INTERVAL):
+    global POWER_SAMPLER, POWER_INTERVAL
+    assert(sampler in POWER_SAMPLERS and interval > 0)
+    POWER_SAMPLER = sampler
+    POWER_INTERVAL = interval
+
+def set_perf(events=None):
+    global PERF_EVENTS
+    PERF_EVENTS = events
+
+def set_clock_offsets(offsets):
+    global CLOCK_OFFSETS
+    CLOCK_OFFSETS = offsets
+
+def start_samplers(nodes, secs, stats=False, power=False, cpufreq=False):
+    # run the stats/power scripts in the background on each node
+    if stats and STATS_SAMPLER == "cgroup":
+        asyncio.run(run_remote_async(nodes, f"sudo ./cgroup_stats.py cgroup_stats.bin {secs} --interval {STATS_INTERVAL}", 
+                                     background=True))
+    elif stats:
+        asyncio.run(run_remote_async(nodes, f"./docker_stats.sh stats.txt {secs}", background=True))
+    if PERF_EVENTS is not None:
+        asyncio.run(run_remote_async(nodes, f"./perf_cgroups.sh perf_stat.txt {secs} {','.join(PERF_EVENTS)}", 
+                                     background=True))
+    if POWER_SAMPLER == "sysfs" and (power or cpufreq):
+        # (one sampler for both)
+        asyncio.run(run_remote_async(nodes, f"sudo ./power_freq.py power_freq.bin {secs} --interval {POWER_INTERVAL}", 
+                                     background=True))
+        return
+    if power:
+        asyncio.run(run_remote_async(nodes, f"./rapl.sh rapl.txt {secs}", background=True))
+    if cpufreq:
+        asyncio.run(run_remote_async(nodes, f"./cpufreq.sh cpufreq.txt {secs}", background=True))
+
+def run_warmup(nodes, wrk_type=0, input_rate=2000, warmup=0, threads=2, clients=None, mix=None):
+    # run the workload for warmup seconds (not measured)
+    if warmup <= 0:
+        return
+    wrk_script = get_current_service_workloads()[wrk_type]["workload_cmd"]
+    print(f"running warmup for {warmup} seconds", flush=True)
+    if clients is not None:
+        run_clients(clients, wrk_script, threads, warmup, input_rate, sync=False)
+    elif mix is not None:
+        run_mix(nodes[0], mix, threads, warmup, input_rate, sync=False)
+    else:
+        warmup_cmd = wrk_script.format(threads, warmup, input_rate)
+        run_ssh_cmd(nodes[0], f"{CD_WRK} && sudo {warmup_cmd}", check=True)
+
 def run_workload(nodes, wrk_type=0, input_rate=2000, time=30, warmup=0, 
-                 threads=2, stats=False, power=False, cpufreq=False):
+                 threads=2, stats=False, power=False, cpufreq=False, clients=None, mix=None):
     # get the workloads for the current service
     workloads = get_current_service_workloads()
 
@@ -45,28 +245,202 @@ def run_workload(nodes, wrk_type=0, input_rate=2000, time=30, warmup=0,
     wrk_script = workloads[wrk_type]["workload_cmd"]
     
     # if warmup time given, then run the workload for warmup amt of time
-    if warmup > 0:
-        print(f"running warmup for {warmup} seconds", flush=True)
-        warmup_cmd = wrk_script.format(threads, warmup, input_rate)
-        run_ssh_cmd(nodes[0], f"{CD_WRK} && sudo {warmup_cmd}", check=True)
+    run_warmup(nodes, wrk_type=wrk_type, input_rate=input_rate, warmup=warmup, threads=threads, clients=clients, mix=mix)
     
     # get the command to run
     to_run = wrk_script.format(threads, time, input_rate)
+    if mix is not None:
+        to_run = " & ".join([workloads[w]["workload_cmd"].format(threads, time, r) 
+                             for (w, _), r in zip(mix, split_mix(input_rate, mix))])
     # print out time at which command started
     time_str = get_datetime(compact=False)
     print(f"running: [{to_run}], at {time_str}", flush=True)
 
     # if stats or power, then run the stats/power scripts in the background on each node
-    if stats:
-        asyncio.run(run_remote_async(nodes, f"./docker_stats.sh stats.txt {time-2}", background=True))
-    if power:
-        asyncio.run(run_remote_async(nodes, f"./rapl.sh rapl.txt {time-2}", background=True))
-    if cpufreq:
-        asyncio.run(run_remote_async(nodes, f"./cpufreq.sh cpufreq.txt {time-2}", background=True))
+    start_samplers(nodes, time-2, stats=stats, power=power, cpufreq=cpufreq)
+
+    # with multiple clients, return the list of outputs (one per client)
+    if clients is not None:
+        print(f"splitting the load between {len(clients)} client(s): {split_rate(input_rate, len(clients))}", flush=True)
+        return run_clients(clients, wrk_script, threads, time, input_rate), to_run
+
+    # with a mix of workloads, return the list of outputs (one per workload)
+    if mix is not None:
+        print(f"splitting the load between workloads {[w for w, _ in mix]}: {split_mix(input_rate, mix)}", flush=True)
+        return run_mix(nodes[0], mix, threads, time, input_rate), to_run
 
     # run and return the output of the wrk command
     return run_ssh_cmd(nodes[0], f"{CD_WRK} && sudo {to_run}", check=True), to_run
 
+def make_window_script(wrk_script, threads, windows):
+    # run wrk2 back to back for each (rate, seconds) window, marking the end of each one,
+    # until all windows are done or the stop file shows up
+    lines = [f"rm -f {WINDOW_STOP_FILE}", CD_WRK]
+    for i, (rate, secs) in enumerate(windows):
+        lines.append(f"[ -e {WINDOW_STOP_FILE} ] && exit 0")
+        lines.append(f"echo \"{WINDOW_START_MARKER} {i} $(date +%s%N)\"")
+        lines.append(f"sudo {wrk_script.format(threads, secs, rate)} < /dev/null")
+        lines.append(f"rc=$?; echo \"{WINDOW_MARKER} {i} $rc $(date +%s%N)\"")
+    return "\n".join(lines) + "\n"
+
+async def stop_windows(node):
+    # stop a windowed run - skip the rest of the windows and end the current one
+    await run_remote_async([node], f"touch {WINDOW_STOP_FILE}; sudo pkill -INT -x wrk", print_stderr=False)
+
+def run_windows(node, wrk_script, threads, windows, on_window):
+    # run the windows on the node, calling on_window(i, output, rc) as each one finishes
+    # (streamed back while the run is going) - if it returns True, the rest of the windows are skipped
+    # returns the (start, end) time of each window that ran (ns since the epoch, on the node)
+    curr = []
+    stopped = []
+    # (the stop command runs alongside the stream, so the event loop isn't blocked while it does)
+    stop_tasks = []
+    times = {}
+    def on_line(line):
+        if line.startswith(f"{WINDOW_START_MARKER} "):
+            _, i, start_ns = line.split()
+            times[int(i)] = (int(start_ns), None)
+            return
+        if not line.startswith(f"{WINDOW_MARKER} "):
+            curr.append(line)
+            return
+        _, i, rc, end_ns = line.split()
+        times[int(i)] = (times.get(int(i), (None,))[0], int(end_ns))
+        out = "\n".join(curr)
+        curr.clear()
+        if not stopped and on_window(int(i), out, int(rc)):
+            stopped.append(int(i))
+            stop_tasks.append(asyncio.get_running_loop().create_task(stop_windows(node)))
+    
+    async def stream(script):
+        result = await run_stream(get_ssh_cmd(node, "bash -s"), on_line, print_stderr=False, node=node, input=script)
+        await asyncio.gather(*stop_tasks)
+        return result
+
+    result = asyncio.run(stream(make_window_script(wrk_script, threads, windows)))
+    assert(result.rc == 0)
+    return times
+
+def parse_window(i, out, rc):
+    parsed = parse_output(out)
+    return {"i": i, "rc": rc, "rate": parse_rate(out), "parsed": parsed, "spectrum": to_spectrum(out)}
+
+def find_steady_state(windows, n=3, tol=0.2, percentile=99):
+    # index of the first window of the first n windows in a row whose p99 and achieved rate 
+    # are all within tol of their mean over those windows (or None if not converged yet)
+    for s in range(len(windows) - n + 1):
+        group = windows[s:s+n]
+        converged = True
+        for vals in [[get_percentile(w["parsed"][2], percentile) for w in group], [w["rate"] for w in group]]:
+            if None in vals:
+                converged = False
+                break
+            mean = sum(vals) / n
+            if mean <= 0 or max([abs(v - mean) for v in vals]) > tol * mean:
+                converged = False
+        if converged:
+            return s
+    return None
+
+def run_windowed_workload(nodes, wrk_type=0, input_rate=2000, time=30, warmup=30, threads=2, window=30, 
+                          converge_windows=3, converge_tol=0.2, stats=False, power=False, cpufreq=False):
+    # run the load in back to back windows - the warmup ends once converge_windows windows in a row agree
+    # (or after warmup seconds), then time seconds of windows are measured from there and merged
+    # (each window's latencies only cover what is left of it after wrk2's calibration)
+    assert(window >= MIN_WINDOW)
+    wrk_script = get_current_service_workloads()[wrk_type]["workload_cmd"]
+    max_warmup = math.ceil(warmup / window)
+    num_measure = math.ceil(time / window)
+    print(f"running {input_rate} in {window} second windows, at most {max_warmup} warmup window(s) "
+          f"then {num_measure} measured, at {get_datetime(compact=False)}", flush=True)
+    start_samplers(nodes, (max_warmup + num_measure) * window, stats=stats, power=power, cpufreq=cpufreq)
+
+    windows = []
+    state = {"start": None, "converged": False}
+    def on_window(i, out, rc):
+        w = parse_window(i, out, rc)
+        windows.append(w)
+        print(f"window {i}: achieved {w['rate']} req/s, p99 {get_percentile(w['parsed'][2])} ms", flush=True)
+        if state["start"] is None:
+            state["start"] = find_steady_state(windows, converge_windows, converge_tol)
+            state["converged"] = state["start"] is not None
+            if state["start"] is None and len(windows) >= max_warmup + converge_windows - 1:
+                # not converged within the max warmup, measure from there on anyway
+                state["start"] = max_warmup
+            if state["start"] is not None:
+                print(f"warmup ended after {state['start']} window(s) (converged: {state['converged']})", flush=True)
+        return state["start"] is not None and len(windows) - state["start"] >= num_measure
+
+    times = run_windows(nodes[0], wrk_script, threads, [(input_rate, window)] * (max_warmup + num_measure), on_window)
+    start = state["start"] if state["start"] is not None else 0
+    kept = windows[start:start+num_measure]
+    assert(kept)
+
+    info = {"warmup": {"windows": start, "secs": start * window, "converged": state["converged"]},
+            "calibration": WRK2_CALIBRATION,
+            "windows": []}
+    for i, w in enumerate(windows):
+        w_start, w_end = times.get(w["i"], (None, None))
+        # (lat_start_ns is where the window's latencies start, after the calibration)
+        info["windows"].append({"i": w["i"], "rate": w["rate"], "lat_dist": w["parsed"][2], "kept": start <= i < start + len(kept),
+                                "start_ns": w_start, "end_ns": w_end, 
+                                "lat_start_ns": min(w_start + WRK2_CALIBRATION * 10**9, w_end) if None not in [w_start, w_end] else None})
+    rates = [w["rate"] for w in kept]
+    info["rate"] = sum(rates) / len(rates) if None not in rates else None
+    parsed, info["spectrum"] = merge_parsed([w["parsed"] for w in kept], [w["spectrum"] for w in kept])
+    return parsed, info
+
+def run_profile_workload(nodes, segments, wrk_type=0, warmup=0, threads=2, stats=False, power=False, cpufreq=False):
+    # run a time varying load (see load_profiles.py) as back to back windows, after warmup seconds at
+    # its first rate - returns the merged result of the profile and the info with a latency sample per window
+    # (the windows are separate wrk2 runs, so the load stops briefly between them and each one's latencies 
+    # only start after its calibration)
+    wrk_script = get_current_service_workloads()[wrk_type]["workload_cmd"]
+    windows = ([(segments[0][0], warmup)] if warmup > 0 else []) + segments
+    # (index of the first window of the profile itself)
+    first = len(windows) - len(segments)
+    total = sum([s for _, s in windows])
+    print(f"running a load profile of {len(segments)} window(s) over {total - warmup if first else total} seconds "
+          f"(after {warmup if first else 0} seconds of warmup), at {get_datetime(compact=False)}", flush=True)
+    start_samplers(nodes, total, stats=stats, power=power, cpufreq=cpufreq)
+
+    samples = {}
+    def on_window(i, out, rc):
+        samples[i] = parse_window(i, out, rc)
+        if i >= first:
+            print(f"window {i - first}: offered {windows[i][0]}, achieved {samples[i]['rate']} req/s, "
+                  f"p99 {get_percentile(samples[i]['parsed'][2])} ms", flush=True)
+        return False
+
+    times = run_windows(nodes[0], wrk_script, threads, windows, on_window)
+    kept = [samples[i] for i in range(first, len(windows)) if i in samples]
+    assert(kept)
+
+    # times are relative to the start of the profile (on the master's clock)
+    start_ns = times[first][0]
+    info = {"profile": {"start_ns": start_ns, "warmup": warmup if first else 0, "continuous": False, 
+                        "calibration": WRK2_CALIBRATION, "windows": []}}
+    # (the first window's gap is after the warmup, if any)
+    prev_end = times.get(first - 1, (None, None))[1] if first else None
+    for w in kept:
+        rate, secs = windows[w["i"]]
+        w_start, w_end = times[w["i"]]
+        # lat_t: where the window's latencies start (after the calibration), gap: seconds with no load before it
+        info["profile"]["windows"].append({"t": (w_start - start_ns) / 1e9, "end": (w_end - start_ns) / 1e9,
+                                           "lat_t": min(w_start - start_ns + WRK2_CALIBRATION * 10**9, w_end - start_ns) / 1e9,
+                                           "gap": (w_start - prev_end) / 1e9 if prev_end is not None else 0.0,
+                                           "secs": secs, "offered": rate, "rate": w["rate"],
+                                           "lat_dist": w["parsed"][2], "spectrum": w["spectrum"]})
+        prev_end = w_end
+    # achieved rate over the whole profile (weighted by the length of each window)
+    rates = [w["rate"] for w in kept]
+    if None not in rates:
+        info["rate"] = sum([r * windows[w["i"]][1] for r, w in zip(rates, kept)]) / sum([windows[w["i"]][1] for w in kept])
+    else:
+        info["rate"] = None
+    parsed, info["spectrum"] = merge_parsed([w["parsed"] for w in kept], [w["spectrum"] for w in kept])
+    return parsed, info
+
 def str_to_float(str):
     # extract whatever is a digit or a decimal point from the string
     float_str = ''.join(c for c in str if c.isdigit() or c == '.')
@@ -126,6 +500,28 @@ def parse_output(wrk_output):
             break
     return avg_lat, req_sec, lat_dist
 
+def parse_rate(wrk_output):
+    # total achieved requests/sec (the Req/Sec line is per thread)
+    for line in wrk_output.split("\n"):
+        line = line.strip()
+        if line.startswith("Requests/sec:"):
+            return float(line.split()[1])
+    return None
+
+def merge_parsed(parsed, spectra):
+    # combine the parsed outputs of several wrk2 runs (clients or windows) into the parse_output form, 
+    # merging their full latency distributions (not averaging their percentiles)
+    spectrum = merge_spectra(spectra)
+    avg_lat = spectrum_stats(spectrum)
+    lat_dist = spectrum_percentiles(spectrum, LAT_PERCENTILES) if len(spectrum) else []
+    # Req/Sec is per thread, so average it over the runs (max of the max)
+    req_secs = [p[1] for p in parsed if p[1]]
+    req_sec = []
+    if req_secs:
+        req_sec = [sum([r[i] for r in req_secs]) / len(req_secs) for i in range(len(req_secs[0]))]
+        req_sec[2] = max([r[2] for r in req_secs])
+    return (avg_lat, req_sec, lat_dist), spectrum
+
 def parse_wrk_output(wrk_output, cmd, out_file=None, no_write=False):
     # make new directory for outputs
     dir = "outputs/"
@@ -146,14 +542,76 @@ def parse_wrk_output(wrk_output, cmd, out_file=None, no_write=False):
     
     return parse_output(wrk_output)
 
+def get_packed_stats(nodes, docker=True, power=True, cpufreq=True):
+    # pack each node's samples into a compressed columnar file on the node, then copy them all back at once
+    streams = []
+    if docker:
+        streams.append("--cgroup cgroup_stats.bin" if STATS_SAMPLER == "cgroup" else "--docker stats.txt")
+    if POWER_SAMPLER == "sysfs" and (power or cpufreq):
+        streams.append("--power-freq power_freq.bin")
+    elif power:
+        streams.append("--rapl rapl.txt")
+    if cpufreq and POWER_SAMPLER != "sysfs":
+        streams.append("--cpufreq cpufreq.txt")
+    packed = asyncio.run(run_remote_async(nodes, f"./pack_stats.py stats.pack {' '.join(streams)}", print_stderr=False))
+    local_dir = open_path(f"outputs/{get_current_service_name()}/stats/packs")
+    paths = [f"{local_dir}{node.split('@')[-1]}.pack" for node in nodes]
+    fetched = asyncio.run(fetch_remote_async(nodes, "stats.pack", paths, check=True))
+
+    node_stats, node_rapls, node_cpufreqs, node_cgroups, node_power_freqs = [], [], [], [], []
+    for node, path, p, f in zip(nodes, paths, packed, fetched):
+        if p.rc != 0 or f.rc != 0:
+            stats, rapl, freqs, cgroup, power_freq = None, None, None, None, None
+        else:
+            with open(path, "rb") as fp:
+                stats, rapl, freqs, cgroup, power_freq = unpack_node_stats(fp.read())
+            print(f"{node}: {os.path.getsize(path)} bytes packed, {len(stats['names']) if stats else 0} container(s)", flush=True)
+            if cgroup is not None:
+                print(f"{node} cgroup sampler: {get_overhead_summary(cgroup['header'], cgroup['overhead'])}", flush=True)
+        if docker:
+            node_stats.append(stats)
+        if power:
+            node_rapls.append(rapl)
+        if cpufreq:
+            node_cpufreqs.append(freqs)
+        node_cgroups.append(cgroup)
+        node_power_freqs.append(power_freq)
+    if POWER_SAMPLER == "sysfs" and (power or cpufreq):
+        return node_stats, node_rapls, node_cpufreqs, node_cgroups, node_power_freqs
+    if docker and STATS_SAMPLER == "cgroup":
+        return node_stats, node_rapls, node_cpufreqs, node_cgroups
+    return node_stats, node_rapls, node_cpufreqs
+
 def get_stats(nodes, docker=True, power=True, cpufreq=True, raw=False):
+    if PACK_STATS and not raw:
+        return get_packed_stats(nodes, docker=docker, power=power, cpufreq=cpufreq)
     node_stats = []
     node_rapls = []
     node_cpufreqs = []
-    if docker:
+    # raw cgroup samples of each node (with the cgroup sampler)
+    node_cgroups = []
+    # raw power/frequency samples of each node (with the sysfs sampler)
+    node_power_freqs = []
+    # the unparsed remote results of each sampler that ran (for raw)
+    docker_stats, rapl_stats, cpufreq_stats = None, None, None
+    if docker and STATS_SAMPLER == "cgroup":
+        cgroup_stats = asyncio.run(run_remote_async(nodes, "base64 -w0 cgroup_stats.bin", print_stderr=False))
+        docker_stats = cgroup_stats
+        for node, cgroup_stat in zip(nodes, cgroup_stats):
+            if cgroup_stat.rc != 0 or not cgroup_stat.stdout:
+                node_stats.append(None)
+                node_cgroups.append(None)
+                continue
+            header, records, overhead = read_cgroup_stats(base64.b64decode(cgroup_stat.stdout))
+            print(f"{node} cgroup sampler: {get_overhead_summary(header, overhead)}", flush=True)
+            node_cgroups.append({"header": header, "records": records, "overhead": overhead})
+            # (docker stats style too, for the existing stats tools)
+            node_stats.append(to_docker_stats(header, records))
+    elif docker:
         docker_stats = asyncio.run(run_remote_async(nodes, f"cat stats.txt"))
         
-        stats_format = ["ID", "Name", "CPUPerc", "MemUsage", "NetIO", "BlockIO", "PIDs", "MemPerc"]
+        # (each line starts with the wall clock and monotonic time it was read at)
+        stats_format = ["Wall", "Mono", "ID", "Name", "CPUPerc", "MemUsage", "NetIO", "BlockIO", "PIDs", "MemPerc"]
         for docker_stat in docker_stats:
             # if error code non-zero, then command failed
             if docker_stat[2] != 0:
@@ -163,9 +621,10 @@ def get_stats(nodes, docker=True, power=True, cpufreq=True, raw=False):
             s_data = docker_stat[0].split('\n')
             s_data = [d for d in s_data if d.strip() != ""]
             # remove the clear screen and home cursor escape sequences
-            s_data = [d.strip("\x1b[2J\x1b[H2") for d in s_data]
-            # for each line of data, split by comma into list of stats
+            s_data = [d.replace("\x1b[2J", "").replace("\x1b[H", "").strip() for d in s_data]
+            # for each line of data, split by comma into list of stats (skipping partly written lines)
             s_data = [d.split(',') for d in s_data]
+            s_data = [d for d in s_data if len(d) == len(stats_format)]
 
             # loop through the measurements and extract the data into dicts - one per measurement
             data_dicts = []
@@ -176,7 +635,24 @@ def get_stats(nodes, docker=True, power=True, cpufreq=True, raw=False):
                 data_dicts.append(data_dict)
             node_stats.append(data_dicts)
         
-    if power:
+    if POWER_SAMPLER == "sysfs" and (power or cpufreq):
+        power_freqs = asyncio.run(run_remote_async(nodes, "base64 -w0 power_freq.bin", print_stderr=False))
+        # (one stream has both)
+        rapl_stats = power_freqs if power else None
+        cpufreq_stats = power_freqs if cpufreq else None
+        for power_freq in power_freqs:
+            pf = None
+            if power_freq.rc == 0 and power_freq.stdout:
+                header, records = read_power_freq(base64.b64decode(power_freq.stdout))
+                pf = {"header": header, "records": records}
+            node_power_freqs.append(pf)
+            # (rapl totals and cpufreq measurements too, for the existing stats tools)
+            if power:
+                node_rapls.append(power_freq_to_rapl(pf["header"], pf["records"]) if pf is not None else None)
+            if cpufreq:
+                node_cpufreqs.append(power_freq_to_cpufreq(pf["header"], pf["records"]) if pf is not None else None)
+
+    if power and POWER_SAMPLER != "sysfs":
         rapl_stats = asyncio.run(run_remote_async(nodes, f"cat rapl.txt"))
         # loop through the energy stats for each node
         for rapl_stat in rapl_stats:
@@ -193,7 +669,7 @@ def get_stats(nodes, docker=True, power=True, cpufreq=True, raw=False):
             p_data = {d[0]: float(d[-1]) for d in p_data}
             node_rapls.append(p_data)
     
-    if cpufreq:
+    if cpufreq and POWER_SAMPLER != "sysfs":
         cpufreq_stats = asyncio.run(run_remote_async(nodes, f"cat cpufreq.txt"))
         # loop through the recorded cpufreqs for each node
         for cpufreq_stat in cpufreq_stats:
@@ -203,78 +679,565 @@ def get_stats(nodes, docker=True, power=True, cpufreq=True, raw=False):
                 continue
             # separate out each measurement by line and remove empty lines
             c_data = cpufreq_stat[0].split('\n')
-            # measurements are separated by a blank line
-            all_data = []
+            # measurements are separated by a blank line, and start with a "@ <wall> <mono>" line
+            all_data, walls, monos = [], [], []
             last = 0
             for i, d in enumerate(c_data):
                 if d.strip() == '':
+                    block = c_data[last:i]
+                    last = i + 1
+                    if not block or not block[0].startswith('@'):
+                        continue
+                    _, wall, mono = block[0].split()
                     # convert to list of ints - remove decimal point
-                    curr_data = [x.split('.')[0] for x in c_data[last:i]]
+                    curr_data = [x.split('.')[0] for x in block[1:]]
                     all_data.append(curr_data)
-                    last = i + 1
+                    walls.append(float(wall))
+                    monos.append(float(mono))
                     
-            node_cpufreqs.append(all_data)
+            node_cpufreqs.append({"freqs": all_data, "wall": walls, "mono": monos})
             
     if raw:
         return docker_stats, rapl_stats, cpufreq_stats
-            
+    
+    if node_power_freqs:
+        return node_stats, node_rapls, node_cpufreqs, node_cgroups, node_power_freqs
+    if node_cgroups:
+        return node_stats, node_rapls, node_cpufreqs, node_cgroups
     return node_stats, node_rapls, node_cpufreqs
 
+def parse_perf_stat(out):
+    # (counts of each container, start, end) from the perf_cgroups.sh output - counts are {container: {event: count}}
+    # (None if the event couldn't be counted), along with the fraction of the time each one was counted
+    names, counts = {}, {}
+    start, end = None, None
+    for line in out.split("\n"):
+        if line.startswith("# cgroup "):
+            _, _, cgroup, name = line.split()
+            names[cgroup] = name
+        elif line.startswith("# start ") or line.startswith("# end "):
+            t = float(line.split()[-1])
+            start, end = (t, end) if line.startswith("# start ") else (start, t)
+        elif line.strip() and not line.startswith("#"):
+            # count, unit, event, cgroup, run time, percentage of the time counted, ...
+            fields = line.split(",")
+            if len(fields) < 6 or fields[3] not in names:
+                continue
+            c = counts.setdefault(names[fields[3]], {"counted": 1.0})
+            try:
+                c[fields[2]] = float(fields[0])
+                c["counted"] = min(c["counted"], float(fields[5]) / 100 if fields[5] else 1.0)
+            except ValueError:
+                # (<not counted> or <not supported>)
+                c[fields[2]] = None
+    return counts, start, end
+
+def add_perf_ratios(c):
+    # instructions per cycle and miss rates (None if their counts are missing)
+    def ratio(a, b):
+        return c[a] / c[b] if c.get(a) is not None and c.get(b) else None
+    c["ipc"] = ratio("instructions", "cycles")
+    c["cache_miss_rate"] = ratio("cache-misses", "cache-references")
+    c["branch_miss_rate"] = ratio("branch-misses", "branch-instructions")
+    return c
+
+def get_perf_stop_cmd(file="perf_stat.txt", timeout=PERF_STOP_TIMEOUT):
+    # interrupt perf_cgroups.sh's perf stat (it's still counting if the run ended before its window, e.g. a windowed
+    # run that stopped early) and wait for the script to write the end of its counts, then print them
+    polls = int(timeout / 0.1)
+    return (f"sudo pkill -INT -f '^perf stat -a -x, .*-o {file}'; "
+            f"for i in \\$(seq {polls}); do grep -q '^# end ' {file} && break; sleep 0.1; done; cat {file}")
+
+def get_perf_stats(nodes):
+    # perf stat counts of each service over the last run, summed over its containers (on every node) - and the
+    # counts of each container
+    perf_stats = asyncio.run(run_remote_async(nodes, get_perf_stop_cmd(), print_stderr=False))
+    services, containers = {}, {}
+    secs = []
+    for j, perf_stat in enumerate(perf_stats):
+        counts, start, end = parse_perf_stat(perf_stat.stdout)
+        if perf_stat.rc != 0 or start is None or end is None:
+            # (without the end, the counts are missing or partial)
+            print(f"perf counts of node {nodes[j]} are incomplete (rc {perf_stat.rc}): {perf_stat.stderr}", flush=True)
+            assert(False)
+        secs.append(end - start)
+        for name, c in counts.items():
+            containers[name] = add_perf_ratios(dict(c, node=j))
+            svc = services.setdefault(get_service_name(name), {"nodes": [], "replicas": 0, "counted": 1.0})
+            svc["nodes"] = sorted(set(svc["nodes"] + [j]))
+            svc["replicas"] += 1
+            svc["counted"] = min(svc["counted"], c["counted"])
+            for e in PERF_EVENTS:
+                if e in svc and svc[e] is None:
+                    continue
+                svc[e] = None if c.get(e) is None else svc.get(e, 0) + c[e]
+    for svc in services.values():
+        add_perf_ratios(svc)
+    return {"events": PERF_EVENTS, "secs": max(secs) if secs else None, "services": services, "containers": containers}
+
+def print_perf_stats(perf):
+    def fmt(v, spec):
+        return "-" if v is None else format(v, spec)
+    for name, svc in sorted(perf["services"].items()):
+        print(f"  {name}: ipc {fmt(svc['ipc'], '.2f')}, cache miss rate {fmt(svc['cache_miss_rate'], '.3f')}, "
+              f"branch miss rate {fmt(svc['branch_miss_rate'], '.4f')}, "
+              f"context switches {fmt(svc.get('context-switches'), '.0f')}", flush=True)
+
+def expand_sweep(loads):
+    assert(len(loads) == 4)
+    # unpack variables
+    start, stop, step, add = loads
+    loads = []
+    i = start
+    while i <= stop:
+        loads.append(i)
+        if add == 0:
+            i += step
+        else:
+            i *= step
+    return loads
+
+def get_restart_specs(restart=None, incremental=False):
+    # requested placements/resources to diff the running stack against
+    if restart is not None and incremental:
+        return get_compose_specs(restart)
+    return None
+
+def prepare_point(nodes, restart=None, pin=False, deploy_timeout=DEPLOY_TIMEOUT, specs=None):
+    # get the swarm ready for a load point - returns the info about it (e.g. how long each service took to be ready)
+    start = time.perf_counter()
+    info = {}
+    # make sure every node has an open (pooled) ssh connection before the run
+    for node in nodes:
+        open_pool_conn(node)
+    if restart is not None and specs is not None:
+        # only apply the changes (falls back to a full redeploy if needed)
+        info["update"], info["ready"] = update_stack(nodes, specs, dsb_path=DSB_PATH, deploy_timeout=deploy_timeout)
+        if pin:
+            pin_cpus(nodes, restart)
+    elif restart is not None:
+        # cleanup previous stack/dangling containers
+        cleanup(nodes)
+        # checking for no containers before starting stack
+        check_no_containers(nodes)
+        _, info["ready"] = restart_stack(nodes, pin=restart if pin else None, dsb_path=DSB_PATH, 
+                                         cleanup_nodes=False, deploy_timeout=deploy_timeout)
+    info["timing"] = {"prepare": time.perf_counter() - start}
+    # (to line the samples of each node up afterwards)
+    if CLOCK_OFFSETS is not None:
+        info["clocks"] = CLOCK_OFFSETS
+    return info
+
+def measure_point(nodes, l, info, runtime=30, threads=2, workload=0, warmup=0, stats=False, power=False, 
+                  cpufreq=False, clients=None, windowed=False, window=30, converge_windows=3, converge_tol=0.2, mix=None):
+    # run the workload for a load point - returns the (load, parsed output, info) tuple
+    start = time.perf_counter()
+    wall_start = time.time()
+    if windowed:
+        # warmup until converged, then merge the measured windows
+        assert(clients is None and mix is None)
+        parsed, windowed_info = run_windowed_workload(nodes, wrk_type=workload, input_rate=l, time=runtime, warmup=warmup, 
+                                                      threads=threads, window=window, converge_windows=converge_windows, 
+                                                      converge_tol=converge_tol, stats=stats, power=power, cpufreq=cpufreq)
+        info.update(windowed_info)
+        print(f"load {l} done at {get_datetime(compact=False)}")
+        out = (l, parsed, info)
+    else:
+        # warmup first, so the wall clock time below only covers the measurement
+        run_warmup(nodes, wrk_type=workload, input_rate=l, warmup=warmup, threads=threads, clients=clients, mix=mix)
+        info["wall_warmup"] = [wall_start, time.time()] if warmup > 0 else None
+        wall_start = time.time()
+        # (several clients or workloads all start together, CLIENT_START_LEAD seconds after they're launched)
+        if clients is not None or mix is not None:
+            wall_start += CLIENT_START_LEAD
+        # run the workload on the swarm, collect the output from master node
+        cp, cmd = run_workload(nodes, wrk_type=workload, input_rate=l, 
+                               time=runtime, threads=threads, warmup=0, 
+                               stats=stats, power=power, cpufreq=cpufreq, clients=clients, mix=mix)
+        print(f"load {l} done at {get_datetime(compact=False)}")
+        out = parse_load_point(l, cp, cmd, info, clients=clients, mix=mix)
+    info.setdefault("timing", {})["measure"] = time.perf_counter() - start
+    # (wall clock time of the measurement, after any warmup, for lining it up with the samples - a windowed 
+    # run has the times of each window too)
+    info["wall"] = [wall_start, time.time()]
+    # hardware counters of each service, next to its latencies
+    if PERF_EVENTS is not None:
+        info["perf"] = get_perf_stats(nodes)
+    # (without the spectra, they are long)
+    skip = ["spectrum", "clients", "windows", "workloads", "clocks", "perf"]
+    print((l, out[1], {k: v for k, v in info.items() if k not in skip}), flush=True)
+    if mix is not None:
+        for w in info["workloads"]:
+            print(f"  workload {w['workload']} ({w['type']}): offered {w['offered']}, achieved {w['rate']} req/s, "
+                  f"p99 {get_percentile(w['lat_dist'])} ms", flush=True)
+    if "perf" in info:
+        print_perf_stats(info["perf"])
+    return out
+
+def collect_point(nodes, l, stats=False, power=False, cpufreq=False):
+    # fetch and parse the stats recorded during a load point (if any)
+    if stats or power:  
+        return (l, get_stats(nodes, docker=stats, power=power, cpufreq=cpufreq))
+    return None
+
+def run_load_point(nodes, l, runtime=30, threads=2, workload=0, warmup=0, stats=False, power=False, 
+                   cpufreq=False, restart=None, pin=False, deploy_timeout=DEPLOY_TIMEOUT, specs=None, clients=None,
+                   windowed=False, window=30, converge_windows=3, converge_tol=0.2, mix=None):
+    # run a single load point - returns the (load, parsed output, info) tuple and the stats (if any)
+    info = prepare_point(nodes, restart=restart, pin=pin, deploy_timeout=deploy_timeout, specs=specs)
+    out = measure_point(nodes, l, info, runtime=runtime, threads=threads, workload=workload, warmup=warmup, 
+                        stats=stats, power=power, cpufreq=cpufreq, clients=clients, windowed=windowed, 
+                        window=window, converge_windows=converge_windows, converge_tol=converge_tol, mix=mix)
+    return out, collect_point(nodes, l, stats=stats, power=power, cpufreq=cpufreq)
+
+def parse_load_point(l, cp, cmd, info, clients=None, mix=None):
+    if mix is not None:
+        # latencies of each workload (run against the same deployment at once), and the merged result of all of them
+        workloads = get_current_service_workloads()
+        spectra = [to_spectrum(o) for o in cp]
+        info["workloads"] = [{"workload": w, "type": workloads[w]["workload_type"], "share": share, "offered": r,
+                              "rate": parse_rate(o), "lat_dist": parse_output(o)[2], "spectrum": s} 
+                             for (w, share), r, o, s in zip(mix, split_mix(l, mix), cp, spectra)]
+        rates = [w["rate"] for w in info["workloads"]]
+        info["rate"] = sum(rates) if None not in rates else None
+        parsed, info["spectrum"] = merge_parsed([parse_output(o) for o in cp], spectra)
+        return (l, parsed, info)
+    if clients is not None:
+        # achieved throughput and latencies of each client, and the merged result over all of them
+        spectra = [to_spectrum(o) for o in cp]
+        info["clients"] = [{"node": c, "rate": parse_rate(o), "lat_dist": parse_output(o)[2], "spectrum": s} 
+                           for c, o, s in zip(clients, cp, spectra)]
+        rates = [c["rate"] for c in info["clients"]]
+        info["rate"] = sum(rates) if None not in rates else None
+        parsed, info["spectrum"] = merge_parsed([parse_output(o) for o in cp], spectra)
+        return (l, parsed, info)
+    # achieved throughput (total requests/sec over all threads)
+    info["rate"] = parse_rate(cp)
+    # full latency spectrum (see latency_spectrum.py)
+    info["spectrum"] = to_spectrum(cp)
+    # parse the output into standardized form (from string)
+    return (l, parse_wrk_output(cp, cmd, f"load_sweep", no_write=True), info)
+
+def get_ci(values, level=0.95):
+    # (mean, low, high) - t-distribution confidence interval of the mean of the values
+    n = len(values)
+    mean = sum(values) / n
+    if n < 2:
+        return mean, None, None
+    std = math.sqrt(sum([(v - mean) ** 2 for v in values]) / (n - 1))
+    half = float(t_dist.ppf((1 + level) / 2, n - 1)) * std / math.sqrt(n)
+    return mean, mean - half, mean + half
+
+def get_point_metrics(out):
+    # value of each repetition metric for a load point
+    _, (avg_lat, _, lat_dist), info = out
+    return {"avg": avg_lat[0] if avg_lat else None, "p50": get_percentile(lat_dist, 50), 
+            "p99": get_percentile(lat_dist, 99), "rate": info.get("rate")}
+
+def aggregate_reps(l, outs, level=0.95):
+    # one load point from repetitions of it - the mean of each latency/throughput number, all the requests
+    # merged into one spectrum, and the confidence interval of every repetition metric
+    parsed = [o[1] for o in outs]
+    means = []
+    for i in range(3):
+        lists = [p[i] for p in parsed if p[i]]
+        means.append([sum(v) / len(v) for v in zip(*lists)] if lists else [])
+    info = dict(outs[-1][2])
+    info["spectrum"] = merge_spectra([o[2]["spectrum"] for o in outs if "spectrum" in o[2]])
+    if "workloads" in info:
+        # each workload's requests over all the repetitions too
+        info["workloads"] = [dict(w) for w in info["workloads"]]
+        for i, w in enumerate(info["workloads"]):
+            w["spectrum"] = merge_spectra([o[2]["workloads"][i]["spectrum"] for o in outs])
+            w["lat_dist"] = spectrum_percentiles(w["spectrum"], LAT_PERCENTILES) if len(w["spectrum"]) else []
+            rates = [o[2]["workloads"][i]["rate"] for o in outs]
+            w["rate"] = sum(rates) / len(rates) if None not in rates else None
+    metrics = [get_point_metrics(o) for o in outs]
+    rates = [m["rate"] for m in metrics]
+    info["rate"] = sum(rates) / len(rates) if None not in rates else None
+    info["ci"] = {}
+    for m in REP_METRICS:
+        values = [v[m] for v in metrics]
+        if None not in values:
+            info["ci"][m] = get_ci(values, level)
+    info["rep_infos"] = [dict({k: v for k, v in o[2].items() if k != "spectrum"}, lat_dist=o[1][2]) for o in outs]
+    return (l, tuple(means), info)
+
+def run_repeated_point(nodes, l, reps=None, cooldown=10, **kwargs):
+    # run a load point until the confidence interval of reps["metric"] is within reps["width"] of its mean
+    # (at least reps["min"] and at most reps["max"] times) - just once if no reps given
+    if reps is None:
+        return run_load_point(nodes, l, **kwargs)
+    metric, level = reps["metric"], reps["level"]
+    outs = []
+    # the stats of every repetition (each one's samplers only cover that repetition)
+    rep_stats = []
+    converged = False
+    for i in range(reps["max"]):
+        if outs:
+            print(f"waiting {cooldown} seconds before next repetition", flush=True)
+            time.sleep(cooldown) # sleep to allow for cool down
+        out, load_stats = run_load_point(nodes, l, **kwargs)
+        outs.append(out)
+        rep_stats.append(load_stats[1] if load_stats is not None else None)
+        values = [get_point_metrics(o)[metric] for o in outs]
+        if None in values:
+            # metric missing (e.g. failed run), no point repeating
+            break
+        mean, low, high = get_ci(values, level)
+        if low is not None:
+            print(f"load {l} repetition {i+1}: {metric} = {mean:.3f} [{low:.3f}, {high:.3f}] ({level*100:g}% ci)", flush=True)
+        if len(outs) >= reps["min"] and low is not None and (high - low) / 2 <= reps["width"] * abs(mean):
+            converged = True
+            break
+    out = aggregate_reps(l, outs, level)
+    out[2]["reps"] = {"n": len(outs), "metric": metric, "values": values, "width": reps["width"], "converged": converged}
+    print(f"load {l}: {len(outs)} repetition(s), cis: {out[2]['ci']}", flush=True)
+    if load_stats is None:
+        return out, None
+    # (load, stats, stats of each repetition) - the stats tools read the second element, which is the last
+    # repetition (the same one as the info's wall/clocks), the third has every repetition in the order of info["rep_infos"]
+    return out, (l, load_stats[1], rep_stats)
+
+def check_saturation(outs, min_rate=MIN_RATE_RATIO, lat_growth=SAT_LAT_GROWTH, percentile=99):
+    # reason the last load point looks saturated (or None) - either the achieved rate fell behind
+    # the offered rate, or the achieved rate stopped growing while the tail latency blew up
+    l, (_, _, lat_dist), info = outs[-1]
+    rate = info.get("rate")
+    if rate is not None and rate < min_rate * l:
+        return f"achieved {rate:.0f} req/s is {rate/l:.2f} of the offered {l}"
+    if len(outs) < 2:
+        return None
+    prev_l, (_, _, prev_dist), prev_info = outs[-2]
+    lat, prev_lat = get_percentile(lat_dist, percentile), get_percentile(prev_dist, percentile)
+    prev_rate = prev_info.get("rate")
+    if None in [lat, prev_lat, rate, prev_rate] or prev_lat <= 0 or l <= prev_l:
+        return None
+    # fraction of the extra offered load that was actually served
+    rate_gain = (rate - prev_rate) / (l - prev_l)
+    if lat / prev_lat >= lat_growth and rate_gain < 0.5:
+        return f"p{percentile} grew {lat/prev_lat:.1f}x ({prev_lat} -> {lat} ms) while only {rate_gain:.2f} of the extra load was served"
+    return None
+
 def run_loads(nodes, loads, runtime=30, threads=2, sweep=False, cooldown=10, 
               workload=0, warmup=0, stats=False, power=False, cpufreq=False,
-              restart=None, pin=False):
+              restart=None, pin=False, deploy_timeout=DEPLOY_TIMEOUT, incremental=False,
+              on_saturation="none", patience=2, min_rate=MIN_RATE_RATIO, lat_growth=SAT_LAT_GROWTH, clients=None,
+              windowed=False, window=30, converge_windows=3, converge_tol=0.2, reps=None, journal=None, done={},
+              pipeline=False, mix=None):
     # if sweep parameters given, override loads
     if sweep:
-        assert(len(loads) == 4)
-        # unpack variables
-        start, stop, step, add = loads
-        loads = []
-        i = start
-        while i <= stop:
-            loads.append(i)
-            if add == 0:
-                i += step
-            else:
-                i *= step
+        loads = expand_sweep(loads)
 
     # lists of outputs to return
     outs = []
     out_stats = []
+    specs = get_restart_specs(restart, incremental)
 
-    # loop through loads to run and get outputs
-    for i, l in enumerate(loads):
-        if restart is not None:
-            # cleanup previous stack/dangling containers
-            cleanup(nodes)
-            # just to be sure, sleep and check again
-            time.sleep(5)
-            # checking for no containers before starting stack
-            check_no_containers(nodes)
-            restart_stack(nodes, pin=restart if pin else None, dsb_path=DSB_PATH)
-        # run the workload on the swarm, collect the output from master node
-        cp, cmd = run_workload(nodes, wrk_type=workload, input_rate=l, 
-                               time=runtime, threads=threads, warmup=warmup, 
-                               stats=stats, power=power, cpufreq=cpufreq)
-        print(f"load {l} done at {get_datetime(compact=False)}")
+    assert(on_saturation in SATURATION_ACTIONS)
+    # number of saturated load points in a row
+    saturated = 0
+
+    measure_args = {"runtime": runtime, "threads": threads, "workload": workload, "warmup": warmup, "stats": stats, 
+                    "power": power, "cpufreq": cpufreq, "clients": clients, "windowed": windowed, "window": window, 
+                    "converge_windows": converge_windows, "converge_tol": converge_tol, "mix": mix}
+    prepare_args = {"restart": restart, "pin": pin, "deploy_timeout": deploy_timeout, "specs": specs}
+    # pipelined: collect a load's stats and prepare the next load in the background during the cooldown
+    # (repeated loads are run one after another)
+    if pipeline and reps is not None:
+        print("repeating loads, not pipelining", flush=True)
+        pipeline = False
+    pool = ThreadPoolExecutor(max_workers=2) if pipeline else None
+    # the (future) info of the next load, if it's being prepared
+    prepared = None
 
-        # parse the output into standardized form (from string)
-        out = (l, parse_wrk_output(cp, cmd, f"load_sweep", no_write=True))
+    # loop through loads to run and get outputs
+    loads = list(loads)
+    i = 0
+    while i < len(loads):
+        l = loads[i]
+        # skip loads already done (in the journal being resumed)
+        ran = l not in done
+        if not ran:
+            print(f"load {l} already done, skipping", flush=True)
+            out, load_stats = done[l]
+        elif pipeline:
+            info = prepared.result() if prepared is not None else prepare_point(nodes, **prepare_args)
+            prepared = None
+            out = measure_point(nodes, l, info, **measure_args)
+            collecting = pool.submit(collect_point, nodes, l, stats=stats, power=power, cpufreq=cpufreq)
+        else:
+            out, load_stats = run_repeated_point(nodes, l, reps=reps, cooldown=cooldown, runtime=runtime, threads=threads, 
+                                                 workload=workload, warmup=warmup, stats=stats, power=power, cpufreq=cpufreq, 
+                                                 restart=restart, pin=pin, deploy_timeout=deploy_timeout, specs=specs, 
+                                                 clients=clients, windowed=windowed, window=window, 
+                                                 converge_windows=converge_windows, converge_tol=converge_tol, mix=mix)
         outs.append(out)
-        print(out, flush=True)
-        
-        # if stats or power, then parse those
-        if stats or power:  
-            load_stats = get_stats(nodes, docker=stats, power=power, cpufreq=cpufreq)
-            out_stats.append((l, load_stats))
+
+        # check if the system has saturated, and stop/coarsen the rest of the sweep
+        reason = check_saturation(outs, min_rate=min_rate, lat_growth=lat_growth)
+        saturated = saturated + 1 if reason is not None else 0
+        if reason is not None:
+            print(f"load {l} looks saturated: {reason}", flush=True)
+        if saturated >= patience and on_saturation != "none" and i != len(loads) - 1:
+            skipped = loads[i+1:]
+            if on_saturation == "stop":
+                loads = loads[:i+1]
+            else:
+                # only run every other remaining load, keeping the highest one
+                # (again if still saturated after `patience` more loads)
+                loads = loads[:i+1] + skipped[::-2][::-1]
+            skipped = [s for s in skipped if s not in loads]
+            if skipped:
+                out[2]["saturation"] = {"reason": reason, "action": on_saturation, "skipped": skipped}
+                print(f"{on_saturation} after load {l}, skipping loads {skipped}", flush=True)
+                saturated = 0
+        i += 1
+        cooldown_start = time.perf_counter()
+        if pipeline and ran:
+            # start getting the next load ready while this one's stats are fetched
+            if i != len(loads) and loads[i] not in done:
+                prepared = pool.submit(prepare_point, nodes, **prepare_args)
+            load_stats = collecting.result()
+        if load_stats is not None:
+            out_stats.append(load_stats)
+        if ran:
+            journal_point(journal, l, out, load_stats)
         
-        # if not the last run, then cooldown
-        if i != len(loads) - 1:
-            print(f"waiting {cooldown} seconds before next load", flush=True)
-            time.sleep(cooldown) # sleep to allow for cool down
+        # if not the last run, then cooldown (for whatever is left of it after fetching the stats)
+        if ran and i != len(loads):
+            remaining = max(0, cooldown - (time.perf_counter() - cooldown_start))
+            print(f"waiting {remaining:.1f} seconds before next load", flush=True)
+            time.sleep(remaining) # sleep to allow for cool down
         print()
-        
+
+    if pool is not None:
+        pool.shutdown()
     return outs, out_stats
-    
+
+def run_profile(nodes, profile, window=30, workload=0, warmup=0, threads=2, stats=False, power=False, cpufreq=False,
+                restart=None, pin=False, deploy_timeout=DEPLOY_TIMEOUT, incremental=False, journal=None, done={}):
+    # run a load profile as a single point - its load is the mean offered rate
+    segments = get_segments(profile, window)
+    l = round(get_offered_rate(segments))
+    if l in done:
+        print("profile already done, skipping", flush=True)
+        out, load_stats = done[l]
+        return [out], [load_stats] if load_stats is not None else []
+    info = prepare_point(nodes, restart=restart, pin=pin, deploy_timeout=deploy_timeout, 
+                         specs=get_restart_specs(restart, incremental))
+    start = time.perf_counter()
+    parsed, profile_info = run_profile_workload(nodes, segments, wrk_type=workload, warmup=warmup, threads=threads, 
+                                                stats=stats, power=power, cpufreq=cpufreq)
+    info.update(profile_info)
+    info["profile"].update({"spec": profile, "segments": segments})
+    info["timing"]["measure"] = time.perf_counter() - start
+    if PERF_EVENTS is not None:
+        info["perf"] = get_perf_stats(nodes)
+    print(f"profile done at {get_datetime(compact=False)}")
+    print((l, parsed, {k: v for k, v in info.items() if k not in ["spectrum", "profile", "clocks", "perf"]}), flush=True)
+    if "perf" in info:
+        print_perf_stats(info["perf"])
+    out = (l, parsed, info)
+    load_stats = collect_point(nodes, l, stats=stats, power=power, cpufreq=cpufreq)
+    journal_point(journal, l, out, load_stats)
+    return [out], [load_stats] if load_stats is not None else []
+
+def get_percentile(lat_dist, percentile=99):
+    # latency (ms) at the given percentile from the lat_dist of parse_output
+    assert(percentile in LAT_PERCENTILES)
+    i = LAT_PERCENTILES.index(percentile)
+    if i >= len(lat_dist):
+        return None
+    return lat_dist[i]
+
+def meets_slo(out, slo, percentile=99, min_rate=MIN_RATE_RATIO):
+    # if the load point met the latency slo and (roughly) kept up with the offered rate
+    l, (_, _, lat_dist), info = out
+    lat = get_percentile(lat_dist, percentile)
+    rate = info.get("rate")
+    lat_ok = lat is not None and lat <= slo
+    rate_ok = rate is None or rate >= min_rate * l
+    return lat_ok and rate_ok, lat, rate
+
+def search_max_load(nodes, start, stop, slo, percentile=99, tolerance=0.05, max_probes=12, 
+                    min_rate=MIN_RATE_RATIO, cooldown=10, restart=None, incremental=False, reps=None, 
+                    journal=None, done={}, **kwargs):
+    # find the highest rate in [start, stop] that meets the slo - ramp up (doubling) from start until 
+    # the slo is missed, then bisect between the last good and first bad rate until within tolerance
+    if start <= 0 or stop < start:
+        # (doubling from 0 would probe 0 forever)
+        print(f"search range [{start}, {stop}] is invalid, it has to start above 0", flush=True)
+        assert(False)
+    outs = []
+    out_stats = []
+    specs = get_restart_specs(restart, incremental)
+    good, bad = None, None
+
+    def probe(l):
+        if l in done:
+            # already done (in the journal being resumed)
+            print(f"load {l} already done, skipping", flush=True)
+            out, load_stats = done[l]
+        else:
+            if outs:
+                print(f"waiting {cooldown} seconds before next load", flush=True)
+                time.sleep(cooldown) # sleep to allow for cool down
+            out, load_stats = run_repeated_point(nodes, l, reps=reps, cooldown=cooldown, restart=restart, specs=specs, **kwargs)
+        ok, lat, rate = meets_slo(out, slo, percentile, min_rate)
+        out[2]["search"] = {"probe": len(outs), "ok": ok, "slo": slo, "percentile": percentile}
+        if l not in done:
+            journal_point(journal, l, out, load_stats)
+        print(f"load {l}: p{percentile} = {lat} ms, achieved {rate} req/s -> {'meets' if ok else 'misses'} slo of {slo} ms", flush=True)
+        print()
+        outs.append(out)
+        if load_stats is not None:
+            out_stats.append(load_stats)
+        return ok
+
+    # ramp up until the slo is missed (or the max rate is reached)
+    l = start
+    while len(outs) < max_probes:
+        if probe(l):
+            good = l
+            if l >= stop:
+                break
+            l = min(l * 2, stop)
+        else:
+            bad = l
+            break
+
+    # the first rate already misses the slo - search below it instead
+    if good is None and bad is not None:
+        good = 0
+    # bisect between the highest good and lowest bad rate
+    while bad is not None and len(outs) < max_probes and bad - good > max(tolerance * bad, 1):
+        l = (good + bad) // 2
+        if probe(l):
+            good = l
+        else:
+            bad = l
+
+    max_load = good if good else None
+    print(f"max load meeting p{percentile} < {slo} ms: {max_load} (after {len(outs)} probes)", flush=True)
+    # keep the usual increasing load order for plotting, the probe order is kept in the info
+    order = sorted(range(len(outs)), key=lambda i: outs[i][0])
+    outs = [outs[i] for i in order]
+    out_stats = [out_stats[i] for i in order] if len(out_stats) == len(order) else out_stats
+    return outs, out_stats, max_load
+
+def get_run_config(args, nodes):
+    # everything that changes the result of a load point (not which loads are run or how long to cool down)
+    skip = ["ssh_comms", "silent", "append", "pickle_file", "no_dump", "cooldown", "resume", "sweep", "loads", 
+            "search", "slo", "slo_percentile", "tolerance", "max_probes", "on_saturation", "patience", "deploy_timeout",
+            "min_rate", "lat_growth", "env_file", "pipeline"]
+    config = {k: v for k, v in vars(args).items() if k not in skip}
+    config["nodes"] = nodes
+    config["service"] = get_current_service_name()
+    # (the contents of the placement csv, not just its name)
+    config["restart_hash"] = get_file_hash(find_file(args.restart, env_csv=True)) if args.restart is not None else None
+    return config
+
 def read_loads(load_file):
     # get list of integer loads from file
     with open(load_file, 'r') as f:
@@ -285,6 +1248,14 @@ def main():
     # parse commandline args and get node names
     args = parse_args()
     nodes, _ = parse_ssh_file(args.ssh_comms)
+    set_stats_sampler(args.stats_sampler, args.stats_interval, args.pack_stats)
+    set_power_sampler(args.power_sampler, args.power_interval)
+    set_perf(args.perf_events if args.perf else None)
+    # --incremental overrides the redeploy between loads that --restart otherwise does
+    assert(not args.incremental or args.restart is not None)
+    if args.incremental:
+        print("--incremental: the stack is not redeployed between loads, only services that differ from "
+              f"{args.restart} are updated in place (containers keep their state from the previous load)", flush=True)
     
     # run the load sweep
     sweep = args.loads is None
@@ -293,19 +1264,77 @@ def main():
     else:
         loads = args.sweep
 
+    # repeat each load until the confidence interval is narrow enough
+    reps = None
+    if args.reps_metric is not None:
+        reps = {"metric": args.reps_metric, "width": args.ci_width, "level": args.ci_level, 
+                "min": args.min_reps, "max": args.max_reps}
+
+    # journal each load point as it finishes (and skip the ones already done if resuming)
+    journal, done = None, {}
+    if not args.no_dump:
+        assert(not args.resume or args.pickle_file is not None)
+        if args.pickle_file is None:
+            args.pickle_file = f"load_sweep_{get_datetime(compact=True)}"
+        journal, done = open_journal(args.pickle_file, get_run_config(args, nodes), resume=args.resume)
+
+    # windows too short to get past wrk2's calibration would measure (almost) nothing
+    if (args.windowed or args.profile is not None) and args.window < MIN_WINDOW:
+        print(f"--window {args.window} is too short, wrk2 calibrates for the first {WRK2_CALIBRATION} seconds of each window "
+              f"(use at least {MIN_WINDOW})", flush=True)
+        assert(False)
+
+    # nodes to run wrk2 on (if not just the master)
+    clients = None
+    # (windowed runs and profiles are streamed from the master only)
+    assert(not ((args.windowed or args.profile is not None) and args.clients is not None))
+    # several workloads at once (from the master)
+    mix = None
+    if args.workloads is not None:
+        assert(args.clients is None and not args.windowed and args.profile is None)
+        mix = get_mix(args.workloads, args.shares)
+        print(f"running workloads {args.workloads} at the same time, with shares {[round(s, 3) for _, s in mix]}", flush=True)
+    if args.clients is not None:
+        clients = [nodes[c] for c in args.clients]
+        setup_clients(clients)
+
     # set the environment variables for the Docker containers
     if args.restart is not None:
-        set_compose_env(nodes, args.compose_file, args.restart, False)
+        set_compose_env(nodes, args.compose_file, args.restart, False, env_file=args.env_file)
+
+    # offsets of the nodes' clocks, so the samples of every node (and the latencies) can be lined up
+    # and the clients all start at the same moment
+    set_clock_offsets(measure_clock_offsets(nodes))
 
-    data, stats = run_loads(nodes, loads, runtime=args.time, threads=args.threads, sweep=sweep, 
-                            cooldown=args.cooldown, workload=args.workload, warmup=args.warmup,
-                            power=args.power, stats=args.stats, cpufreq=args.cpufreq, restart=args.restart,
-                            pin=args.pin)
+    if args.profile is not None:
+        data, stats = run_profile(nodes, args.profile, window=args.window, workload=args.workload, warmup=args.warmup,
+                                  threads=args.threads, stats=args.stats, power=args.power, cpufreq=args.cpufreq,
+                                  restart=args.restart, pin=args.pin, deploy_timeout=args.deploy_timeout, 
+                                  incremental=args.incremental, journal=journal, done=done)
+    elif args.search is not None:
+        assert(args.slo is not None)
+        data, stats, _ = search_max_load(nodes, args.search[0], args.search[1], args.slo, percentile=args.slo_percentile,
+                                         tolerance=args.tolerance, max_probes=args.max_probes, min_rate=args.min_rate,
+                                         cooldown=args.cooldown, restart=args.restart, incremental=args.incremental,
+                                         runtime=args.time, threads=args.threads, workload=args.workload, warmup=args.warmup,
+                                         power=args.power, stats=args.stats, cpufreq=args.cpufreq, pin=args.pin, 
+                                         deploy_timeout=args.deploy_timeout, clients=clients, windowed=args.windowed,
+                                         window=args.window, converge_windows=args.converge_windows, 
+                                         converge_tol=args.converge_tol, reps=reps, journal=journal, done=done, mix=mix)
+    else:
+        data, stats = run_loads(nodes, loads, runtime=args.time, threads=args.threads, sweep=sweep, 
+                                cooldown=args.cooldown, workload=args.workload, warmup=args.warmup,
+                                power=args.power, stats=args.stats, cpufreq=args.cpufreq, restart=args.restart,
+                                pin=args.pin, deploy_timeout=args.deploy_timeout, incremental=args.incremental,
+                                on_saturation=args.on_saturation, patience=args.patience, min_rate=args.min_rate,
+                                lat_growth=args.lat_growth, clients=clients, windowed=args.windowed, window=args.window,
+                                converge_windows=args.converge_windows, converge_tol=args.converge_tol, reps=reps,
+                                journal=journal, done=done, pipeline=args.pipeline, mix=mix)
     
     # dump the data (latencies, etc.) to pickle file
     if not args.no_dump:
-        pickle_file_out = args.pickle_file if args.pickle_file is not None else f"load_sweep_{get_datetime(compact=True)}"
-        data_dump(data, pickle_file_out, append=args.append)
+        journal.close()
+        data_dump(data, args.pickle_file, append=args.append)
     else:
         print("skipping data dump...", flush=True)
     
@@ -0,0 +1,171 @@
+from helpers import *
+import argparse
+import csv
+import itertools
+import queue
+import threading
+
+SCHEDULER_DIR = "outputs/scheduler"
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("ssh_comms", metavar="ssh-comms", type=str, help="text file with ssh commands line by line")
+    parser.add_argument("matrix", type=str, help="json file with the experiment matrix (csvs, workloads, sweeps and extra run_workload.py args)")
+    parser.add_argument("--partition-size", "-n", type=int, default=5, help="number of nodes in each swarm")
+    parser.add_argument("--name", type=str, default=None, help="name of this set of experiments (default: timestamp)")
+    parser.add_argument("--retries", "-r", type=int, default=1, help="number of times to retry a failed experiment (resuming its journal)")
+    parser.add_argument("--no-swarm", action="store_true", help="don't set up a swarm on each partition (already done)")
+    parser.add_argument("--dry-run", action="store_true", help="only print the partitions and the experiments")
+    return parser.parse_args()
+
+def expand_matrix(matrix):
+    # one experiment for each combination of placement csv, workload and sweep
+    csvs = matrix.get("csvs", [None])
+    workloads = matrix.get("workloads", [0])
+    sweeps = matrix.get("sweeps", [None])
+    experiments = []
+    for csv_file, workload, sweep in itertools.product(csvs, workloads, sweeps):
+        csv_name = Path(csv_file).stem if csv_file is not None else "default"
+        sweep_name = "-".join([str(s) for s in sweep]) if sweep is not None else "default"
+        experiments.append({"name": f"{csv_name}_w{workload}_{sweep_name}", "csv": csv_file, "workload": workload,
+                            "sweep": sweep, "args": matrix.get("args", [])})
+    return experiments
+
+def get_csv_nodes(csv_file):
+    # number of nodes a placement csv needs
+    with open(find_file(csv_file, env_csv=True), "r") as f:
+        return max([int(r["Node"]) for r in csv.DictReader(f, delimiter=",")]) + 1
+
+def make_partitions(ssh_commands, size, out_dir):
+    # split the nodes into independent groups (each one its own swarm) and write an ssh file for each
+    partitions = [ssh_commands[i:i+size] for i in range(0, len(ssh_commands) - size + 1, size)]
+    assert(partitions)
+    files = []
+    for i, p in enumerate(partitions):
+        file = f"{out_dir}/partition_{i}.txt"
+        with open(file, "w") as f:
+            f.write("\n".join(p) + "\n")
+        files.append(file)
+    if len(ssh_commands) % size:
+        print(f"{len(ssh_commands) % size} node(s) left over, not used", flush=True)
+    return files
+
+def setup_swarms(partition_files, service_name, out_dir):
+    # start a swarm on every partition at the same time (nodes are already set up)
+    # (they all write config.json and the inventory cache - both are locked while being updated, see file_lock)
+    print(f"setting up {len(partition_files)} swarm(s)...", flush=True)
+    cmds = [f"python3 run_setup.py {p} {service_name} --no-setup --no-jaeger > {out_dir}/logs/setup_{i}.log 2>&1"
+            for i, p in enumerate(partition_files)]
+    procs = [subprocess.Popen(cmd, shell=True) for cmd in cmds]
+    rcs = [p.wait() for p in procs]
+    for i, rc in enumerate(rcs):
+        print(f"partition {i} swarm setup exited with {rc}", flush=True)
+    return rcs
+
+def get_experiment_cmd(exp, partition_file, out_dir, name, resume=False):
+    cmd = ["python3", "run_workload.py", partition_file, "--pickle-file", f"scheduler/{name}/{exp['name']}",
+           "--workload", str(exp["workload"])]
+    if exp["sweep"] is not None:
+        cmd += ["--sweep"] + [str(s) for s in exp["sweep"]]
+    if exp["csv"] is not None:
+        # each swarm gets its own local env file so they don't overwrite each other
+        cmd += ["--restart", exp["csv"], "--env-file", f"{out_dir}/envs/{exp['name']}.env"]
+    if resume:
+        cmd.append("--resume")
+    return cmd + [str(a) for a in exp["args"]]
+
+def save_manifest(manifest, file):
+    # (temp file and rename, so it's never half written)
+    update_json(file + ".tmp", manifest)
+    os.replace(file + ".tmp", file)
+
+def run_partition(i, partition_file, todo, manifest, lock, out_dir, name, retries):
+    # keep taking experiments off the queue and running them on this partition
+    while True:
+        try:
+            exp = todo.get_nowait()
+        except queue.Empty:
+            return
+        entry = manifest["experiments"][exp["name"]]
+        # a retry on the same partition resumes the journal (the nodes are part of its fingerprint,
+        # so on another partition it starts over)
+        resume = entry["attempts"] > 0 and entry.get("partition") == i
+        cmd = get_experiment_cmd(exp, partition_file, out_dir, name, resume=resume)
+        log_file = f"{out_dir}/logs/{exp['name']}.log"
+        with lock:
+            entry.update({"status": "running", "partition": i, "attempts": entry["attempts"] + 1,
+                          "started": get_datetime(compact=False), "cmd": " ".join(cmd), "log": log_file})
+            save_manifest(manifest, f"{out_dir}/manifest.json")
+        print(f"partition {i}: running {exp['name']} (attempt {entry['attempts']})...", flush=True)
+
+        start = time.perf_counter()
+        with open(log_file, "a") as log:
+            rc = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT).returncode
+        elapsed = time.perf_counter() - start
+
+        with lock:
+            entry.update({"rc": rc, "elapsed": elapsed, "finished": get_datetime(compact=False)})
+            if rc == 0:
+                entry["status"] = "done"
+            elif entry["attempts"] <= retries:
+                # back on the queue for the next free partition
+                entry["status"] = "queued"
+                todo.put(exp)
+            else:
+                entry["status"] = "failed"
+            save_manifest(manifest, f"{out_dir}/manifest.json")
+        print(f"partition {i}: {exp['name']} exited with {rc} after {elapsed:.0f}s -> {entry['status']}", flush=True)
+
+def main():
+    args = parse_args()
+    _, ssh_commands = parse_ssh_file(args.ssh_comms)
+    name = args.name if args.name is not None else f"sched_{get_datetime(compact=True)}"
+    out_dir = f"{SCHEDULER_DIR}/{name}"
+    for d in ["logs", "envs"]:
+        open_path(f"{out_dir}/{d}")
+
+    partition_files = make_partitions(ssh_commands, args.partition_size, out_dir)
+    experiments = expand_matrix(load_json(args.matrix))
+    # skip experiments whose placement doesn't fit in a partition
+    csv_nodes = {e["csv"]: get_csv_nodes(e["csv"]) for e in experiments if e["csv"] is not None}
+    for exp in experiments:
+        if csv_nodes.get(exp["csv"], 0) > args.partition_size:
+            print(f"skipping {exp['name']}: {exp['csv']} needs {csv_nodes[exp['csv']]} nodes", flush=True)
+    experiments = [e for e in experiments if csv_nodes.get(e["csv"], 0) <= args.partition_size]
+    print(f"{len(experiments)} experiment(s) on {len(partition_files)} partition(s) of {args.partition_size} node(s)", flush=True)
+    for exp in experiments:
+        print(f"  {exp['name']}: {' '.join(get_experiment_cmd(exp, '<partition>', out_dir, name))}")
+    if args.dry_run:
+        return
+
+    # the manifest keeps the status of every experiment and where its results are
+    service_name = get_current_service_name()
+    manifest = {"name": name, "matrix": args.matrix, "service": service_name, "partitions": partition_files,
+                "experiments": {e["name"]: {"status": "queued", "attempts": 0,
+                                            "results": f"outputs/{service_name}/scheduler/{name}/{e['name']}.p"}
+                                for e in experiments}}
+    save_manifest(manifest, f"{out_dir}/manifest.json")
+
+    if not args.no_swarm:
+        rcs = setup_swarms(partition_files, service_name, out_dir)
+        # only use the partitions that came up
+        partition_files = [p for p, rc in zip(partition_files, rcs) if rc == 0]
+        assert(partition_files)
+
+    todo = queue.Queue()
+    for exp in experiments:
+        todo.put(exp)
+    lock = threading.Lock()
+    threads = [threading.Thread(target=run_partition, args=(i, p, todo, manifest, lock, out_dir, name, args.retries))
+               for i, p in enumerate(partition_files)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    statuses = [e["status"] for e in manifest["experiments"].values()]
+    print(f"{statuses.count('done')}/{len(statuses)} experiment(s) done, {statuses.count('failed')} failed", flush=True)
+    print(f"manifest written out to {out_dir}/manifest.json", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# samples the cgroup v2 counters of every running container (cpu.stat, memory.current, io.stat, pids.current)
+# and its network counters (/proc/<pid>/net/dev) straight from the kernel, writing fixed size binary records
+#
+# file layout: MAGIC, a 4 byte (little endian) header length, a json header (containers, record format and
+# field names), then one record per container per sample, and a last overhead record (container OVERHEAD_IDX)
+# with the sampler's own cost - every counter is cumulative, MISSING if it couldn't be read
+import argparse
+import json
+import os
+import resource
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+MAGIC = b"CGSTATS1"
+# monotonic ns, wall clock seconds, container index, then the counters
+RECORD = "<QdH12Q"
+FIELDS = ["usage_usec", "user_usec", "system_usec", "nr_periods", "nr_throttled", "throttled_usec", "memory_current",
+          "io_rbytes", "io_wbytes", "net_rx_bytes", "net_tx_bytes", "pids_current"]
+OVERHEAD_FIELDS = ["cpu_usec", "samples", "missed", "busy_usec", "max_sample_usec", "maxrss_kb"]
+OVERHEAD_IDX = 0xFFFF
+MISSING = 2**64 - 1
+# where docker puts the cgroup of a container (systemd and cgroupfs cgroup drivers)
+CGROUP_DIRS = ["/sys/fs/cgroup/system.slice/docker-{}.scope", "/sys/fs/cgroup/docker/{}"]
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_file", metavar="out-file", type=str, help="binary file to write the samples to")
+    parser.add_argument("duration", type=float, help="seconds to sample for")
+    parser.add_argument("--interval", "-i", type=float, default=0.1, help="seconds between samples (e.g. 0.01 for 100 Hz)")
+    return parser.parse_args()
+
+def get_containers():
+    # (full id, name) of the running containers
+    out = subprocess.run(["docker", "ps", "--no-trunc", "--format", "{{.ID}} {{.Names}}"],
+                         capture_output=True, text=True, check=True).stdout
+    return [tuple(line.split()) for line in out.splitlines() if line.strip()]
+
+def find_cgroup(container_id):
+    for d in CGROUP_DIRS:
+        if os.path.isdir(d.format(container_id)):
+            return d.format(container_id)
+    return None
+
+def open_fd(path):
+    try:
+        return os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+
+def open_container(container_id):
+    # file descriptors of the files to sample (kept open, re-read from the start every sample)
+    cgroup = find_cgroup(container_id)
+    if cgroup is None:
+        return None
+    fds = {f: open_fd(f"{cgroup}/{f}") for f in ["cpu.stat", "memory.current", "io.stat", "pids.current"]}
+    # network counters of the container's network namespace (through any of its processes)
+    fds["net"] = None
+    procs = open_fd(f"{cgroup}/cgroup.procs")
+    if procs is not None:
+        pids = os.read(procs, 4096).split()
+        os.close(procs)
+        if pids:
+            fds["net"] = open_fd(f"/proc/{int(pids[0])}/net/dev")
+    return fds
+
+def read_fd(fd):
+    if fd is None:
+        return None
+    try:
+        return os.pread(fd, 65536, 0)
+    except OSError:
+        return None
+
+def parse_cpu_stat(data):
+    stats = dict(line.split() for line in data.decode().splitlines() if line) if data else {}
+    return [int(stats.get(f, MISSING)) for f in FIELDS[:6]]
+
+def parse_io_stat(data):
+    # summed over every device
+    if data is None:
+        return [MISSING, MISSING]
+    rbytes, wbytes = 0, 0
+    for line in data.decode().splitlines():
+        for kv in line.split()[1:]:
+            k, v = kv.split("=")
+            if k == "rbytes":
+                rbytes += int(v)
+            elif k == "wbytes":
+                wbytes += int(v)
+    return [rbytes, wbytes]
+
+def parse_net_dev(data):
+    # summed over every interface but loopback
+    if data is None:
+        return [MISSING, MISSING]
+    rx, tx = 0, 0
+    for line in data.decode().splitlines()[2:]:
+        name, counters = line.split(":", 1)
+        if name.strip() == "lo":
+            continue
+        counters = counters.split()
+        rx += int(counters[0])
+        tx += int(counters[8])
+    return [rx, tx]
+
+def parse_int(data):
+    return int(data) if data else MISSING
+
+def sample(fds):
+    values = parse_cpu_stat(read_fd(fds["cpu.stat"]))
+    values.append(parse_int(read_fd(fds["memory.current"])))
+    values += parse_io_stat(read_fd(fds["io.stat"]))
+    values += parse_net_dev(read_fd(fds["net"]))
+    values.append(parse_int(read_fd(fds["pids.current"])))
+    return values
+
+def get_mem_total():
+    with open("/proc/meminfo", "r") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) * 1024
+    return None
+
+def write_header(f, containers, interval):
+    header = {"record": RECORD, "fields": FIELDS, "overhead_fields": OVERHEAD_FIELDS, "overhead_idx": OVERHEAD_IDX,
+              "missing": MISSING, "containers": [{"id": c, "name": n} for c, n in containers],
+              "hostname": socket.gethostname(), "ncpus": os.cpu_count(), "mem_total": get_mem_total(),
+              "interval": interval, "start_wall": time.time(), "start_ns": time.monotonic_ns()}
+    data = json.dumps(header).encode()
+    f.write(MAGIC + struct.pack("<I", len(data)) + data)
+
+def main():
+    args = parse_args()
+    containers = get_containers()
+    open_fds = [open_container(c) for c, _ in containers]
+    # (containers whose cgroup wasn't found are skipped, but keep their index)
+    live = [(i, fds) for i, fds in enumerate(open_fds) if fds is not None]
+    record = struct.Struct(RECORD)
+
+    samples, missed, busy_ns, max_sample_ns = 0, 0, 0, 0
+    interval_ns = int(args.interval * 1e9)
+    with open(args.out_file, "wb") as f:
+        write_header(f, containers, args.interval)
+        start_cpu = os.times()
+        start = time.monotonic_ns()
+        end = start + int(args.duration * 1e9)
+        next_ns = start
+        while next_ns < end:
+            now = time.monotonic_ns()
+            if now < next_ns:
+                time.sleep((next_ns - now) / 1e9)
+            t0 = time.monotonic_ns()
+            wall = time.time()
+            buf = b"".join([record.pack(t0, wall, i, *sample(fds)) for i, fds in live])
+            f.write(buf)
+            elapsed = time.monotonic_ns() - t0
+            busy_ns += elapsed
+            max_sample_ns = max(max_sample_ns, elapsed)
+            samples += 1
+            next_ns += interval_ns
+            # don't try to catch up on samples we were too slow for, skip them
+            if time.monotonic_ns() > next_ns:
+                behind = (time.monotonic_ns() - next_ns) // interval_ns + 1
+                missed += behind
+                next_ns += behind * interval_ns
+
+        # cost of the sampler itself
+        end_cpu = os.times()
+        cpu_usec = int((end_cpu.user + end_cpu.system - start_cpu.user - start_cpu.system) * 1e6)
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        overhead = [cpu_usec, samples, missed, busy_ns // 1000, max_sample_ns // 1000, maxrss]
+        f.write(record.pack(time.monotonic_ns(), time.time(), OVERHEAD_IDX, *(overhead + [0] * (len(FIELDS) - len(overhead)))))
+
+    wall_sec = (time.monotonic_ns() - start) / 1e9
+    print(f"{samples} samples of {len(live)}/{len(containers)} containers in {wall_sec:.1f}s ({missed} missed), "
+          f"{cpu_usec / 1e4 / wall_sec:.2f}% of a cpu, {busy_ns / 1e3 / max(samples, 1):.0f} us per sample "
+          f"(max {max_sample_ns / 1e3:.0f} us)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,9 @@ rm -f $1
 # loop over duration number of times
 for i in $(seq 1 $2); do
     sleep 1
+    # mark the wall clock and monotonic (uptime) time of the measurement
+    read -r up _ < /proc/uptime
+    echo "@ $EPOCHREALTIME $up" >> $1
     # output frequencies of all cpu to file
     grep 'MHz' /proc/cpuinfo | awk '{print $4}' >> $1
     # add a new line to separate the data
@@ -11,4 +11,10 @@ rm -f $1
 
 # continue to call docker stats and append
 sleep 1
-sudo timeout --signal=SIGINT $2 docker stats --format "{{.ID}},{{.Name}},{{.CPUPerc}},{{.MemUsage}},{{.NetIO}},{{.BlockIO}},{{.PIDs}},{{.MemPerc}}" >> $1
\ No newline at end of file
+# each line starts with the wall clock and monotonic (uptime) time it was read at - both from bash builtins,
+# so there's no process per line
+sudo timeout --signal=SIGINT $2 docker stats --format "{{.ID}},{{.Name}},{{.CPUPerc}},{{.MemUsage}},{{.NetIO}},{{.BlockIO}},{{.PIDs}},{{.MemPerc}}" | \
+    while IFS= read -r line; do
+        read -r up _ < /proc/uptime
+        echo "$EPOCHREALTIME,$up,$line"
+    done >> $1
\ No newline at end of file
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# packs the samples recorded on this node (docker stats, rapl, cpufreq, cgroup_stats.py and power_freq.py files)
+# into one compressed columnar file with numeric columns, plus a summary of each container, so they can be fetched
+# in one go instead of as text
+#
+# file layout: MAGIC, a 4 byte (little endian) header length, a json header (the columns of each stream, with
+# their array typecode, length and offset in the body, and the summary), then the zlib compressed body
+import argparse
+import array
+import json
+import os
+import socket
+import struct
+import sys
+import zlib
+
+MAGIC = b"STPACK01"
+DOCKER_FIELDS = ["ID", "Name", "CPUPerc", "MemUsage", "NetIO", "BlockIO", "PIDs", "MemPerc"]
+UNITS = {"B": 1, "kB": 1e3, "KB": 1e3, "KiB": 1024, "MB": 1e6, "MiB": 1024**2, "GB": 1e9, "GiB": 1024**3,
+         "TB": 1e12, "TiB": 1024**4}
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_file", metavar="out-file", type=str, help="packed file to write")
+    parser.add_argument("--docker", type=str, default=None, help="docker stats output (docker_stats.sh)")
+    parser.add_argument("--rapl", type=str, default=None, help="rapl output (rapl.sh)")
+    parser.add_argument("--cpufreq", type=str, default=None, help="cpufreq output (cpufreq.sh)")
+    parser.add_argument("--cgroup", type=str, default=None, help="cgroup_stats.py output")
+    parser.add_argument("--power-freq", type=str, default=None, help="power_freq.py output")
+    parser.add_argument("--level", type=int, default=6, help="zlib compression level")
+    return parser.parse_args()
+
+def parse_size(s):
+    # e.g. 1.5MiB -> bytes
+    s = s.strip()
+    i = len(s)
+    while i > 0 and not (s[i-1].isdigit() or s[i-1] == "."):
+        i -= 1
+    if i == 0:
+        return float("nan")
+    return float(s[:i]) * UNITS.get(s[i:], 1)
+
+def parse_pair(s):
+    a, _, b = s.partition(" / ")
+    return parse_size(a), parse_size(b)
+
+def parse_perc(s):
+    s = s.strip().rstrip("%")
+    return float(s) / 100 if s and s != "--" else float("nan")
+
+def pack_docker(file):
+    # one row per container measurement - the container is an index into the names
+    cols = {c: array.array(t) for c, t in [("container", "H"), ("sample", "I"), ("Wall", "d"), ("Mono", "d"),
+                                           ("CPUPerc", "d"), ("MemUsage_used", "d"),
+                                           ("MemUsage_total", "d"), ("NetIO_rx", "d"), ("NetIO_tx", "d"),
+                                           ("BlockIO_rx", "d"), ("BlockIO_tx", "d"), ("PIDs", "d"), ("MemPerc", "d")]}
+    names, ids = [], []
+    seen = {}
+    with open(file, "r", errors="replace") as f:
+        for line in f:
+            # (docker stats clears the screen before each round of measurements)
+            line = line.replace("\x1b[2J", "").replace("\x1b[H", "").strip()
+            data = line.split(",")
+            # (lines start with the wall clock and monotonic time they were read at)
+            if len(data) != len(DOCKER_FIELDS) + 2:
+                continue
+            row = dict(zip(["Wall", "Mono"] + DOCKER_FIELDS, data))
+            if row["Name"] not in seen:
+                seen[row["Name"]] = [len(names), 0]
+                names.append(row["Name"])
+                ids.append(row["ID"])
+            idx = seen[row["Name"]]
+            try:
+                values = [float(row["Wall"]), float(row["Mono"]), parse_perc(row["CPUPerc"]), *parse_pair(row["MemUsage"]), *parse_pair(row["NetIO"]),
+                          *parse_pair(row["BlockIO"]), float(row["PIDs"]) if row["PIDs"].isdigit() else float("nan"),
+                          parse_perc(row["MemPerc"])]
+            except ValueError:
+                continue
+            cols["container"].append(idx[0])
+            # (measurement number of this container)
+            cols["sample"].append(idx[1])
+            idx[1] += 1
+            for c, v in zip(list(cols.keys())[2:], values):
+                cols[c].append(v)
+    return cols, {"names": names, "ids": ids}
+
+def pack_rapl(file):
+    # key=value lines (totals over the run, and the wall clock and monotonic time it started and ended at)
+    keys, values = [], array.array("d")
+    with open(file, "r") as f:
+        for line in f:
+            if "=" not in line:
+                continue
+            k, _, v = line.strip().partition("=")
+            try:
+                values.append(float(v))
+                keys.append(k)
+            except ValueError:
+                continue
+    return {"values": values}, {"keys": keys}
+
+def pack_cpufreq(file):
+    # one block of per-core MHz per second (blocks separated by a blank line), flattened row by row - each
+    # block starts with a "@ <wall> <mono>" line with the time it was read at
+    values, wall, mono = array.array("d"), array.array("d"), array.array("d")
+    rows, cores = 0, None
+    block, stamp = [], None
+    with open(file, "r") as f:
+        for line in list(f) + [""]:
+            if line.startswith("@"):
+                stamp = [float(v) for v in line.split()[1:3]]
+                continue
+            if line.strip():
+                block.append(float(line))
+                continue
+            if block:
+                # (a partly written last block is dropped)
+                if cores is None:
+                    cores = len(block)
+                if len(block) == cores and stamp is not None:
+                    values.extend(block)
+                    wall.append(stamp[0])
+                    mono.append(stamp[1])
+                    rows += 1
+                block, stamp = [], None
+    return {"values": values, "wall": wall, "mono": mono}, {"shape": [rows, cores or 0]}
+
+def pack_cgroup(file):
+    # the records of cgroup_stats.py as columns (its header is kept as is)
+    with open(file, "rb") as f:
+        data = f.read()
+    magic_len = 8
+    header_len = struct.unpack("<I", data[magic_len:magic_len+4])[0]
+    header = json.loads(data[magic_len+4:magic_len+4+header_len])
+    body = data[magic_len+4+header_len:]
+    record = struct.Struct(header["record"])
+    n = len(body) // record.size
+    names = ["mono_ns", "wall", "idx"] + header["fields"]
+    cols = {c: array.array(t) for c, t in zip(names, ["Q", "d", "H"] + ["Q"] * len(header["fields"]))}
+    for values in record.iter_unpack(body[:n * record.size]):
+        for c, v in zip(names, values):
+            cols[c].append(v)
+    return cols, {"header": header}
+
+def pack_power_freq(file):
+    # the records of power_freq.py as columns - the frequencies and energies flattened row by row (its header
+    # is kept as is)
+    with open(file, "rb") as f:
+        data = f.read()
+    magic_len = 8
+    header_len = struct.unpack("<I", data[magic_len:magic_len+4])[0]
+    header = json.loads(data[magic_len+4:magic_len+4+header_len])
+    body = data[magic_len+4+header_len:]
+    record = struct.Struct(header["record"])
+    n = len(body) // record.size
+    ncpus = len(header["cpus"])
+    cols = {"mono_ns": array.array("Q"), "wall": array.array("d"), "freqs": array.array("I"), "energy": array.array("Q")}
+    for values in record.iter_unpack(body[:n * record.size]):
+        cols["mono_ns"].append(values[0])
+        cols["wall"].append(values[1])
+        cols["freqs"].extend(values[2:2+ncpus])
+        cols["energy"].extend(values[2+ncpus:])
+    return cols, {"header": header}
+
+def group_rows(idxs):
+    # row numbers of each container index
+    rows = {}
+    for j, i in enumerate(idxs):
+        rows.setdefault(i, []).append(j)
+    return rows
+
+def summarize_docker(cols, meta):
+    # mean/max cpu and max memory of each container
+    summary = {}
+    container_rows = group_rows(cols["container"])
+    for i, name in enumerate(meta["names"]):
+        rows = container_rows.get(i, [])
+        cpu = [cols["CPUPerc"][j] for j in rows if cols["CPUPerc"][j] == cols["CPUPerc"][j]]
+        mem = [cols["MemUsage_used"][j] for j in rows if cols["MemUsage_used"][j] == cols["MemUsage_used"][j]]
+        summary[name] = {"samples": len(rows), "cpu_mean": sum(cpu) / len(cpu) if cpu else None,
+                         "cpu_max": max(cpu) if cpu else None, "mem_max": max(mem) if mem else None}
+    return summary
+
+def summarize_cgroup(cols, meta):
+    # mean cpus used, throttled fraction, max memory and total io/network of each container over the run
+    header = meta["header"]
+    missing = header["missing"]
+    summary = {}
+    container_rows = group_rows(cols["idx"])
+    for i, c in enumerate(header["containers"]):
+        rows = container_rows.get(i, [])
+        if len(rows) < 2:
+            continue
+        first, last = rows[0], rows[-1]
+        def delta(f):
+            a, b = cols[f][first], cols[f][last]
+            return b - a if missing not in [a, b] else None
+        secs = (cols["mono_ns"][last] - cols["mono_ns"][first]) / 1e9
+        usage, periods, throttled = delta("usage_usec"), delta("nr_periods"), delta("nr_throttled")
+        mem = [cols["memory_current"][j] for j in rows if cols["memory_current"][j] != missing]
+        summary[c["name"]] = {"samples": len(rows), "secs": secs,
+                              "cpu_mean": usage / 1e6 / secs if usage is not None and secs > 0 else None,
+                              "throttled": throttled / periods if periods else 0.0,
+                              "mem_max": max(mem) if mem else None,
+                              "io_rbytes": delta("io_rbytes"), "io_wbytes": delta("io_wbytes"),
+                              "net_rx_bytes": delta("net_rx_bytes"), "net_tx_bytes": delta("net_tx_bytes")}
+    return summary
+
+def main():
+    args = parse_args()
+    packers = {"docker": (args.docker, pack_docker), "rapl": (args.rapl, pack_rapl),
+               "cpufreq": (args.cpufreq, pack_cpufreq), "cgroup": (args.cgroup, pack_cgroup),
+               "power_freq": (args.power_freq, pack_power_freq)}
+    header = {"hostname": socket.gethostname(), "streams": {}, "summary": {}}
+    body = []
+    offset = 0
+    for stream, (file, packer) in packers.items():
+        if file is None:
+            continue
+        if not os.path.isfile(file):
+            print(f"{file} not found, skipping", file=sys.stderr)
+            continue
+        cols, meta = packer(file)
+        columns = []
+        for name, arr in cols.items():
+            data = arr.tobytes()
+            columns.append({"name": name, "typecode": arr.typecode, "length": len(arr), "offset": offset})
+            body.append(data)
+            offset += len(data)
+        header["streams"][stream] = {"columns": columns, **meta}
+        if stream == "docker":
+            header["summary"] = summarize_docker(cols, meta)
+        elif stream == "cgroup":
+            # (the cgroup counters are the better summary)
+            header["summary"] = summarize_cgroup(cols, meta)
+
+    header["byteorder"] = sys.byteorder
+    raw = b"".join(body)
+    data = zlib.compress(raw, args.level)
+    header_data = json.dumps(header).encode()
+    with open(args.out_file, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header_data)) + header_data + data)
+    print(f"packed {', '.join(header['streams'].keys()) or 'nothing'}: {len(raw)} -> {len(data)} bytes", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
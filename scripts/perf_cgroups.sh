@@ -0,0 +1,48 @@
+#!/usr/bin/env bash
+
+# make sure three arguments are specified
+if [ $# -ne 3 ]; then
+    echo "Usage: $0 <name of output file> <duration> <comma separated perf events>"
+    exit 1
+fi
+
+# remove existing data file
+rm -f $1
+
+# find the cgroup of each running container (relative to the cgroup root - systemd and cgroupfs cgroup drivers,
+# cgroup v2 or the v1 perf_event hierarchy) and write down which container it belongs to
+cgroups=""
+for c in $(sudo docker ps --no-trunc --format "{{.ID}},{{.Names}}"); do
+    id=${c%%,*}
+    name=${c#*,}
+    for cg in "system.slice/docker-$id.scope" "docker/$id"; do
+        if [ -d "/sys/fs/cgroup/$cg" ] || [ -d "/sys/fs/cgroup/perf_event/$cg" ]; then
+            echo "# cgroup $cg $name" >> $1
+            cgroups="$cgroups,$cg"
+            break
+        fi
+    done
+done
+if [ -z "$cgroups" ]; then
+    echo "no container cgroups found"
+    exit 1
+fi
+
+# --for-each-cgroup needs perf 5.13 or newer - older ones get each event repeated for every cgroup with -G
+# (the n-th cgroup of -G applies to the n-th event of -e)
+if sudo perf stat -h 2>&1 | grep -q -- "--for-each-cgroup"; then
+    cgroup_args="-e $3 --for-each-cgroup ${cgroups#,}"
+else
+    num_events=$(echo $3 | tr ',' '\n' | wc -l)
+    cgroup_args=""
+    for cg in $(echo ${cgroups#,} | tr ',' ' '); do
+        cgroup_args="$cgroup_args -e $3 -G $(yes $cg | head -n $num_events | paste -sd,)"
+    done
+fi
+
+# count the events of every container (on all cpus, split by cgroup) for duration seconds - perf counts until
+# it's interrupted, by timeout or earlier by a SIGINT from run_workload.py once the run is over
+sleep 1
+echo "# start $EPOCHREALTIME" >> $1
+sudo timeout -s INT $2 perf stat -a -x, $cgroup_args -o $1 --append
+echo "# end $EPOCHREALTIME" >> $1
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# samples the current frequency of every core (cpufreq scaling_cur_freq) and the energy counters of every rapl
+# zone (powercap energy_uj - packages and their dram/core subzones) straight from sysfs, writing fixed size
+# binary records
+#
+# file layout: MAGIC, a 4 byte (little endian) header length, a json header (cpus, zones, record format), then
+# one record per sample - the energy counters wrap around at max_energy_range_uj, so they're unwrapped here and
+# recorded as the energy used since the start (uJ), MISSING if a counter couldn't be read
+import argparse
+import glob
+import json
+import os
+import socket
+import struct
+import sys
+import time
+
+MAGIC = b"PWRFREQ1"
+# (kHz) frequency of a core that couldn't be read
+MISSING_FREQ = 2**32 - 1
+MISSING = 2**64 - 1
+CPUFREQ_PATH = "/sys/devices/system/cpu/cpu{}/cpufreq/scaling_cur_freq"
+POWERCAP_DIR = "/sys/class/powercap"
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_file", metavar="out-file", type=str, help="binary file to write the samples to")
+    parser.add_argument("duration", type=float, help="seconds to sample for")
+    parser.add_argument("--interval", "-i", type=float, default=0.1, help="seconds between samples")
+    return parser.parse_args()
+
+def read_file(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def get_cpus():
+    # online cpus, in order
+    cpus = [int(os.path.basename(d)[3:]) for d in glob.glob("/sys/devices/system/cpu/cpu[0-9]*")]
+    return sorted([c for c in cpus if read_file(f"/sys/devices/system/cpu/cpu{c}/online") != "0"])
+
+def get_zones():
+    # (name, path, max range) of each rapl zone, e.g. ("package-0", ".../intel-rapl:0", ...) and
+    # ("package-0/dram", ".../intel-rapl:0:0", ...)
+    zones = []
+    for path in sorted(glob.glob(f"{POWERCAP_DIR}/intel-rapl:*")):
+        name = read_file(f"{path}/name")
+        if name is None:
+            continue
+        parts = os.path.basename(path).split(":")
+        if len(parts) > 2:
+            name = f"{read_file(f'{POWERCAP_DIR}/intel-rapl:{parts[1]}/name')}/{name}"
+        max_range = read_file(f"{path}/max_energy_range_uj")
+        zones.append((name, path, int(max_range) if max_range else None))
+    return zones
+
+def open_fd(path):
+    try:
+        return os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+
+def read_int(fd):
+    # the value of a sysfs file (kept open, re-read from the start every sample)
+    if fd is None:
+        return None
+    try:
+        return int(os.pread(fd, 64, 0))
+    except (OSError, ValueError):
+        return None
+
+def write_header(f, record, cpus, zones, interval):
+    header = {"record": record, "cpus": cpus, "zones": [{"name": n, "max_energy_range_uj": m} for n, _, m in zones],
+              "missing": MISSING, "missing_freq": MISSING_FREQ, "hostname": socket.gethostname(),
+              "interval": interval, "start_wall": time.time(), "start_ns": time.monotonic_ns()}
+    data = json.dumps(header).encode()
+    f.write(MAGIC + struct.pack("<I", len(data)) + data)
+
+def main():
+    args = parse_args()
+    cpus = get_cpus()
+    zones = get_zones()
+    freq_fds = [open_fd(CPUFREQ_PATH.format(c)) for c in cpus]
+    energy_fds = [open_fd(f"{path}/energy_uj") for _, path, _ in zones]
+    # monotonic ns, wall clock seconds, then the frequency of each cpu (kHz) and the energy of each zone (uJ)
+    record_format = f"<Qd{len(cpus)}I{len(zones)}Q"
+    record = struct.Struct(record_format)
+
+    # last raw reading and energy used so far of each zone
+    last = [read_int(fd) for fd in energy_fds]
+    used = [0] * len(zones)
+    samples, missed, wraps = 0, 0, 0
+    interval_ns = int(args.interval * 1e9)
+    with open(args.out_file, "wb") as f:
+        write_header(f, record_format, cpus, zones, args.interval)
+        start_cpu = os.times()
+        start = time.monotonic_ns()
+        end = start + int(args.duration * 1e9)
+        next_ns = start
+        while next_ns < end:
+            now = time.monotonic_ns()
+            if now < next_ns:
+                time.sleep((next_ns - now) / 1e9)
+            t0 = time.monotonic_ns()
+            wall = time.time()
+            freqs = [read_int(fd) for fd in freq_fds]
+            energy = []
+            for i, fd in enumerate(energy_fds):
+                raw = read_int(fd)
+                if raw is None or last[i] is None:
+                    last[i] = raw
+                    energy.append(MISSING)
+                    continue
+                delta = raw - last[i]
+                if delta < 0:
+                    # the counter wrapped around (it counts up to max_energy_range_uj)
+                    delta += zones[i][2] if zones[i][2] else 2**32
+                    wraps += 1
+                used[i] += delta
+                last[i] = raw
+                energy.append(used[i])
+            f.write(record.pack(t0, wall, *[MISSING_FREQ if v is None else v for v in freqs], *energy))
+            samples += 1
+            next_ns += interval_ns
+            # don't try to catch up on samples we were too slow for, skip them
+            if time.monotonic_ns() > next_ns:
+                behind = (time.monotonic_ns() - next_ns) // interval_ns + 1
+                missed += behind
+                next_ns += behind * interval_ns
+
+    end_cpu = os.times()
+    cpu_sec = end_cpu.user + end_cpu.system - start_cpu.user - start_cpu.system
+    wall_sec = (time.monotonic_ns() - start) / 1e9
+    print(f"{samples} samples of {len(cpus)} cpu(s) and {len(zones)} rapl zone(s) in {wall_sec:.1f}s ({missed} missed, "
+          f"{wraps} counter wrap(s)), {cpu_sec / wall_sec * 100:.2f}% of a cpu", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
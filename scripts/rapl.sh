@@ -11,4 +11,11 @@ rm -f $1
 
 # call power measurement command for duration time
 sleep 1
-timeout --signal=SIGINT $2 cpu-energy-meter -r > $1
+read -r up _ < /proc/uptime
+echo "start_wall=$EPOCHREALTIME" > $1
+echo "start_mono=$up" >> $1
+timeout --signal=SIGINT $2 cpu-energy-meter -r >> $1
+# (the energy totals are over this whole interval)
+read -r up _ < /proc/uptime
+echo "end_wall=$EPOCHREALTIME" >> $1
+echo "end_mono=$up" >> $1
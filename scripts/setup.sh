@@ -21,7 +21,16 @@ sudo apt-get install libz-dev -y
 sudo apt-get install luarocks -y
 sudo apt-get install likwid -y
 sudo luarocks install luasocket
-sudo apt install linux-tools-`uname -r` linux-tools-generic htop -y
+sudo apt install linux-tools-common linux-tools-generic htop -y
+sudo apt install linux-tools-`uname -r` -y
+# run_workload.py --perf needs perf for this kernel - --for-each-cgroup needs perf 5.13 or newer, older ones
+# fall back to -G (see scripts/perf_cgroups.sh)
+perf_version=$(perf --version 2>/dev/null | awk '{print $3}')
+if [ -z "$perf_version" ]; then
+    echo "perf isn't installed for kernel $(uname -r), run_workload.py --perf won't work"
+elif [ "$(printf '%s\n' 5.13 ${perf_version%%-*} | sort -V | head -n1)" != "5.13" ]; then
+    echo "perf $perf_version is older than 5.13, run_workload.py --perf will count with -G instead of --for-each-cgroup"
+fi
 sudo apt install libelf-dev libdw-dev systemtap-sdt-dev libunwind-dev libslang2-dev libnuma-dev libiberty-dev -y
 
 wget https://gist.githubusercontent.com/sriramdvt/a6cea893ae6d075497eb60e581d965d7/raw/64fb8c20c1a7b6da5fd24eca428bc1d1c84484f1/mongo-perf.sh -P /dev/shm
@@ -0,0 +1,244 @@
+import json
+import struct
+import zlib
+import numpy as np
+
+# readers for the binary samples written on the nodes by scripts/cgroup_stats.py and scripts/power_freq.py,
+# and the packed (columnar, compressed) stats files written by scripts/pack_stats.py
+CGROUP_MAGIC = b"CGSTATS1"
+POWER_FREQ_MAGIC = b"PWRFREQ1"
+PACK_MAGIC = b"STPACK01"
+# columns of the docker stats style measurements in packed stats (the same as plot_stats.py ends up with) - besides
+# these, each measurement has the container index, its sample number and the Wall/Mono time it was taken at
+STATS_COLUMNS = ["CPUPerc", "MemUsage_used", "MemUsage_total", "NetIO_rx", "NetIO_tx", "BlockIO_rx", "BlockIO_tx", 
+                 "PIDs", "MemPerc"]
+
+def read_cgroup_stats(data):
+    # (header, records, overhead) from the bytes of a cgroup_stats.py file - records is a numpy record array
+    # with the monotonic ns (mono_ns), wall clock seconds (wall), container index (idx) and each counter
+    # (MISSING counters are NaN), overhead is a dict (None if the sampler didn't finish)
+    assert(data[:len(CGROUP_MAGIC)] == CGROUP_MAGIC)
+    start = len(CGROUP_MAGIC)
+    header_len = struct.unpack("<I", data[start:start+4])[0]
+    header = json.loads(data[start+4:start+4+header_len])
+    body = data[start+4+header_len:]
+
+    # same layout as the struct format of the records
+    dtype = np.dtype([("mono_ns", "<u8"), ("wall", "<f8"), ("idx", "<u2")] + [(f, "<u8") for f in header["fields"]])
+    assert(dtype.itemsize == struct.calcsize(header["record"]))
+    # (drop a partly written record at the end)
+    n = len(body) // dtype.itemsize
+    return make_cgroup_records(header, np.frombuffer(body[:n * dtype.itemsize], dtype=dtype))
+
+def make_cgroup_records(header, raw):
+    # split off the overhead record and turn the counters into floats (NaN where missing)
+    fields = header["fields"]
+    overhead = None
+    is_overhead = raw["idx"] == header["overhead_idx"]
+    if is_overhead.any():
+        o = raw[is_overhead][-1]
+        overhead = {f: int(o[fields[i]]) for i, f in enumerate(header["overhead_fields"])}
+    raw = raw[~is_overhead]
+
+    records = np.zeros(len(raw), dtype=[("mono_ns", "<u8"), ("wall", "<f8"), ("idx", "<u2")] + [(f, "<f8") for f in fields])
+    for f in ["mono_ns", "wall", "idx"]:
+        records[f] = raw[f]
+    for f in fields:
+        records[f] = np.where(raw[f] == header["missing"], np.nan, raw[f].astype(np.float64))
+    return header, records, overhead
+
+def get_overhead_summary(header, overhead):
+    # cost of the sampler on its node
+    if overhead is None:
+        return "no overhead record (sampler didn't finish)"
+    samples = overhead["samples"]
+    secs = samples * header["interval"] if samples else 0
+    cpu = overhead["cpu_usec"] / 1e6 / secs * 100 if secs else 0
+    return (f"{samples} samples ({overhead['missed']} missed) every {header['interval']}s, {cpu:.2f}% of a cpu, "
+            f"{overhead['busy_usec'] / max(samples, 1):.0f} us per sample (max {overhead['max_sample_usec']} us)")
+
+def container_series(records, idx):
+    # records of one container, in time order
+    r = records[records["idx"] == idx]
+    return r[np.argsort(r["mono_ns"])]
+
+def get_rates(r):
+    # per interval rates of one container's records - cpus used, fraction of cfs periods throttled,
+    # and bytes/sec of io/network (one row less than the records)
+    dt = np.diff(r["mono_ns"]) / 1e9
+    dt[dt <= 0] = np.nan
+    periods = np.diff(r["nr_periods"])
+    return {"t": r["mono_ns"][1:], "wall": r["wall"][1:], "dt": dt,
+            "cpus": np.diff(r["usage_usec"]) / 1e6 / dt,
+            "throttled": np.divide(np.diff(r["nr_throttled"]), periods, out=np.zeros(len(periods)), where=periods > 0),
+            "throttled_sec": np.diff(r["throttled_usec"]) / 1e6,
+            "io_rbytes": np.diff(r["io_rbytes"]) / dt, "io_wbytes": np.diff(r["io_wbytes"]) / dt,
+            "net_rx_bytes": np.diff(r["net_rx_bytes"]) / dt, "net_tx_bytes": np.diff(r["net_tx_bytes"]) / dt,
+            "memory_current": r["memory_current"][1:], "pids_current": r["pids_current"][1:]}
+
+def fmt_bytes(v):
+    return "0B" if np.isnan(v) else f"{int(v)}B"
+
+def to_docker_stats(header, records, period=1.0):
+    # the samples as docker stats style measurements (one dict per container every period seconds), so the
+    # existing stats consumers (plot_stats.py, placement_optimizer.py) work on them
+    mem_total = header.get("mem_total") or 0
+    measurements = []
+    for idx, c in enumerate(header["containers"]):
+        r = container_series(records, idx)
+        if len(r) < 2:
+            continue
+        # only keep samples every period seconds
+        step = max(1, int(round(period / header["interval"])))
+        r = r[::step]
+        if len(r) < 2:
+            continue
+        rates = get_rates(r)
+        for i in range(len(rates["t"])):
+            mem = rates["memory_current"][i]
+            measurements.append({"Wall": str(rates["wall"][i]), "Mono": str(rates["t"][i] / 1e9), "ID": c["id"][:12], "Name": c["name"],
+                                 "CPUPerc": f"{np.nan_to_num(rates['cpus'][i]) * 100:.2f}%",
+                                 "MemUsage": f"{fmt_bytes(mem)} / {fmt_bytes(mem_total)}",
+                                 "NetIO": f"{fmt_bytes(r['net_rx_bytes'][i+1])} / {fmt_bytes(r['net_tx_bytes'][i+1])}",
+                                 "BlockIO": f"{fmt_bytes(r['io_rbytes'][i+1])} / {fmt_bytes(r['io_wbytes'][i+1])}",
+                                 "PIDs": str(int(np.nan_to_num(rates["pids_current"][i]))),
+                                 "MemPerc": f"{np.nan_to_num(mem) / mem_total * 100 if mem_total else 0:.2f}%",
+                                 "Throttled": float(rates["throttled"][i])})
+    return measurements
+
+def read_power_freq(data):
+    # (header, records) from the bytes of a power_freq.py file - records is a dict of numpy arrays: the monotonic
+    # ns (mono_ns) and wall clock seconds (wall) of each sample, the MHz of each cpu ("freqs", samples x cpus) 
+    # and the joules used by each rapl zone since the start ("energy", samples x zones) - NaN where missing
+    assert(data[:len(POWER_FREQ_MAGIC)] == POWER_FREQ_MAGIC)
+    start = len(POWER_FREQ_MAGIC)
+    header_len = struct.unpack("<I", data[start:start+4])[0]
+    header = json.loads(data[start+4:start+4+header_len])
+    body = data[start+4+header_len:]
+
+    ncpus, nzones = len(header["cpus"]), len(header["zones"])
+    dtype = np.dtype([("mono_ns", "<u8"), ("wall", "<f8"), ("freqs", "<u4", (ncpus,)), ("energy", "<u8", (nzones,))])
+    assert(dtype.itemsize == struct.calcsize(header["record"]))
+    n = len(body) // dtype.itemsize
+    raw = np.frombuffer(body[:n * dtype.itemsize], dtype=dtype)
+    return make_power_freq_records(header, raw["mono_ns"], raw["wall"], raw["freqs"].reshape(n, ncpus), 
+                                   raw["energy"].reshape(n, nzones))
+
+def make_power_freq_records(header, mono_ns, wall, freqs, energy):
+    # (kHz, uJ) -> (MHz, J), NaN where missing
+    freqs = np.where(freqs == header["missing_freq"], np.nan, freqs / 1e3)
+    energy = np.where(energy == header["missing"], np.nan, energy / 1e6)
+    return header, {"mono_ns": np.asarray(mono_ns), "wall": np.asarray(wall), "freqs": freqs, "energy": energy}
+
+def get_power(records):
+    # per interval watts of each rapl zone (one row less than the records)
+    dt = np.diff(records["mono_ns"]) / 1e9
+    dt[dt <= 0] = np.nan
+    return {"t": records["mono_ns"][1:], "wall": records["wall"][1:], "dt": dt,
+            "watts": np.diff(records["energy"], axis=0) / dt[:, None]}
+
+def power_freq_to_rapl(header, records):
+    # the energy totals in the form of rapl.sh (cpu-energy-meter), e.g. cpu0_package_joules, cpu0_dram_joules
+    if len(records["wall"]) < 2:
+        return None
+    rapl = {}
+    for i, z in enumerate(header["zones"]):
+        package, _, sub = z["name"].partition("/")
+        if not package.startswith("package-"):
+            continue
+        e = records["energy"][:, i]
+        e = e[~np.isnan(e)]
+        if len(e) >= 2:
+            rapl[f"cpu{package.split('-')[-1]}_{sub or 'package'}_joules"] = float(e[-1] - e[0])
+    rapl["duration_seconds"] = float(records["mono_ns"][-1] - records["mono_ns"][0]) / 1e9
+    rapl.update({"start_wall": float(records["wall"][0]), "end_wall": float(records["wall"][-1]),
+                 "start_mono": float(records["mono_ns"][0]) / 1e9, "end_mono": float(records["mono_ns"][-1]) / 1e9})
+    return rapl
+
+def power_freq_to_cpufreq(header, records):
+    # the frequencies in the form of the cpufreq stats (see unpack_node_stats), at full resolution
+    return {"freqs": records["freqs"], "wall": records["wall"], "mono": records["mono_ns"] / 1e9}
+
+def read_pack(data):
+    # (header, streams) from the bytes of a pack_stats.py file - each stream is a dict of numpy columns
+    assert(data[:len(PACK_MAGIC)] == PACK_MAGIC)
+    start = len(PACK_MAGIC)
+    header_len = struct.unpack("<I", data[start:start+4])[0]
+    header = json.loads(data[start+4:start+4+header_len])
+    body = zlib.decompress(data[start+4+header_len:])
+    order = "<" if header["byteorder"] == "little" else ">"
+    streams = {}
+    for stream, meta in header["streams"].items():
+        streams[stream] = {}
+        for c in meta["columns"]:
+            dtype = np.dtype(c["typecode"]).newbyteorder(order)
+            streams[stream][c["name"]] = np.frombuffer(body, dtype=dtype, count=c["length"], offset=c["offset"])
+    return header, streams
+
+def cgroup_to_columns(header, records, period=1.0):
+    # docker stats style columns (see STATS_COLUMNS) from cgroup samples, every period seconds
+    mem_total = header.get("mem_total") or np.nan
+    step = max(1, int(round(period / header["interval"])))
+    cols = {c: [] for c in ["container", "sample", "Wall", "Mono", "Throttled"] + STATS_COLUMNS}
+    for idx in range(len(header["containers"])):
+        r = container_series(records, idx)[::step]
+        if len(r) < 2:
+            continue
+        rates = get_rates(r)
+        n = len(rates["t"])
+        cols["container"].append(np.full(n, idx))
+        cols["sample"].append(np.arange(n))
+        cols["Wall"].append(rates["wall"])
+        cols["Mono"].append(rates["t"] / 1e9)
+        cols["Throttled"].append(rates["throttled"])
+        cols["CPUPerc"].append(rates["cpus"])
+        cols["MemUsage_used"].append(rates["memory_current"])
+        cols["MemUsage_total"].append(np.full(n, mem_total))
+        cols["MemPerc"].append(rates["memory_current"] / mem_total)
+        cols["PIDs"].append(rates["pids_current"])
+        # (cumulative, like docker stats)
+        for c, f in [("NetIO_rx", "net_rx_bytes"), ("NetIO_tx", "net_tx_bytes"), ("BlockIO_rx", "io_rbytes"), 
+                     ("BlockIO_tx", "io_wbytes")]:
+            cols[c].append(r[f][1:])
+    return {c: np.concatenate(v) if v else np.zeros(0) for c, v in cols.items()}
+
+def unpack_node_stats(data, period=1.0):
+    # (stats, rapl, cpufreq, cgroup, power_freq) of one node from its packed file, in the forms kept in the stats 
+    # pickle: stats is {"columns": docker stats style numpy columns, "names": container names, "summary": per container},
+    # rapl a dict of totals, cpufreq {"freqs": (seconds x cores) array, "wall", "mono": the time of each second},
+    # cgroup and power_freq the raw samples (or None if not recorded)
+    header, streams = read_pack(data)
+    stats, rapl, cpufreq, cgroup, power_freq = None, None, None, None, None
+    if "cgroup" in streams:
+        cgroup_header = header["streams"]["cgroup"]["header"]
+        cols = streams["cgroup"]
+        raw = np.zeros(len(cols["idx"]), dtype=[(c, cols[c].dtype.newbyteorder("=")) for c in cols])
+        for c in cols:
+            raw[c] = cols[c]
+        cgroup_header, records, overhead = make_cgroup_records(cgroup_header, raw)
+        cgroup = {"header": cgroup_header, "records": records, "overhead": overhead}
+        stats = {"columns": cgroup_to_columns(cgroup_header, records, period), 
+                 "names": [c["name"] for c in cgroup_header["containers"]]}
+    elif "docker" in streams:
+        stats = {"columns": {c: v.astype(np.float64) if c in STATS_COLUMNS else v for c, v in streams["docker"].items()},
+                 "names": header["streams"]["docker"]["names"]}
+    if stats is not None:
+        stats["summary"] = header["summary"]
+    if "rapl" in streams:
+        rapl = {k: float(v) for k, v in zip(header["streams"]["rapl"]["keys"], streams["rapl"]["values"])}
+    if "cpufreq" in streams:
+        cols = streams["cpufreq"]
+        cpufreq = {"freqs": cols["values"].reshape(header["streams"]["cpufreq"]["shape"]), 
+                   "wall": cols.get("wall"), "mono": cols.get("mono")}
+    if "power_freq" in streams:
+        # (the sysfs sampler records both, at a higher resolution)
+        pf_header = header["streams"]["power_freq"]["header"]
+        cols = streams["power_freq"]
+        n = len(cols["mono_ns"])
+        pf_header, records = make_power_freq_records(pf_header, cols["mono_ns"], cols["wall"], 
+                                                     cols["freqs"].reshape(n, len(pf_header["cpus"])),
+                                                     cols["energy"].reshape(n, len(pf_header["zones"])))
+        power_freq = {"header": pf_header, "records": records}
+        rapl = power_freq_to_rapl(pf_header, records)
+        cpufreq = power_freq_to_cpufreq(pf_header, records)
+    return stats, rapl, cpufreq, cgroup, power_freq
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the scripts are flat modules in the repo root (and read config.json from the working directory)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
@@ -0,0 +1,65 @@
+import os
+import pytest
+from inventory import parse_likwid_topology, parse_numa
+from pin_planner import plan_pins
+
+# recorded likwid-topology -O and lscpu output of a 2 socket, 4 cores per socket, 2 threads per core node
+# (cpus 0-7 are the first hardware thread of each core, 8-15 their SMT siblings)
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r") as f:
+        return f.read()
+
+@pytest.fixture
+def topology():
+    socket_cpus, table = parse_likwid_topology(read_fixture("likwid_2s_4c_2t.txt"))
+    numa = parse_numa(read_fixture("lscpu_2s_4c_2t.txt"))
+    return socket_cpus, table, numa
+
+def make_rows(services, socket=0, ncpus=2):
+    return [{"ServiceName": s, "Node": "0", "Socket": str(socket), "NCPUs": str(ncpus)} for s in services]
+
+def plan(topology, rows, service_nodes, smt, num_nodes=1):
+    socket_cpus, table, numa = topology
+    return plan_pins(rows, service_nodes, [socket_cpus] * num_nodes, [table] * num_nodes, [numa] * num_nodes, smt=smt)
+
+def test_parse_fixture(topology):
+    socket_cpus, table, numa = topology
+    assert socket_cpus == [["0", "8", "1", "9", "2", "10", "3", "11"], ["4", "12", "5", "13", "6", "14", "7", "15"]]
+    assert len(table) == 16
+    assert numa == [["0-3", "8-11"], ["4-7", "12-15"]]
+
+def test_pack_fills_siblings_first(topology):
+    p = plan(topology, make_rows(["a", "b"]), {"a": 0, "b": 0}, "pack")
+    assert [x["cpus"] for x in p] == [[0, 8], [1, 9]]
+
+def test_avoid_one_thread_per_core(topology):
+    p = plan(topology, make_rows(["a", "b", "c"]), {"a": 0, "b": 0, "c": 0}, "avoid")
+    # siblings are only used once every physical core of the socket is taken
+    assert [x["cpus"] for x in p] == [[0, 1], [2, 3], [8, 9]]
+
+def test_spread_round_robin_sorted(topology):
+    p = plan(topology, make_rows(["a", "b", "c"], ncpus=3), {"a": 0, "b": 0, "c": 0}, "spread")
+    assert [x["cpus"] for x in p] == [[0, 1, 2], [3, 8, 9], [10, 11, 0]]
+
+@pytest.mark.parametrize("smt", ["pack", "avoid", "spread"])
+def test_mems_follow_numa(topology, smt):
+    p = plan(topology, make_rows(["a"], socket=1), {"a": 0}, smt)
+    assert all([4 <= c <= 7 or 12 <= c <= 15 for c in p[0]["cpus"]])
+    assert p[0]["mems"] == [1]
+
+@pytest.mark.parametrize("smt", ["pack", "avoid", "spread"])
+def test_replicas_on_one_node_get_their_own_cpus(topology, smt):
+    p = plan(topology, make_rows(["a"]), {"a": [("1", 0), ("2", 0)]}, smt)
+    assert [x["replica"] for x in p] == ["1", "2"]
+    assert not set(p[0]["cpus"]) & set(p[1]["cpus"])
+
+def test_replicas_on_different_nodes(topology):
+    p = plan(topology, make_rows(["a"]), {"a": [("1", 0), ("2", 1)]}, "pack", num_nodes=2)
+    # each node has its own state, so both replicas start from the first core
+    assert [(x["node"], x["cpus"]) for x in p] == [(0, [0, 8]), (1, [0, 8])]
+
+def test_whole_socket_without_ncpus(topology):
+    p = plan(topology, make_rows(["a"], ncpus=""), {"a": 0}, "pack")
+    assert p[0]["cpus"] == [0, 8, 1, 9, 2, 10, 3, 11]
@@ -0,0 +1,66 @@
+import pytest
+import update_swarm
+from helpers import RemoteResult
+from update_swarm import parse_stack_services, parse_stack_tasks, is_service_ready, wait_for_stack, diff_specs, get_update_cmd
+
+# recorded `docker stack services`/`docker stack ps` output of a deployed stack whose one-shot
+# cassandra-schema job (restart condition on-failure) has already exited successfully
+SERVICES_OUT = """socialNetwork_nginx-thrift 1/1
+socialNetwork_cassandra-schema 0/1
+socialNetwork_user-service 2/2"""
+TASKS_OUT = """socialNetwork_nginx-thrift.1 Running Running 2 minutes ago
+socialNetwork_cassandra-schema.1 Shutdown Complete 1 minute ago
+socialNetwork_user-service.1 Running Running 2 minutes ago
+socialNetwork_user-service.2 Running Running 2 minutes ago
+\\_ socialNetwork_user-service.2 Shutdown Failed 3 minutes ago"""
+
+def test_parse_completed_job():
+    services = parse_stack_services(SERVICES_OUT)
+    tasks = parse_stack_tasks(TASKS_OUT)
+    assert services["socialNetwork_cassandra-schema"] == (0, 1)
+    assert tasks["socialNetwork_cassandra-schema"] == [("1", "Shutdown", "Complete")]
+    assert tasks["socialNetwork_user-service"][-1] == ("2", "Shutdown", "Failed")
+    assert is_service_ready(0, 1, tasks["socialNetwork_cassandra-schema"])
+    assert is_service_ready(2, 2, tasks["socialNetwork_user-service"])
+
+def test_not_ready():
+    # still starting, or a failed job (swarm restarts it, so it isn't done)
+    assert not is_service_ready(0, 1, [("1", "Running", "Starting")])
+    assert not is_service_ready(0, 1, [("1", "Running", "Preparing"), ("1", "Shutdown", "Failed")])
+    # a task that completed but was replaced in its slot (restart condition any) isn't counted
+    assert not is_service_ready(0, 1, [("1", "Running", "Starting"), ("1", "Shutdown", "Complete")])
+
+def fake_batched(services_out, tasks_out):
+    def run_batched(node_cmds, print_stderr=True):
+        return {node: [RemoteResult(services_out, "", 0, node, "", 0, 1, False),
+                       RemoteResult(tasks_out, "", 0, node, "", 0, 1, False)] for node in node_cmds}
+    return run_batched
+
+def test_wait_for_stack_with_completed_job(monkeypatch):
+    monkeypatch.setattr(update_swarm, "run_batched", fake_batched(SERVICES_OUT, TASKS_OUT))
+    ready = wait_for_stack("node0", stack_name="socialNetwork", timeout=1, interval=0)
+    assert sorted(ready) == ["socialNetwork_cassandra-schema", "socialNetwork_nginx-thrift", "socialNetwork_user-service"]
+
+def test_wait_for_stack_times_out(monkeypatch):
+    monkeypatch.setattr(update_swarm, "run_batched", fake_batched("socialNetwork_nginx-thrift 0/1",
+                                                                  "socialNetwork_nginx-thrift.1 Running Starting 1 second ago"))
+    monkeypatch.setattr(update_swarm.time, "sleep", lambda s: None)
+    with pytest.raises(TimeoutError):
+        wait_for_stack("node0", stack_name="socialNetwork", timeout=0, interval=0)
+
+def test_update_cmd_keeps_unchanged_placement():
+    # only the cpu limit changed - the constraint must not be added again
+    live = {"user-service": {"placement": ["node.hostname==node1"], "cpu": 1.0, "memory": 0}}
+    changed, full = diff_specs({"user-service": {"placement": "node.hostname==node1", "cpu": "2", "memory": ""}}, live)
+    assert not full and list(changed) == ["user-service"]
+    cmd = get_update_cmd("user-service", changed["user-service"], "socialNetwork")
+    assert "--constraint" not in cmd and "--limit-cpu 2.0" in cmd
+    # a constraint docker already holds twice is still the same placement
+    live["user-service"]["placement"] *= 2
+    live["user-service"]["cpu"] = 2.0
+    assert diff_specs({"user-service": {"placement": "node.hostname==node1", "cpu": "2", "memory": ""}}, live) == ({}, False)
+
+def test_update_cmd_moves_placement():
+    cmd = get_update_cmd("user-service", {"placement": "node.hostname==node2", "cpu": 1.0, "memory": 0,
+                                          "old_placement": ["node.hostname==node1"]}, "socialNetwork")
+    assert "--constraint-rm 'node.hostname==node1' --constraint-add 'node.hostname==node2'" in cmd
@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import pickle
+import time
+import numpy as np
+from helpers import *
+from prettytable import PrettyTable
+from telemetry import container_series, get_rates, get_power
+
+# one time aligned timeline of a load point - the latency windows, container stats, cpu frequencies and power
+# of every node, all on the clock of the machine running the experiment (using the offsets of the nodes'
+# clocks measured at the start of the run), in seconds from the start of the measurement
+
+# round trips to take when measuring the clock offset of a node (the shortest one is kept)
+CLOCK_PROBES = 5
+# names of the lat_dist columns (in the order of run_workload.LAT_PERCENTILES)
+LAT_COLUMNS = ["p50", "p75", "p90", "p99", "p99.9", "p99.99", "p99.999", "p100"]
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pickle_file", metavar="pickle-file", type=str, help="results pickle file (from run_workload.py)")
+    parser.add_argument("--stats", type=str, default=None, help="stats pickle file of the same run")
+    parser.add_argument("--load", type=int, default=None, help="load point to show (default: the first)")
+    parser.add_argument("--rep", type=int, default=None, help="repetition to show, for a load repeated with --reps-metric (default: the last)")
+    parser.add_argument("--start", type=float, default=None, help="start of the window to show (seconds from the start)")
+    parser.add_argument("--end", type=float, default=None, help="end of the window to show (seconds from the start)")
+    parser.add_argument("--step", type=float, default=1.0, help="seconds per row")
+    return parser.parse_args()
+
+async def probe_clock(node, probes=CLOCK_PROBES):
+    # offset of the node's wall clock from ours (seconds, positive if the node is ahead) - from the probe with
+    # the shortest round trip, assuming the node read its clock half way through it
+    best = None
+    for _ in range(probes):
+        t0 = time.time()
+        result = await run(get_ssh_cmd(node, "date +%s%N"), print_stderr=False, node=node)
+        t1 = time.time()
+        if result.rc != 0 or not result.stdout.isdigit():
+            continue
+        if best is None or t1 - t0 < best["rtt"]:
+            best = {"offset": int(result.stdout) / 1e9 - (t0 + t1) / 2, "rtt": t1 - t0}
+    return best
+
+async def probe_clocks(nodes, probes=CLOCK_PROBES):
+    return await asyncio.gather(*[probe_clock(node, probes) for node in nodes])
+
+def measure_clock_offsets(nodes, probes=CLOCK_PROBES):
+    # {node: {"offset", "rtt"}} in the order of the nodes (None for a node that couldn't be reached)
+    print(f"measuring the clock offsets of {len(nodes)} node(s)...", flush=True)
+    offsets = dict(zip(nodes, asyncio.run(probe_clocks(nodes, probes))))
+    for node, o in offsets.items():
+        if o is None:
+            print(f"{node}: couldn't measure its clock offset", flush=True)
+            continue
+        # (the offset is only known to within half the round trip)
+        print(f"{node}: clock offset {o['offset'] * 1e3:+.2f} ms (+/- {o['rtt'] / 2 * 1e3:.2f} ms)", flush=True)
+    return offsets
+
+def get_offset(clocks, node):
+    if not clocks or node not in clocks or clocks[node] is None:
+        return 0.0
+    return clocks[node]["offset"]
+
+def make_columns(rows, names):
+    return {c: np.array([r[i] for r in rows], dtype=object if c in ["name", "zone"] else np.float64)
+            for i, c in enumerate(names)}
+
+def latency_rows(info, master_offset):
+    # (start, end, offered, achieved rate, *lat_dist) of each latency sample, on our clock
+    def row(start, end, offered, rate, lat_dist):
+        lat = list(lat_dist) + [np.nan] * (len(LAT_COLUMNS) - len(lat_dist))
+        return [start, end, np.nan if offered is None else offered, np.nan if rate is None else rate] + lat[:len(LAT_COLUMNS)]
+    if "profile" in info:
+        # (window times are relative to the start of the profile, on the master's clock)
+        start = info["profile"]["start_ns"] / 1e9 - master_offset
+        # (a window's latencies only cover the part after wrk2's calibration)
+        return [row(start + w.get("lat_t", w["t"]), start + w["end"], w["offered"], w["rate"], w["lat_dist"])
+                for w in info["profile"]["windows"]]
+    if "windows" in info:
+        # (a window's latencies only cover the part after wrk2's calibration)
+        return [row(w.get("lat_start_ns", w["start_ns"]) / 1e9 - master_offset, w["end_ns"] / 1e9 - master_offset, None, w["rate"], w["lat_dist"])
+                for w in info["windows"] if w.get("kept") and w.get("start_ns") is not None and w.get("end_ns") is not None]
+    if "wall" in info:
+        # (a single sample over the measurement, after any warmup, timed here)
+        return [row(info["wall"][0], info["wall"][1], None, info.get("rate"), info.get("lat_dist", []))]
+    return []
+
+def container_rows(stats_node, cgroup_node, node, offset):
+    # (time, end, node, name, cpus, memory bytes, throttled fraction) of each container measurement
+    rows = []
+    if cgroup_node is not None:
+        # the cgroup samples at full resolution (each row is the interval up to the sample)
+        header, records = cgroup_node["header"], cgroup_node["records"]
+        for idx, c in enumerate(header["containers"]):
+            r = container_series(records, idx)
+            if len(r) < 2:
+                continue
+            rates = get_rates(r)
+            ends = rates["wall"] - offset
+            starts = ends - rates["dt"]
+            rows += [[s, e, node, c["name"], cpus, mem, thr] for s, e, cpus, mem, thr
+                     in zip(starts, ends, rates["cpus"], rates["memory_current"], rates["throttled"])]
+    elif isinstance(stats_node, dict) and "Wall" in stats_node["columns"]:
+        # packed docker stats (one sample a second or so, the end of each is the next one)
+        cols = stats_node["columns"]
+        names = stats_node["names"]
+        throttled = cols["Throttled"] if "Throttled" in cols else np.full(len(cols["Wall"]), np.nan)
+        for t, c, cpus, mem, thr in zip(cols["Wall"], cols["container"], cols["CPUPerc"], cols["MemUsage_used"], throttled):
+            rows.append([t - offset, np.nan, node, names[int(c)], cpus, mem, thr])
+    elif isinstance(stats_node, list):
+        for m in stats_node:
+            if not m or "Wall" not in m or "CPUPerc" not in m:
+                continue
+            try:
+                cpus = float(m["CPUPerc"].rstrip("%")) / 100
+            except ValueError:
+                cpus = np.nan
+            rows.append([float(m["Wall"]) - offset, np.nan, node, m["Name"], cpus, np.nan, m.get("Throttled", np.nan)])
+    return rows
+
+def cpufreq_rows(cpufreq_node, node, offset):
+    # (time, node, mean, min, max MHz over the cores) of each cpufreq measurement (only with timestamps)
+    if not isinstance(cpufreq_node, dict) or cpufreq_node.get("wall") is None:
+        return []
+    freqs = np.asarray(cpufreq_node["freqs"], dtype=np.float64)
+    if freqs.size == 0:
+        return []
+    return [[t - offset, node, f.mean(), f.min(), f.max()] for t, f in zip(cpufreq_node["wall"], freqs)]
+
+def power_rows(rapl_node, power_freq_node, node, offset):
+    # (start, end, node, zone, joules, watts) of each rapl zone (e.g. package-0, package-0/dram) - every interval
+    # of the sysfs sampler, or else the totals over the whole recording
+    rows = []
+    if power_freq_node is not None:
+        header, records = power_freq_node["header"], power_freq_node["records"]
+        if len(records["wall"]) < 2:
+            return []
+        power = get_power(records)
+        ends = power["wall"] - offset
+        starts = ends - power["dt"]
+        for i, z in enumerate(header["zones"]):
+            watts = power["watts"][:, i]
+            rows += [[s, e, node, z["name"], w * dt, w] for s, e, w, dt in zip(starts, ends, watts, power["dt"])]
+        return rows
+    if not rapl_node or "start_wall" not in rapl_node or "end_wall" not in rapl_node:
+        return []
+    start, end = rapl_node["start_wall"] - offset, rapl_node["end_wall"] - offset
+    secs = rapl_node.get("duration_seconds", end - start)
+    for k, v in rapl_node.items():
+        if k.endswith("_package_joules"):
+            package = k.split("_")[0].lstrip("cpu")
+            rows.append([start, end, node, f"package-{package}", v, v / secs if secs > 0 else np.nan])
+    return rows
+
+def build_timeline(out, load_stats=None, clocks=None, rep=None):
+    # the timeline of a load point from its (load, parsed, info) result and its (load, stats) entry of the stats
+    # pickle - clocks are the offsets of the nodes (default: the ones measured for the run, in info["clocks"])
+    # for a repeated load (--reps-metric), rep picks the repetition (default: the last one)
+    l, _, info = out
+    if rep is not None:
+        info = info["rep_infos"][rep]
+        out = (l, (None, None, info["lat_dist"]), info)
+        load_stats = (l, load_stats[2][rep]) if load_stats is not None else None
+    clocks = clocks if clocks is not None else info.get("clocks", {})
+    nodes = list(clocks.keys())
+    master_offset = get_offset(clocks, nodes[0]) if nodes else 0.0
+
+    lat_info = dict(info)
+    lat_info.setdefault("lat_dist", out[1][2])
+    lat = latency_rows(lat_info, master_offset)
+    containers, cpufreq, power = [], [], []
+    if load_stats is not None:
+        stats = load_stats[1]
+        node_stats, node_rapls, node_cpufreqs = stats[0], stats[1], stats[2] if len(stats) > 2 else []
+        node_cgroups = stats[3] if len(stats) > 3 else []
+        node_power_freqs = stats[4] if len(stats) > 4 else []
+        # (the stats lists are in the order of the nodes)
+        for j in range(max(len(node_stats), len(node_rapls), len(node_cpufreqs))):
+            offset = get_offset(clocks, nodes[j]) if j < len(nodes) else 0.0
+            cgroup = node_cgroups[j] if j < len(node_cgroups) else None
+            if j < len(node_stats):
+                containers += container_rows(node_stats[j], cgroup, j, offset)
+            if j < len(node_cpufreqs):
+                cpufreq += cpufreq_rows(node_cpufreqs[j], j, offset)
+            power_freq = node_power_freqs[j] if j < len(node_power_freqs) else None
+            if j < len(node_rapls) or power_freq is not None:
+                power += power_rows(node_rapls[j] if j < len(node_rapls) else None, power_freq, j, offset)
+
+    streams = {"latency": make_columns(lat, ["t", "end", "offered", "rate"] + LAT_COLUMNS),
+               "containers": make_columns(containers, ["t", "end", "node", "name", "cpus", "mem", "throttled"]),
+               "cpufreq": make_columns(cpufreq, ["t", "node", "mean", "min", "max"]),
+               "power": make_columns(power, ["t", "end", "node", "zone", "joules", "watts"])}
+    # start of the measurement (or of the first sample if there's no latency timing)
+    starts = [s["t"].min() for s in streams.values() if len(s["t"])]
+    start = streams["latency"]["t"].min() if len(lat) else (min(starts) if starts else 0.0)
+    for name, cols in streams.items():
+        order = np.argsort(cols["t"], kind="stable")
+        for c in cols:
+            cols[c] = cols[c][order]
+        cols["t"] = cols["t"] - start
+        if "end" in cols:
+            cols["end"] = cols["end"] - start
+    return {"load": l, "start": start, "nodes": nodes, "clocks": clocks, "streams": streams}
+
+def timeline_window(timeline, start=None, end=None, streams=None):
+    # the part of the timeline between start and end (seconds from its start) - rows with an end are kept
+    # if they overlap the window at all
+    start = -np.inf if start is None else start
+    end = np.inf if end is None else end
+    window = {k: v for k, v in timeline.items() if k != "streams"}
+    window["streams"] = {}
+    for name, cols in timeline["streams"].items():
+        if streams is not None and name not in streams:
+            continue
+        row_end = np.where(np.isnan(cols["end"]), cols["t"], cols["end"]) if "end" in cols else cols["t"]
+        keep = (cols["t"] < end) & (row_end >= start)
+        window["streams"][name] = {c: v[keep] for c, v in cols.items()}
+    return window
+
+def summarize_window(timeline, start, end):
+    # one row of numbers for the window - worst latency/rate of the overlapping samples, then the mean cpus used
+    # by all the containers, the busiest container, mean frequency and power of each node
+    streams = timeline_window(timeline, start, end)["streams"]
+    lat = streams["latency"]
+    summary = {"p99": np.nanmax(lat["p99"]) if len(lat["t"]) else np.nan,
+               "rate": np.nanmean(lat["rate"]) if len(lat["t"]) else np.nan, "nodes": []}
+    for j in range(len(timeline["nodes"]) or 1):
+        node = {}
+        c = streams["containers"]
+        mine = c["node"] == j
+        if mine.any():
+            # (mean of each container over the window, then summed)
+            names = c["name"][mine]
+            cpus = {n: np.nanmean(c["cpus"][mine][names == n]) for n in set(names)}
+            node["cpus"] = sum(cpus.values())
+            node["top"] = max(cpus, key=cpus.get)
+        f = streams["cpufreq"]
+        if (f["node"] == j).any():
+            node["mhz"] = f["mean"][f["node"] == j].mean()
+        p = streams["power"]
+        # (mean of each package over the window, then summed - its dram/core subzones are part of it)
+        packages = (p["node"] == j) & np.array(["/" not in z for z in p["zone"]], dtype=bool)
+        if packages.any():
+            zones = p["zone"][packages]
+            node["watts"] = sum([np.nanmean(p["watts"][packages][zones == z]) for z in set(zones)])
+        summary["nodes"].append(node)
+    return summary
+
+def find_point(data, load=None):
+    for i, d in enumerate(data):
+        if load is None or d[0] == load:
+            return i
+    return None
+
+def main():
+    args = parse_args()
+    data = data_load(args.pickle_file)
+    i = find_point(data, args.load)
+    assert(i is not None)
+    out = data[i]
+    load_stats = None
+    if args.stats is not None:
+        with open(args.stats, "rb") as f:
+            stats = pickle.load(f)
+        j = find_point(stats, out[0])
+        load_stats = stats[j] if j is not None else None
+
+    timeline = build_timeline(out, load_stats, rep=args.rep)
+    counts = {name: len(cols["t"]) for name, cols in timeline["streams"].items()}
+    print(f"load {out[0]}: {counts} sample(s) from {len(timeline['nodes'])} node(s)", flush=True)
+    # (the whole timeline by default, samples can start before the measurement, e.g. during warmup)
+    starts = [cols["t"].min() for cols in timeline["streams"].values() if len(cols["t"])]
+    ends = [np.nanmax(np.where(np.isnan(cols["end"]), cols["t"], cols["end"]) if "end" in cols else cols["t"])
+            for cols in timeline["streams"].values() if len(cols["t"])]
+    start = args.start if args.start is not None else (min(starts) if starts else 0.0)
+    end = args.end if args.end is not None else (max(ends) if ends else 0.0)
+
+    x = PrettyTable()
+    x.field_names = ["Time (s)", "p99 (ms)", "Rate"] + [f"Node {j}" for j in range(len(timeline["nodes"]) or 1)]
+    t = start
+    while t < end:
+        s = summarize_window(timeline, t, t + args.step)
+        row = [round(t, 2), round(s["p99"], 2), round(s["rate"], 1)]
+        for node in s["nodes"]:
+            parts = []
+            if "cpus" in node:
+                parts.append(f"{node['cpus']:.2f} cpus ({node['top']})")
+            if "mhz" in node:
+                parts.append(f"{node['mhz']:.0f} MHz")
+            if "watts" in node:
+                parts.append(f"{node['watts']:.1f} W")
+            row.append(", ".join(parts))
+        x.add_row(row)
+        t += args.step
+    print(x)
+
+if __name__ == "__main__":
+    main()
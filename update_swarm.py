@@ -1,12 +1,15 @@
 import argparse
 from helpers import *
-from docker_services import print_table, get_service_nodes, get_ps, get_nodes_ps
+from docker_services import print_table, get_service_tasks, get_ps, get_nodes_ps, get_cluster_state
 from make_docker_compose import make_compose
-from tqdm.contrib import tenumerate
+from inventory import get_inventory
+from pin_planner import plan_pins, read_rows, print_plan, SMT_POLICIES
 import time
-import csv
 
 DSB_PATH = f"~/DeathStarBench/{get_current_service_name()}/"
+DEPLOY_TIMEOUT = 300    # max seconds to wait for all services to be running after a deploy
+TEARDOWN_TIMEOUT = 180  # max seconds to wait for a removed stack (and its network) to be gone
+POLL_INTERVAL = 2       # seconds between checks of the stack state
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -15,7 +18,10 @@ def parse_args():
     parser.add_argument("--compose-file", type=str, default="docker-compose-swarm.yml", help="yaml file with service assignments")
     parser.add_argument("--fraction", "-f", action="store_true", help="use fractions of total cores")
     parser.add_argument("--pin", "-p", action="store_true", help="pin services to cores")
-    parser.add_argument("--sorted", "-s", action="store_true", help="sort cores by increasing number, so avoid SMT")    
+    parser.add_argument("--sorted", "-s", action="store_true", help="sort cores by increasing number, so avoid SMT (same as --smt spread)")    
+    parser.add_argument("--smt", type=str, default=None, choices=SMT_POLICIES, help="SMT policy for pinning: pack, avoid or spread")
+    parser.add_argument("--deploy-timeout", type=int, default=DEPLOY_TIMEOUT, help="max seconds to wait for the stack to be ready")
+    parser.add_argument("--incremental", "-i", action="store_true", help="only update the services whose placement/resources changed, instead of redeploying the stack")
     return parser.parse_args()
 
 def get_stack(node):
@@ -27,8 +33,9 @@ def get_stack(node):
 def deploy_stack(node, compose_file, env_file, dsb_path):
     run_ssh_cmd(node, f"./deploy_stack.sh {compose_file} {env_file} {get_current_service_name()}", cd=dsb_path, check=True)
 
-def rm_stack(node, quiet=False):
-    stack_name = get_stack(node)
+def rm_stack(node, quiet=False, stack_name=None):
+    if stack_name is None:
+        stack_name = get_stack(node)
     if stack_name is None:
         if not quiet:
             print("no stack to remove...", flush=True)
@@ -37,40 +44,127 @@ def rm_stack(node, quiet=False):
     print(f"removing stack '{stack_name}'...", flush=True)
     run_ssh_cmd(node, f"sudo docker stack rm {stack_name}")
     return True
+
+def get_stack_state_cmds(stack_name):
+    return [f"sudo docker stack services --format '{{{{.Name}}}} {{{{.Replicas}}}}' {stack_name}",
+            # (all tasks, not just the ones desired running, so one-shot jobs that completed show up too)
+            f"sudo docker stack ps --format '{{{{.Name}}}} {{{{.DesiredState}}}} {{{{.CurrentState}}}}' {stack_name}"]
+
+def parse_stack_services(out):
+    # service name -> (running replicas, desired replicas), from lines like "socialNetwork_nginx 1/1"
+    services = {}
+    for line in out.split("\n"):
+        line = line.split()
+        if len(line) < 2 or "/" not in line[1]:
+            continue
+        running, desired = line[1].split("/")[:2]
+        services[line[0]] = (int(running), int(desired))
+    return services
+
+def parse_stack_tasks(out):
+    # service name -> list of (slot, desired state, current state) of its tasks, from lines like 
+    # "socialNetwork_nginx.1 Running Running 5 seconds ago" (older tasks of a slot may be shown as "\_ <name>")
+    tasks = {}
+    for line in out.split("\n"):
+        line = [l for l in line.split() if l != "\\_"]
+        if len(line) < 3 or "." not in line[0]:
+            continue
+        service_name, slot = line[0].rsplit(".", 1)
+        tasks.setdefault(service_name, []).append((slot, line[1], line[2]))
+    return tasks
+
+def is_service_ready(running, desired, tasks):
+    # all of a service's replicas are running - or, for a one-shot job (e.g. cassandra-schema, restart
+    # condition on-failure), have completed: swarm then shows it as 0/1 and doesn't restart it
+    active = [t for t in tasks if t[1] == "Running"]
+    if not all([t[2] == "Running" for t in active]):
+        return False
+    # (a Complete task is one that exited 0 - only counted if nothing replaced it in its slot)
+    active_slots = set([t[0] for t in active])
+    completed = set([t[0] for t in tasks if t[2] == "Complete" and t[0] not in active_slots])
+    return running + len(completed) >= desired
+
+def wait_for_stack(node, stack_name=None, timeout=DEPLOY_TIMEOUT, interval=POLL_INTERVAL):
+    if stack_name is None:
+        stack_name = get_current_service_name()
+    print(f"waiting for stack '{stack_name}' to be ready...", flush=True)
+    # seconds from the start of waiting until each service had all its replicas running
+    ready = {}
+    services = {}
+    start = time.time()
+    while True:
+        results = run_batched({node: get_stack_state_cmds(stack_name)}, print_stderr=False)[node]
+        services = parse_stack_services(results[0].stdout)
+        tasks = parse_stack_tasks(results[1].stdout)
+        elapsed = time.time() - start
+        for name, (running, desired) in services.items():
+            if name in ready:
+                continue
+            if is_service_ready(running, desired, tasks.get(name, [])):
+                ready[name] = round(elapsed, 2)
+        if services and len(ready) == len(services):
+            print(f"stack ready after {elapsed:.1f} seconds...", flush=True)
+            break
+        if elapsed > timeout:
+            # don't measure against a half deployed stack
+            not_ready = [name for name in services if name not in ready]
+            raise TimeoutError(f"stack '{stack_name}' not ready after {timeout} seconds, waiting for: {not_ready}")
+        time.sleep(interval)
+    return ready
+
+def wait_for_stack_removed(node, stack_name=None, timeout=TEARDOWN_TIMEOUT, interval=POLL_INTERVAL):
+    if stack_name is None:
+        stack_name = get_current_service_name()
+    print(f"waiting for stack '{stack_name}' to be removed...", flush=True)
+    # the stack, its services and its overlay network all need to be gone before redeploying
+    # (otherwise: https://stackoverflow.com/questions/53347951/docker-network-not-found)
+    label = f"label=com.docker.stack.namespace={stack_name}"
+    cmds = ["sudo docker stack ls --format '{{.Name}}'",
+            f"sudo docker service ls -q --filter '{label}'",
+            f"sudo docker network ls -q --filter '{label}'"]
+    start = time.time()
+    while True:
+        results = run_batched({node: cmds}, print_stderr=False)[node]
+        stacks, services, networks = [r.stdout.split() for r in results]
+        elapsed = time.time() - start
+        if stack_name not in stacks and not services and not networks:
+            print(f"stack removed after {elapsed:.1f} seconds...", flush=True)
+            return True
+        if elapsed > timeout:
+            # don't deploy into a half removed stack/network
+            raise TimeoutError(f"stack '{stack_name}' not removed after {timeout} seconds "
+                               f"(left: {len(services)} service(s), {len(networks)} network(s))")
+        time.sleep(interval)
     
-def restart_stack(nodes, dsb_path, compose="docker-compose-swarm.yml", env=".env", no_print=False, pin=None, cleanup_nodes=True):
-    print("sleeping for 30 seconds before starting...", flush=True)
-    time.sleep(30) # need to do this because of weird Docker bug (https://stackoverflow.com/questions/53347951/docker-network-not-found)
+def restart_stack(nodes, dsb_path, compose="docker-compose-swarm.yml", env=".env", no_print=False, pin=None, cleanup_nodes=True,
+                  deploy_timeout=DEPLOY_TIMEOUT, sort_cpus=False, smt=None):
     master_node = nodes[0]
     if cleanup_nodes:
         print("removing previous stack (if exists)...", flush=True)
         cleanup(nodes)
+    else:
+        # still make sure the previous stack's network is gone before deploying
+        wait_for_stack_removed(master_node)
     print("re-deploying stack...", flush=True)
     deploy_stack(master_node, compose, env, dsb_path)
-    time.sleep(30) # sleep for 30 seconds to let the stack start up
+    # wait for every service to be running (and record how long each took)
+    ready = wait_for_stack(master_node, timeout=deploy_timeout)
     
+    # one snapshot of the cluster shared by the table and the pinning
+    state = get_cluster_state(master_node) if not no_print or pin is not None else None
     table = None
     if not no_print:
          # print out to make sure changes look right
         print("printing updated table...", flush=True)
-        table = print_table(master_node)
+        table = print_table(master_node, state=state)
         print("NOTE: check table above to make sure all current states are running/started...", flush=True)
     if pin is not None:
-        pin_cpus(nodes, pin)
-    return table
+        pin_cpus(nodes, pin, sort_cpus=sort_cpus, smt=smt, state=state)
+    return table, ready
 
 def get_numa_nums(nodes: list):
     print("getting NUMA numbers...", flush=True)
-    numa_nums = []
-    for _, node in tenumerate(nodes):
-        out = run_ssh_cmd(node, "sudo lscpu")
-        lines = out.split("\n")
-        lines = [line for line in lines if line.startswith("NUMA node") and "CPU(s)" in line]
-        numa_num = []
-        for line in lines:
-            line = line.strip().split()[3]
-            numa_num.append(line.split(","))
-        numa_nums.append(numa_num)
+    numa_nums = [entry["numa"] for entry in get_inventory(nodes)]
         
     for i, n in enumerate(numa_nums):
         print(f"node{i}:", end=" ")
@@ -85,38 +179,13 @@ def get_cpu_info(nodes: list, sort_cpus=False):
     print("getting socket numbers...", flush=True)
     socket_nums = []
     node_tables = []
-    for _, node in tenumerate(nodes):
-        out = run_ssh_cmd(node, "sudo likwid-topology -O")
-        lines = out.split("\n")
-        
-        table_start = False
-        header = False
-        headers = ""
-        node_dicts = []
-        for line in lines:
-            line = line.strip()
-            
-            if table_start and line.startswith("STRUCT"):
-                break
-            if line.startswith("TABLE"):
-                table_start = True
-                header = True
-                continue
-            elif header:
-                headers = line.strip(",").split(",")
-                header = False
-            elif table_start:
-                data = line.strip(",").split(",")
-                data_dict = {headers[i]: data[i] for i in range(len(headers))}
-                node_dicts.append(data_dict)
-        node_tables.append(node_dicts)
-            
-        socket_lines = [line.strip() for line in lines if line.startswith("Socket ")]
-        socket_cpus = [sl.split(":,")[1].strip().split(",") for sl in socket_lines]
+    for entry in get_inventory(nodes):
+        socket_cpus = entry["socket_cpus"]
         # sort in order to schedule on separate cores before on SMT threads
         if sort_cpus:
             socket_cpus = [sorted(sc, key=int) for sc in socket_cpus]
         socket_nums.append(socket_cpus)
+        node_tables.append(entry["topology"])
         
     for i, s in enumerate(socket_nums):
         print(f"node{i}:", end=" ")
@@ -127,52 +196,27 @@ def get_cpu_info(nodes: list, sort_cpus=False):
         print()
     return socket_nums, node_tables
 
-def table_to_list(table):
-    socket_nums = [int(t["Socket"]) for t in table]
-    core_nums = [int(t["Core"]) for t in table]
-    num_socket = max(socket_nums) + 1   # number of sockets on this server
-    num_core = max(core_nums) + 1       # number of cores on this server
-    
-    cpu_list = []   # HWThread num = [socket][core][thread]
-    next_cpu = []   # next cpu (logical core) to use on core = [socket][core]
-    for i in range(num_socket):
-        cpu_list.append([])
-        core_list = []
-        for _ in range(num_core):
-            cpu_list[i].append([])
-            core_list.append(0)
-        next_cpu.append(core_list)
-            
-    
-    for t in table:
-        cpu_list[int(t["Socket"])][int(t["Core"])].append(int(t["HWThread"]))
-        
-    return cpu_list, next_cpu, num_core, num_socket
-
 def get_from_table(table, cpu_num, key="Core"):
     # get the dict with HWThread == cpu_num
     cpu_dict = [t for t in table if int(t["HWThread"]) == cpu_num][0]
     return int(cpu_dict[key])
 
-def pin_cpus(nodes, csv_file, sort_cpus=False):
+def pin_cpus(nodes, csv_file, sort_cpus=False, smt=None, state=None):
     csv_file = find_file(csv_file, env_csv=True)
+    # the old sorted option is the same as spreading over the cpus in increasing order
+    if smt is None:
+        smt = "spread" if sort_cpus else "pack"
     # get the socket numbers for each node: list of logical cores = [node][socket]
-    socket_nums, node_tables = get_cpu_info(nodes, sort_cpus=sort_cpus)
-    cpu_lists, next_cpus, num_cores, num_sockets = [], [], [], []
-    for nt in node_tables:
-        cl, nc, cn, sn = table_to_list(nt)
-        cpu_lists.append(cl)
-        next_cpus.append(nc)
-        num_cores.append(cn)
-        num_sockets.append(sn)
-    
-    # mark if a (physical) core already has a pinned logical core - list for each node
-    core_assigned = [[[False for _ in range(num_cores[i])] for _ in range(num_sockets[i])] for i in range(len(nodes))]
-    # this is a list for each socket on the next core to assign - only used if all cores have already been assigned
-    next_cpu = [[0 for _ in range(len(socket_nums[i]))] for i in range(len(socket_nums))]
+    socket_nums, node_tables = get_cpu_info(nodes)
+    numa_nums = get_numa_nums(nodes)
 
-    # get the node assignments for the services
-    service_nodes = get_service_nodes(nodes[0])
+    # get the node of every replica of the services (from the given cluster snapshot, if any)
+    service_nodes = get_service_tasks(nodes[0], state=state)
+    
+    # plan all the pins up front (cpus and NUMA memory nodes for each replica)
+    plan = plan_pins(read_rows(csv_file), service_nodes, socket_nums, node_tables, numa_nums, 
+                     smt=smt, prefix=f"{get_current_service_name()}_")
+    print_plan(plan)
     
     # get a dict of the containers on each node
     print("getting container info...", flush=True)
@@ -182,92 +226,22 @@ def pin_cpus(nodes, csv_file, sort_cpus=False):
         print(f"node{i}: {cinfo}")
     
     print("pinning services to sockets...", flush=True)
-    with open(csv_file, 'r') as csv_file:
-        csv_reader = csv.DictReader(csv_file, delimiter=',')
-        # get the header names
-        headers = csv_reader.fieldnames
-        ncpus = "NCPUs" in headers
-        
-        for row in csv_reader:
-            service_name = row["ServiceName"]
-            socket = int(row["Socket"])
-            if socket == -1: # no socket pin for this service
-                print(f"skipping pinning for {service_name}...")
-                continue
-            
-            if ncpus:
-                cpus = int(row["NCPUs"])
-            
-            # get the node that the service is running on
-            node_num = service_nodes[f"{get_current_service_name()}_{service_name}"]
-            if socket >= len(socket_nums[node_num]):
-                print(f"socket {socket} not available on node {node_num}")
-                assert(False)
-                
-            # loop through all containers running on the node
-            for cinfo in containers_info[node_num]:
-                # if the node contains the service that you're looking for
-                id, name = cinfo[:2]
-                if name.startswith(f"{get_current_service_name()}_{service_name}"):
-                    # get the cpu numbers for this socket
-                    cpus_to_pin = socket_nums[node_num][socket]
-                    # only do this if the user has specified a number of cpus to pin
-                    if ncpus and cpus != 0:
-                        cpin = []
-                        if not sort_cpus:
-                            # loop through each core on this socket
-                            for i in range(len(core_assigned[node_num][socket])):
-                                # if no microservices on this core already
-                                if not core_assigned[node_num][socket][i]:
-                                    # loop through the logical cores on this core
-                                    for j in range(len(cpu_lists[node_num][socket][i])):
-                                        # add this logical core to the list
-                                        cpin.append(cpu_lists[node_num][socket][i][j])
-                                        # set this core as being assigned
-                                        core_assigned[node_num][socket][i] = True
-                                        # move the next cpu to assign to the next logical core on this core
-                                        next_cpus[node_num][socket][i] += 1
-                                        # if we've reached the number of cpus to pin, break
-                                        if len(cpin) == cpus:
-                                            break
-                                    # if we've reached the number of cpus to pin, break
-                                    if len(cpin) == cpus:
-                                        break
-                            
-                            # if still not enough cpus, then start colocating on other cores, on empty cores first
-                            if len(cpin) < cpus:
-                                print(f"not enough cpus on socket {socket} for {service_name} on node {node_num} without physical core colocation...")
-                                # loop through each core on this socket
-                                for i in range(len(next_cpus[node_num][socket])):
-                                    # if all logical cores have already been pinned, skip
-                                    if next_cpus[node_num][socket][i] >= len(cpu_lists[node_num][socket][i]):
-                                        continue
-                                    # add the next (empty) logical core to the list
-                                    cpin.append(cpu_lists[node_num][socket][i][next_cpus[node_num][socket][i]])
-                                    # increment the next cpu to assign to the next logical core on this core
-                                    next_cpus[node_num][socket][i] += 1
-                                    # stop assigning to this core
-                                    if len(cpin) == cpus:
-                                        break
-                                
-                                # at this point every core on this socket has been pinned, so just start filling from 
-                                # low to high
-                                if len(cpin) < cpus:
-                                    print(f"not enough cpus on socket {socket} for {service_name} on node {node_num} without logical core (SMT) colocation...")
-                                while len(cpin) < cpus:
-                                    cpin.append(cpus_to_pin[next_cpu[node_num][socket]])
-                                    next_cpu[node_num][socket] += 1
-                                    next_cpu[node_num][socket] %= len(cpus_to_pin)
-                        else:
-                            for _ in range(cpus):
-                                cpin.append(cpus_to_pin[next_cpu[node_num][socket]])
-                                next_cpu[node_num][socket] += 1
-                                next_cpu[node_num][socket] %= len(cpus_to_pin)
-                        cpus_to_pin = cpin
-                    cpus_to_pin = [str(c) for c in cpus_to_pin]
-                    cpus_to_pin = ",".join(cpus_to_pin)
-                    print(f"pinning to cpus [{cpus_to_pin}], socket {socket}, node {node_num}, for {service_name}...", flush=True)
-                    run_ssh_cmd(nodes[node_num], f"sudo docker update --cpuset-cpus={cpus_to_pin} {id}", stderr=True, check=True)
+    # docker update commands to run, per node - these are all sent in one batch at the end
+    pin_cmds = {node: [] for node in nodes}
+    for p in plan:
+        cpus_to_pin = ",".join([str(c) for c in p["cpus"]])
+        mems = ",".join([str(m) for m in p["mems"]])
+        # loop through all containers running on the node
+        for cinfo in containers_info[p["node"]]:
+            # if the node contains the replica that you're looking for (containers are named <service>.<slot>.<task id>)
+            id, name = cinfo[:2]
+            if name.startswith(f"{get_current_service_name()}_{p['service']}.{p['replica']}."):
+                print(f"pinning to cpus [{cpus_to_pin}], mems [{mems}], socket {p['socket']}, node {p['node']}, for {p['service']}.{p['replica']}...", flush=True)
+                pin_cmds[nodes[p["node"]]].append(f"sudo docker update --cpuset-cpus={cpus_to_pin} --cpuset-mems={mems} {id}")
+    
+    # run all the pinning commands (one round trip per node, nodes in parallel)
+    results = run_batched(pin_cmds, check=True)
+    assert(all([r.rc == 0 for node in nodes for r in results[node]]))
     print("done pinning services to sockets...", flush=True)
     
 def rm_containers(nodes):
@@ -297,12 +271,17 @@ def prune_nodes(nodes):
 def clean_nodes(nodes):
     return rm_stack(nodes[0], quiet=True) or rm_containers(nodes)
     
-def cleanup(nodes):
+def cleanup(nodes, timeout=TEARDOWN_TIMEOUT):
     assert(isinstance(nodes, list))
-    # this is for https://github.com/moby/moby/issues/32620
     print(f"cleaning up swarm nodes...", flush=True)
-    while (clean_nodes(nodes)):
-        time.sleep(5)
+    stack_name = get_stack(nodes[0])
+    if stack_name is not None:
+        rm_stack(nodes[0], stack_name=stack_name)
+        wait_for_stack_removed(nodes[0], stack_name, timeout=timeout)
+    # remove any containers left behind - this is for https://github.com/moby/moby/issues/32620
+    start = time.time()
+    while rm_containers(nodes) and time.time() - start < timeout:
+        time.sleep(POLL_INTERVAL)
     prune_nodes(nodes)
     print(f"done cleaning up master node...", flush=True)
     
@@ -315,15 +294,119 @@ def check_no_containers(nodes):
             print(f"containers still running on node {nodes[i]}", flush=True)
             assert(False)
 
-def set_compose_env(nodes, compose_file, csv_file, fraction=False):
-    # make the custom env file with the changes
+def print_ready_times(ready):
+    # print the time-to-ready of each service, slowest first
+    for name, t in sorted(ready.items(), key=lambda x: float('inf') if x[1] is None else x[1], reverse=True):
+        t = "not ready" if t is None else f"{t:.1f}s"
+        print(f"{name.replace(f'{get_current_service_name()}_', '')}: {t}", flush=True)
+
+def set_compose_env(nodes, compose_file, csv_file, fraction=False, env_file=".env"):
+    # make the custom env file with the changes (env_file is the local copy, e.g. one per swarm)
     print("making custom env file...", flush=True)
-    make_compose(csv_file, ".env", ",", nodes=nodes if fraction else [])
+    specs = make_compose(csv_file, env_file, ",", nodes=nodes if fraction else [])
 
     # copy the new env file (and compose file) to the node
     print(f"copying {compose_file} and new .env to master node...", flush=True)
     run_scp_cmd(nodes[0], compose_file, f"{DSB_PATH}docker-compose-swarm.yml", check=True)
-    run_scp_cmd(nodes[0], ".env", f"{DSB_PATH}.env", check=True)
+    run_scp_cmd(nodes[0], env_file, f"{DSB_PATH}.env", check=True)
+    return specs
+
+def parse_mem_bytes(mem):
+    # convert a docker memory string (e.g. "64g", "512m", "0") to bytes
+    mem = str(mem).strip().lower().rstrip("b")
+    units = {"k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+    if mem and mem[-1] in units:
+        return int(float(mem[:-1]) * units[mem[-1]])
+    return int(float(mem)) if mem else 0
+
+def get_live_specs(node, stack_name=None):
+    # current placement/cpus/memory of each service in the stack, from one docker service inspect
+    if stack_name is None:
+        stack_name = get_current_service_name()
+    label = f"label=com.docker.stack.namespace={stack_name}"
+    out = run_ssh_cmd(node, f"sudo docker service ls -q --filter '{label}' | xargs -r sudo docker service inspect", stderr=False)
+    if not out:
+        return {}
+    specs = {}
+    for service in json.loads(out):
+        spec = service["Spec"]
+        limits = spec["TaskTemplate"].get("Resources", {}).get("Limits", {})
+        name = spec["Name"].replace(f"{stack_name}_", "", 1)
+        specs[name] = {"placement": spec["TaskTemplate"].get("Placement", {}).get("Constraints", []),
+                       "cpu": limits.get("NanoCPUs", 0) / 1e9,
+                       "memory": limits.get("MemoryBytes", 0)}
+    return specs
+
+def diff_specs(requested, live):
+    # returns (services that need an update, whether a full redeploy is needed)
+    changed = {}
+    for name, spec in requested.items():
+        # a service that isn't running at all can only be added by redeploying the stack
+        if name not in live:
+            print(f"service {name} not in the running stack, need a full redeploy...", flush=True)
+            return {}, True
+        curr = live[name]
+        cpu = float(spec["cpu"]) if spec["cpu"] != "" else 0
+        memory = parse_mem_bytes(spec["memory"])
+        # (constraints are compared as sets - swarm keeps them in no particular order)
+        if set(curr["placement"]) != set([spec["placement"]]) or abs(curr["cpu"] - cpu) > 1e-6 or curr["memory"] != memory:
+            changed[name] = {"placement": spec["placement"], "cpu": cpu, "memory": memory, "old_placement": curr["placement"]}
+    return changed, False
+
+def get_update_cmd(service_name, change, stack_name):
+    # only touch the constraints if the placement changed - docker appends an added constraint even if
+    # the service already has it, and the duplicate would show up as a change on every later diff
+    constraints = ""
+    if set(change["old_placement"]) != set([change["placement"]]):
+        rm = [f"--constraint-rm '{c}'" for c in sorted(set(change["old_placement"])) if c != change["placement"]]
+        add = [f"--constraint-add '{change['placement']}'"] if change["placement"] not in change["old_placement"] else []
+        constraints = " ".join(rm + add) + " "
+    return (f"sudo docker service update --detach --quiet {constraints}--limit-cpu {change['cpu']} "
+            f"--limit-memory {change['memory']} {stack_name}_{service_name}")
+
+def wait_for_updates(node, service_names, timeout=DEPLOY_TIMEOUT, interval=POLL_INTERVAL):
+    # wait until docker reports every service update as done
+    print(f"waiting for {len(service_names)} service update(s) to finish...", flush=True)
+    format = "{{.Spec.Name}} {{if .UpdateStatus}}{{.UpdateStatus.State}}{{else}}completed{{end}}"
+    cmd = f"sudo docker service inspect --format '{format}' {' '.join(service_names)}"
+    start = time.time()
+    while True:
+        states = dict([line.split() for line in run_ssh_cmd(node, cmd, stderr=False).split("\n") if len(line.split()) == 2])
+        failed = [name for name, state in states.items() if state.startswith("rollback") or state == "paused"]
+        if failed:
+            print(f"service update(s) failed for: {failed}", flush=True)
+            return False
+        if len(states) == len(service_names) and all([state == "completed" for state in states.values()]):
+            return True
+        if time.time() - start > timeout:
+            print(f"timed out after {timeout} seconds waiting for service updates", flush=True)
+            return False
+        time.sleep(interval)
+
+def update_stack(nodes, specs, dsb_path, deploy_timeout=DEPLOY_TIMEOUT):
+    # apply only the placement/resource changes in specs to the running stack (with docker service update),
+    # falling back to a full redeploy when the running stack can't be updated in place
+    master_node = nodes[0]
+    stack_name = get_current_service_name()
+    live = get_live_specs(master_node, stack_name)
+    changed, full = diff_specs(specs, live) if live else ({}, True)
+    if not full:
+        if not changed:
+            print("no service changes to apply...", flush=True)
+            return "none", wait_for_stack(master_node, stack_name, timeout=deploy_timeout)
+        print(f"updating {len(changed)} service(s) in place: {list(changed.keys())}", flush=True)
+        # send all the updates in one batch - they are detached, so they run in parallel on the swarm
+        results = run_batched({master_node: [get_update_cmd(name, change, stack_name) for name, change in changed.items()]}, check=True)
+        full = any([r.rc != 0 for r in results[master_node]])
+        if not full:
+            full = not wait_for_updates(master_node, [f"{stack_name}_{name}" for name in changed], timeout=deploy_timeout)
+        if not full:
+            return "incremental", wait_for_stack(master_node, stack_name, timeout=deploy_timeout)
+    print("falling back to a full redeploy...", flush=True)
+    cleanup(nodes)
+    check_no_containers(nodes)
+    _, ready = restart_stack(nodes, dsb_path=dsb_path, cleanup_nodes=False, no_print=True, deploy_timeout=deploy_timeout)
+    return "full", ready
 
 def main():
     # parse arguments
@@ -331,22 +414,30 @@ def main():
     nodes, ssh_commands = parse_ssh_file(args.ssh_comms)
     
     # set the compose file and env file
-    set_compose_env(nodes, args.compose_file, args.csv_file, fraction=args.fraction)
+    specs = set_compose_env(nodes, args.compose_file, args.csv_file, fraction=args.fraction)
+    
+    if args.incremental:
+        mode, ready = update_stack(nodes, specs, dsb_path=DSB_PATH, deploy_timeout=args.deploy_timeout)
+        print(f"stack updated ({mode})...", flush=True)
+        print_ready_times(ready)
+        state = get_cluster_state(nodes[0])
+        print_table(nodes[0], state=state)
+        if args.pin:
+            pin_cpus(nodes, args.csv_file, sort_cpus=args.sorted, smt=args.smt, state=state)
+        return
     
     print("cleaning dangling containers...", flush=True)
     # cleanup previous stack/dangling containers
     cleanup(nodes)
-    # just to be sure, sleep and check again
-    time.sleep(5)
     # checking for no containers before starting stack
     check_no_containers(nodes)
     
     # restart the stack
-    restart_stack(nodes, compose="docker-compose-swarm.yml", dsb_path=DSB_PATH, env=".env", cleanup_nodes=True)
-    
-    # if flag set, pin the services to sockets/cpus
-    if args.pin:
-        pin_cpus(nodes, args.csv_file, sort_cpus=args.sorted)
+    # (and if flag set, pin the services to sockets/cpus)
+    _, ready = restart_stack(nodes, compose="docker-compose-swarm.yml", dsb_path=DSB_PATH, env=".env", cleanup_nodes=True,
+                             deploy_timeout=args.deploy_timeout, pin=args.csv_file if args.pin else None,
+                             sort_cpus=args.sorted, smt=args.smt)
+    print_ready_times(ready)
     
 if __name__ == "__main__":
     main()
\ No newline at end of file